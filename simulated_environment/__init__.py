@@ -0,0 +1,4 @@
+"""Simulation Environment For Training A Neural Network Driven FRC Robot"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
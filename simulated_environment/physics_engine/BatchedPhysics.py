@@ -0,0 +1,266 @@
+"""
+Pure NumPy Physics Engine That Simulates Thousands Of Independent Box Robots Against A Static Field At Once
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+import pymunk
+
+from .collision_handling.CollisionTypes import CollisionType
+
+# Damping used by DynamicObject.stop_object, kept identical so resets match the pymunk path
+STOP_DAMPING = 0.0000001
+
+
+class BatchedPhysicsEnvironment:
+    """
+    Simulates one box robot per environment, every environment sharing a copy of the static field of a regular
+    PhysicsEnvironment.
+
+    Approximations compared to the pymunk path:
+        - Static segments are treated as their bounding rectangles, which is exact for the axis aligned field walls
+        - Contacts push the robot out along the axis of least penetration and remove the velocity into the contact,
+          the field shapes have no friction so the tangential velocity is kept, contacts do not create torque
+        - Raycasts ignore their radius and report the distance to the surface along the ray
+    """
+
+    def __init__(self, static_environment, environment_count, width, height, mass, damping, initialX, initialY,
+                 step_length: float):
+        """
+        Create the robot state arrays and copy the static field
+
+        :param static_environment: PhysicsEnvironment whose static shapes make up the field
+        :param environment_count: How many independent environments (one robot each) to simulate
+        :param width: Width of each robot (PX)
+        :param height: Height of each robot (PX)
+        :param mass: The mass of each robot
+        :param damping: How quickly the velocity should fall off (Lower numbers = more damping)
+        :param initialX: Starting X coordinate of every robot
+        :param initialY: Starting Y coordinate of every robot
+        :param step_length: The amount of time in seconds to move the simulation forward each step
+        """
+
+        self.static_environment = static_environment
+        self.environment_count = environment_count
+        self.step_length = step_length
+
+        # Robot properties, damping is kept per environment so it can be varied between environments
+        self.half_extents = np.array([width / 2, height / 2], dtype=np.float64)
+        self.mass = mass
+        self.moment = pymunk.moment_for_box(mass=mass, size=(width, height))
+        self.damping = np.full(environment_count, damping, dtype=np.float64)
+
+        self.initial_position = np.array([initialX, initialY], dtype=np.float64)
+
+        # Robot state, one row per environment
+        self.positions = np.tile(self.initial_position, (environment_count, 1))
+        self.angles = np.zeros(environment_count, dtype=np.float64)
+        self.velocities = np.zeros((environment_count, 2), dtype=np.float64)
+        self.angular_velocities = np.zeros(environment_count, dtype=np.float64)
+
+        # Which kind of object each robot touched during the last step
+        self.static_contacts = np.zeros(environment_count, dtype=bool)
+        self.goal_contacts = np.zeros(environment_count, dtype=bool)
+
+        # Static field as axis aligned boxes: Center X, Center Y, Half Width, Half Height
+        self.static_boxes = None
+        self.static_bounds = None
+        self.static_collision_types = None
+        self.refresh_static_geometry()
+
+    def refresh_static_geometry(self):
+        """
+        Re-read the static shapes of the source environment, must be called whenever static geometry is moved
+
+        :return: None
+        """
+
+        boxes = []
+        collision_types = []
+
+        for shape in self.static_environment.physics_space.shapes:
+            if shape.body.body_type != pymunk.Body.STATIC:
+                continue
+
+            bounds = shape.bb
+            boxes.append(((bounds.left + bounds.right) / 2, (bounds.bottom + bounds.top) / 2,
+                          (bounds.right - bounds.left) / 2, (bounds.top - bounds.bottom) / 2))
+            collision_types.append(shape.collision_type)
+
+        self.static_boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        self.static_collision_types = np.array(collision_types, dtype=np.int64)
+
+        # Left, Bottom, Right, Top of every box for the raycasts
+        self.static_bounds = np.concatenate((self.static_boxes[:, 0:2] - self.static_boxes[:, 2:4],
+                                             self.static_boxes[:, 0:2] + self.static_boxes[:, 2:4]), axis=1)
+
+    def simulateStep(self):
+        """
+        Move every environment forward by step_length and resolve contacts with the static field
+
+        :return: None
+        """
+
+        # Integrate the pose from the current velocity
+        self.positions += self.velocities * self.step_length
+        self.angles += self.angular_velocities * self.step_length
+
+        self.static_contacts[:] = False
+        self.goal_contacts[:] = False
+
+        cos_angle = np.cos(self.angles)
+        sin_angle = np.sin(self.angles)
+        abs_cos = np.abs(cos_angle)
+        abs_sin = np.abs(sin_angle)
+
+        half_width, half_height = self.half_extents
+
+        # Local X and Y axes of every robot in world space
+        robot_x_axis = np.stack((cos_angle, sin_angle), axis=1)
+        robot_y_axis = np.stack((-sin_angle, cos_angle), axis=1)
+
+        # Separating axis test of every robot against one static box at a time, the field only has a handful of boxes
+        for (center_x, center_y, box_half_width, box_half_height), collision_type in zip(self.static_boxes,
+                                                                                         self.static_collision_types):
+            offset = np.array([center_x, center_y]) - self.positions
+
+            offset_x_axis = (offset * robot_x_axis).sum(axis=1)
+            offset_y_axis = (offset * robot_y_axis).sum(axis=1)
+
+            # Overlap along the world X, world Y, robot X and robot Y axes
+            overlaps = np.stack((
+                (half_width * abs_cos) + (half_height * abs_sin) + box_half_width - np.abs(offset[:, 0]),
+                (half_width * abs_sin) + (half_height * abs_cos) + box_half_height - np.abs(offset[:, 1]),
+                half_width + (box_half_width * abs_cos) + (box_half_height * abs_sin) - np.abs(offset_x_axis),
+                half_height + (box_half_width * abs_sin) + (box_half_height * abs_cos) - np.abs(offset_y_axis)),
+                axis=1)
+
+            colliding = np.all(overlaps > 0, axis=1)
+
+            if not np.any(colliding):
+                continue
+
+            if collision_type == CollisionType.GOAL_OBJECT.value:
+                self.goal_contacts |= colliding
+            else:
+                self.static_contacts |= colliding
+
+            # Push the robot out along the axis of least penetration, away from the box
+            rows = np.nonzero(colliding)[0]
+            separating_axis = np.argmin(overlaps[rows], axis=1)
+            depth = overlaps[rows, separating_axis]
+
+            axes = np.empty((len(rows), 2), dtype=np.float64)
+            axes[separating_axis == 0] = (1.0, 0.0)
+            axes[separating_axis == 1] = (0.0, 1.0)
+            axes[separating_axis == 2] = robot_x_axis[rows][separating_axis == 2]
+            axes[separating_axis == 3] = robot_y_axis[rows][separating_axis == 3]
+
+            normals = axes * -np.sign((offset[rows] * axes).sum(axis=1))[:, None]
+
+            self.positions[rows] += normals * depth[:, None]
+
+            # Remove any velocity still heading into the box
+            approach_speed = np.minimum((self.velocities[rows] * normals).sum(axis=1), 0)
+            self.velocities[rows] -= normals * approach_speed[:, None]
+
+    def apply_forward_impulses(self, left_impulses, right_impulses, wheel_offset=6.0):
+        """
+        Apply the two drive impulses of AgentController.control to every robot
+
+        :param left_impulses: Impulse applied to the left side of each robot
+        :param right_impulses: Impulse applied to the right side of each robot
+        :param wheel_offset: Distance (PX) from the center of each robot to the point the impulses are applied at
+
+        :return: None
+        """
+
+        # Both impulses push along the local forward (Y) axis, so the sum accelerates the body and the difference turns it
+        forward_change = (left_impulses + right_impulses) / self.mass
+
+        self.velocities[:, 0] -= forward_change * np.sin(self.angles)
+        self.velocities[:, 1] += forward_change * np.cos(self.angles)
+        self.angular_velocities += (wheel_offset * (left_impulses - right_impulses)) / self.moment
+
+    def apply_damping(self, dt):
+        """
+        Applies each environment's damping to its robot, equivalent to DynamicObject.apply_damping
+
+        :param dt: Unused, kept so the call matches DynamicObject.apply_damping
+
+        :return: None
+        """
+
+        self.velocities *= self.damping[:, None]
+        self.angular_velocities *= self.damping
+
+    def stop_objects(self, indices):
+        """
+        Stop the robots of the given environments the same way DynamicObject.stop_object does
+
+        :param indices: Indices or boolean mask of the environments to stop
+
+        :return: None
+        """
+
+        self.velocities[indices] *= STOP_DAMPING
+        self.angular_velocities[indices] *= STOP_DAMPING
+
+    def set_poses(self, indices, x, y, angle):
+        """
+        Move the robots of the given environments
+
+        :param indices: Indices or boolean mask of the environments to move
+        :param x: New X coordinate(s)
+        :param y: New Y coordinate(s)
+        :param angle: New angle(s) in radians
+
+        :return: None
+        """
+
+        self.positions[indices, 0] = x
+        self.positions[indices, 1] = y
+        self.angles[indices] = angle
+
+    def raycast(self, ray_angles, ray_length, indices=None):
+        """
+        Cast rays from the center of every robot against the static field
+
+        :param ray_angles: World angles of the rays in degrees, shaped like [N, R]
+        :param ray_length: Maximum length of every ray
+        :param indices: Indices or boolean mask of the environments the rays belong to, defaults to every environment
+
+        :return: Distance to the first hit shaped like [N, R], NaN where a ray hit nothing
+        """
+
+        positions = self.positions if indices is None else self.positions[indices]
+
+        radians = np.radians(ray_angles)
+
+        origins_x = positions[:, 0, None, None]
+        origins_y = positions[:, 1, None, None]
+
+        # Slab test of every ray against every box, shaped like [N, R, boxes]. Axis parallel rays divide by zero and
+        # produce infinities (or NaN when starting exactly on an edge) which fmin and fmax handle
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse_x = 1.0 / np.cos(radians)[..., None]
+            inverse_y = 1.0 / np.sin(radians)[..., None]
+
+            x_entry = (self.static_bounds[:, 0] - origins_x) * inverse_x
+            x_exit = (self.static_bounds[:, 2] - origins_x) * inverse_x
+            y_entry = (self.static_bounds[:, 1] - origins_y) * inverse_y
+            y_exit = (self.static_bounds[:, 3] - origins_y) * inverse_y
+
+            near = np.fmax(np.fmin(x_entry, x_exit), np.fmin(y_entry, y_exit))
+            far = np.fmin(np.fmax(x_entry, x_exit), np.fmax(y_entry, y_exit))
+
+        # Rays starting inside a box hit it straight away
+        np.maximum(near, 0, out=near)
+        near[(far < near) | (near > ray_length)] = np.inf
+
+        distances = near.min(axis=2)
+        distances[np.isinf(distances)] = np.nan
+
+        return distances
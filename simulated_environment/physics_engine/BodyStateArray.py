@@ -0,0 +1,181 @@
+"""
+Struct-Of-Arrays Access To The State Of Every Dynamic Body Across Many Physics Environments
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import itertools
+
+import numpy as np
+import pymunk
+
+# Columns of a single body state row
+STATE_X = 0
+STATE_Y = 1
+STATE_ANGLE = 2
+STATE_X_VELOCITY = 3
+STATE_Y_VELOCITY = 4
+STATE_ANGULAR_VELOCITY = 5
+
+STATE_SIZE = 6
+
+
+class BodyStateArray:
+    """Reads and writes the state of every dynamic body in a group of physics environments using NumPy arrays"""
+
+    def __init__(self, physics_environments):
+        """
+        Collect every dynamic body of the given environments into one flat, ordered list
+
+        :param physics_environments: List of PhysicsEnvironments, bodies are ordered by environment and then by creation
+        """
+
+        self.bodies = [body for physics_environment in physics_environments
+                       for body in physics_environment.dynamic_bodies]
+
+        # How many bodies each environment contributed, useful to split the flat arrays back up per environment
+        self.bodies_per_environment = [len(physics_environment.dynamic_bodies)
+                                       for physics_environment in physics_environments]
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def allocate(self):
+        """
+        Allocate an array big enough to hold the state of every body
+
+        :return: Zeroed array shaped like [N, 6]
+        """
+
+        return np.zeros((len(self.bodies), STATE_SIZE), dtype=np.float64)
+
+    def read(self, out=None):
+        """
+        Fill an array with the state of every body
+
+        Columns: X, Y, Angle (radians), X Velocity, Y Velocity, Angular Velocity (radians per second)
+
+        :param out: Preallocated array shaped like [N, 6] to fill, one is allocated if not given
+
+        :return: The filled array
+        """
+
+        if out is None:
+            out = self.allocate()
+
+        # Pull every value out in one pass and copy it into the preallocated array in a single NumPy call
+        values = itertools.chain.from_iterable((body.position.x, body.position.y, body.angle,
+                                                body.velocity.x, body.velocity.y, body.angular_velocity)
+                                               for body in self.bodies)
+
+        out.reshape(-1)[:] = np.fromiter(values, dtype=np.float64, count=len(self.bodies) * STATE_SIZE)
+
+        return out
+
+    def write(self, states, indices=None):
+        """
+        Overwrite the full state (pose and velocity) of some or all of the bodies
+
+        :param states: Array shaped like [len(indices), 6] in the same layout produced by read
+        :param indices: Indices of the bodies to write, defaults to every body
+
+        :return: None
+        """
+
+        if indices is None:
+            indices = range(len(self.bodies))
+
+        for index, (x, y, angle, x_velocity, y_velocity, angular_velocity) in zip(indices, np.asarray(states).tolist()):
+            body = self.bodies[index]
+
+            body.position = pymunk.Vec2d(x, y)
+            body.angle = angle
+            body.velocity = pymunk.Vec2d(x_velocity, y_velocity)
+            body.angular_velocity = angular_velocity
+
+            # The written state replaces whatever the body went through, including the position correction from its
+            # last collision (see DynamicObject.stop_object)
+            pymunk.Body.update_position(body=body, dt=0)
+
+            self.reindex(body)
+
+    def write_velocities(self, states, indices=None):
+        """
+        Overwrite only the velocities of some or all of the bodies, leaving the pose and the position correction from
+        the last collision alone so the next step moves them exactly as if the velocity had been changed by pymunk
+
+        :param states: Array shaped like [len(indices), 6] in the same layout produced by read, the pose columns are
+            ignored
+        :param indices: Indices of the bodies to write, defaults to every body
+
+        :return: None
+        """
+
+        if indices is None:
+            indices = range(len(self.bodies))
+
+        for index, (x_velocity, y_velocity, angular_velocity) in zip(
+                indices, np.asarray(states)[:, STATE_X_VELOCITY:STATE_ANGULAR_VELOCITY + 1].tolist()):
+            body = self.bodies[index]
+
+            body.velocity = pymunk.Vec2d(x_velocity, y_velocity)
+            body.angular_velocity = angular_velocity
+
+    def reset_poses(self, poses, indices=None):
+        """
+        Move some or all of the bodies to a new pose and stop them
+
+        :param poses: Array shaped like [len(indices), 3] holding X, Y and Angle (radians)
+        :param indices: Indices of the bodies to reset, defaults to every body
+
+        :return: None
+        """
+
+        if indices is None:
+            indices = range(len(self.bodies))
+
+        for index, (x, y, angle) in zip(indices, np.asarray(poses).tolist()):
+            body = self.bodies[index]
+
+            body.position = pymunk.Vec2d(x, y)
+            body.angle = angle
+            body.velocity = pymunk.Vec2d(0, 0)
+            body.angular_velocity = 0
+
+            # Drop the position correction left over from the last collision (see DynamicObject.stop_object)
+            pymunk.Body.update_position(body=body, dt=0)
+
+            self.reindex(body)
+
+    def apply_impulses(self, impulses, points, is_world=False):
+        """
+        Apply one impulse to every body
+
+        :param impulses: Array shaped like [N, 2] of impulse vectors
+        :param points: Array shaped like [N, 2] of the points the impulses are applied at
+        :param is_world: Whether or not the impulses and points are world oriented instead of local to each body
+
+        :return: None
+        """
+
+        for body, (impulse_x, impulse_y), (point_x, point_y) in zip(self.bodies,
+                                                                    np.asarray(impulses).tolist(),
+                                                                    np.asarray(points).tolist()):
+            if is_world:
+                body.apply_impulse_at_world_point((impulse_x, impulse_y), (point_x, point_y))
+            else:
+                body.apply_impulse_at_local_point((impulse_x, impulse_y), (point_x, point_y))
+
+    @staticmethod
+    def reindex(body):
+        """
+        Update the spatial index after teleporting a body so queries see its new position straight away
+
+        :param body: The body that was moved
+
+        :return: None
+        """
+
+        if body.space is not None:
+            body.space.reindex_shapes_for_body(body)
@@ -5,18 +5,27 @@ High Level Physics Interface Meant To Be Used By The Environment Itself
 __author__ = "Will Richards"
 __copyright__ = "Copyright 2020, AEMBOT"
 
-from LowLevelPhysics import *
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List
+
+from .LowLevelPhysics import *
+
+if TYPE_CHECKING:
+    from ..virtual_environment.AgentController import AgentController
 
 # Gravity to be used in the simulated environment, its None because damping is used to regulate object speed
 GRAVITY = (0, 0)
 
 STEP_LENGTH: float = 0.0
 
+# Shape filter category shared by every dynamic (robot) object so raycasts can choose to ignore them
+DYNAMIC_OBJECT_CATEGORY = 0b1
+
 
 class PhysicsEnvironment:
     """Class to manager the overall physics environment"""
 
-    def __init__(self, window_width, window_height, simulation_accuracy, step_length: float):
+    def __init__(self, window_width, window_height, simulation_accuracy, step_length: float, lean=False):
         """
         Create general variables that will be used throughout the class
 
@@ -25,16 +34,29 @@ class PhysicsEnvironment:
 
         :param simulation_accuracy: How accurately it will attempt to get the simulation (higher numbers = higher accuracy)
         :param step_length: The amount of time in seconds to move the simulation forward, (Smaller numbers = higher simulation accuracy as updates are more frequent)
+        :param lean: Whether the static field is attached to the single static body of the space, which uses far less
+            memory than a body per field element when thousands of environments live in one process
         """
 
+        self.lean = lean
+
         # Create a new physics space with a simulation accuracy of 40
         self.physics_space = self.createPhysicsSpace(simulation_accuracy=simulation_accuracy)
 
         # Maintains a list of all lines within the scene
-        self.lines = LineHandler(physics_space=self.physics_space)
+        self.lines = LineHandler(physics_space=self.physics_space, share_static_body=lean)
 
         # Create a list of static sprites to render as static physics objects
-        self.sprite_list: arcade.SpriteList[PhysicsSprite] = arcade.SpriteList()
+        self.sprite_list: List[PhysicsSprite] = []
+
+        # Arcade copy of the sprite list, only created the first time the static objects are drawn
+        self.arcade_sprite_list = None
+
+        # Every dynamic body in the space, in creation order, so their states can be read in bulk
+        self.dynamic_bodies = []
+
+        # Optional backend that can advance the simulation without the full rigid body solver (see KinematicDrive.py)
+        self.drive_backend = None
 
         # Values for the width and Height of the window
         self.window_width = window_width
@@ -68,12 +90,28 @@ class PhysicsEnvironment:
         :return: None
         """
 
-        self.physics_space.step(STEP_LENGTH)
+        if self.drive_backend is not None:
+            self.drive_backend.simulateStep(self.step_length)
+        else:
+            self.physics_space.step(self.step_length)
 
     def draw_static_objects(self):
         """Draw all elements in the static sprite list"""
 
-        self.sprite_list.draw()
+        import arcade
+
+        if self.arcade_sprite_list is None:
+            self.arcade_sprite_list = arcade.SpriteList()
+
+            for sprite in self.sprite_list:
+                self.arcade_sprite_list.append(sprite.get_sprite())
+        else:
+            # Static objects can still be moved between episodes, see DomainRandomization.py
+            for sprite in self.sprite_list:
+                sprite.get_sprite()
+
+        self.arcade_sprite_list.draw()
+        self.lines.drawLines()
 
     def createCollisionHandler(self, firstCollisionType: CollisionType, secondCollisionType: CollisionType, callback):
         """
@@ -120,6 +158,23 @@ class StaticPhysics:
         :return: None
         """
 
+        # In lean mode the box is attached to the shared static body with its vertices already in world coordinates
+        if self.physic_environment.lean:
+            physics_space = self.physic_environment.physics_space
+
+            bounding_box = pymunk.Poly(physics_space.static_body,
+                                       StaticBoxRecord.get_box_vertices(width, height, initialX, initialY))
+            bounding_box.collision_type = collision_type.value
+            physics_space.add(bounding_box)
+
+            self.physic_environment.sprite_list.append(StaticBoxRecord(bounding_box=bounding_box,
+                                                                       filename=sprite_path,
+                                                                       width=width,
+                                                                       height=height,
+                                                                       center_x=initialX,
+                                                                       center_y=initialY))
+            return
+
         # Create a new static physics body
         physics_body = pymunk.Body(body_type=pymunk.Body.STATIC)
 
@@ -181,8 +236,6 @@ class StaticPhysics:
                                                                   self.physic_environment.window_height),
                                                  thickness=2)
 
-        # Draw the lines to the screen
-        self.physic_environment.lines.drawLines()
 
 
 class DynamicPhysics:
@@ -190,7 +243,8 @@ class DynamicPhysics:
     @staticmethod
     def createDynamicRectangularObject(physics_environment: PhysicsEnvironment, width, height, mass, friction, damping,
                                        initialX, initialY,
-                                       collision_type: CollisionType, sprite_path):
+                                       collision_type: CollisionType, sprite_path,
+                                       shape_filter: pymunk.ShapeFilter = None):
         """
         Create a new dynamic physics object
 
@@ -204,6 +258,7 @@ class DynamicPhysics:
         :param initialY: Object's initial Y coordinate
         :param collision_type: What kind of collision the object has
         :param sprite_path: Path to the objects sprite
+        :param shape_filter: Filter to place the object in, defaults to the shared dynamic object category
 
         :return: The created object
         """
@@ -229,10 +284,15 @@ class DynamicPhysics:
         # The type of collision this object has
         bounding_box.collision_type = collision_type.value
 
-        bounding_box.filter = pymunk.ShapeFilter(categories=0b1)
+        # Place the object in the dynamic category unless a more specific filter was requested
+        if shape_filter is None:
+            shape_filter = pymunk.ShapeFilter(categories=DYNAMIC_OBJECT_CATEGORY)
+
+        bounding_box.filter = shape_filter
 
         # Add the object to the physics space
         physics_environment.physics_space.add(physics_body, bounding_box)
+        physics_environment.dynamic_bodies.append(physics_body)
 
         # Finally create the entire object with a sprite
         completed_object = DynamicObject(bounding_box=bounding_box,
@@ -248,6 +308,8 @@ class DynamicPhysics:
 class DynamicObject(BoxSprite):
     """Inherits from the Box Sprite to simply add more functionality to that object"""
 
+    __slots__ = ("damping", "sprite_path", "initialX", "initialY")
+
     def __init__(self, bounding_box: pymunk.shapes.Poly, sprite_path, width, height, damping, initialX, initialY):
         """
         Create a new object
@@ -288,16 +350,34 @@ class DynamicObject(BoxSprite):
         :return: None
         """
 
-        # Use the parent method to just apply the force to the forward direction of the object
+        # Use the parent method to just apply the force to the forward direction of the object, the sprite is only
+        # moved to match the body right before it is drawn (see get_sprite)
         super().apply_impulse(impulse=(0, impulse),
                               point=point,
                               is_world=is_world)
 
-        # Update the entire player object to the position of the physics object
-        x, y = self.get_position()  # Get position of player and split to X and Y
-        self.center_x = x  # Set the values gotten from get_position and set them to the total object
+    def sync_transform(self):
+        """
+        Copy the position and angle of the physics body onto the object so it is drawn where the body is
+
+        :return: None
+        """
+
+        x, y = self.bounding_box.body.position
+        self.center_x = x
         self.center_y = y
-        self.angle = self.get_true_angle()  # Set the angle of the object
+        self.angle = self.get_true_angle()
+
+    def get_sprite(self):
+        """
+        Get the arcade sprite of the object moved to the current pose of the physics body
+
+        :return: The arcade sprite
+        """
+
+        self.sync_transform()
+
+        return super().get_sprite()
 
     def apply_damping(self, dt):
         """
@@ -323,6 +403,10 @@ class DynamicObject(BoxSprite):
                                     damping=0.0000001,
                                     dt=0)
 
+        # The solver leaves a position correction from the last collision on the body that the next step would still
+        # move it by, integrating over no time throws it away without moving the body
+        pymunk.Body.update_position(body=self.bounding_box.body, dt=0)
+
     def impulse_move(self, impulse: float, point: tuple, isWorld: bool):
         """
         Move the object by applying an impulse and then applying damping
@@ -341,24 +425,76 @@ class DynamicObject(BoxSprite):
 
 
 class RaycastHandler:
-    from AgentController import AgentController
 
     # Length of the rays
     RAYCAST_LENGTH = 150
 
     """Handler to contain many raycasts to get distances to objects and other information"""
 
-    def __init__(self, physics_environment: PhysicsEnvironment, player: AgentController):
-        from AgentController import AgentController
+    def __init__(self, physics_environment: PhysicsEnvironment, player: "AgentController",
+                 shape_filter: pymunk.ShapeFilter = None, cache_tolerance=None, cache_angle_tolerance=1.0,
+                 cache_size=64, keep_casts=True):
+        """
+        Create a new raycast handler for a single player
+
+        :param physics_environment: The physics environment the rays are cast in
+        :param player: The player the rays originate from
+        :param shape_filter: Filter used for every ray, defaults to ignoring all dynamic objects
+        :param cache_tolerance: Size (PX) of the position grid ray results are cached on, None disables the cache. Only
+            valid while nothing the rays can see moves, so it must stay off when the rays can see other robots
+        :param cache_angle_tolerance: Size (degrees) of the heading grid ray results are cached on
+        :param cache_size: Number of poses to keep results for, the least recently used pose is forgotten first
+        :param keep_casts: Whether the query results are kept after the distances are calculated, they are only needed
+            to draw the rays
+        """
 
         self.ray_casts = []
 
         self.physics_environment = physics_environment
-        self.player: AgentController = player
+        self.player: "AgentController" = player
+
+        # By default the rays only see the static field and pass straight through every robot
+        if shape_filter is None:
+            shape_filter = pymunk.ShapeFilter(mask=pymunk.ShapeFilter.ALL_MASKS ^ DYNAMIC_OBJECT_CATEGORY)
+
+        self.shape_filter = shape_filter
+        self.keep_casts = keep_casts
+
+        # Ray results of recently seen poses, keyed by the pose snapped to the tolerance grid
+        self.cache_tolerance = cache_tolerance
+        self.cache_angle_tolerance = cache_angle_tolerance
+        self.cache_size = cache_size
+        self.ray_cache = OrderedDict()
+
+        # How many calls were answered from the cache and how many had to cast the rays
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def clear_raycasts(self):
         self.ray_casts.clear()
 
+    def clear_cache(self):
+        """
+        Forget every cached ray result, must be called whenever the static field is changed
+
+        :return: None
+        """
+
+        self.ray_cache.clear()
+
+    def get_pose_key(self):
+        """
+        Snap the current pose of the player to the cache grid
+
+        :return: Tuple of (X cell, Y cell, heading cell)
+        """
+
+        position = self.player.get_position()
+
+        return (round(position.x / self.cache_tolerance),
+                round(position.y / self.cache_tolerance),
+                round(self.player.get_angle() / self.cache_angle_tolerance) % round(360 / self.cache_angle_tolerance))
+
     def create_raycast(self, start: tuple, end: tuple, radius):
         """
         Create a single raycast and the list
@@ -370,11 +506,11 @@ class RaycastHandler:
         :return: None
         """
 
-        # Create a a generic raycast with the given information that ignores dynamic objects
+        # Create a a generic raycast with the given information filtered by the handlers shape filter
         ray = self.physics_environment.physics_space.segment_query_first(start=start,
                                                                          end=end,
                                                                          radius=radius,
-                                                                         shape_filter=pymunk.ShapeFilter(mask=pymunk.ShapeFilter.ALL_MASKS ^ 0b1))
+                                                                         shape_filter=self.shape_filter)
         ray_info = (ray, start, end, radius)
 
         # Add the ray to the list
@@ -384,9 +520,30 @@ class RaycastHandler:
         """
         Create a ring of raycasts around the object
 
+        When the cache is enabled and a pose in the same grid cell was cast recently, its results are reused instead.
+        They are off by at most about the tolerance for the position and the angle tolerance times the ray length.
+
         :return: None
         """
 
+        pose_key = None
+
+        if self.cache_tolerance is not None:
+            pose_key = self.get_pose_key()
+            cached_result = self.ray_cache.get(pose_key)
+
+            if cached_result is not None:
+                self.cache_hits += 1
+                self.ray_cache.move_to_end(pose_key)
+
+                # Keep the casts around for drawing just as if they had been made
+                cached_distances, cached_casts = cached_result
+                self.ray_casts.extend(cached_casts)
+
+                return list(cached_distances)
+
+            self.cache_misses += 1
+
         # Create raycast at 90 degrees
         self.create_raycast(start=(self.player.get_position().x, self.player.get_position().y),
                             end=((self.player.get_position().x + (
@@ -478,6 +635,15 @@ class RaycastHandler:
                              self.player.get_position().get_distance(self.ray_casts[6][0].point) if self.ray_casts[6][0] is not None else None,
                              self.player.get_position().get_distance(self.ray_casts[7][0].point) if self.ray_casts[7][0] is not None else None]
 
+        if pose_key is not None:
+            self.ray_cache[pose_key] = (tuple(ray_hit_distances), tuple(self.ray_casts) if self.keep_casts else ())
+
+            if len(self.ray_cache) > self.cache_size:
+                self.ray_cache.popitem(last=False)
+
+        if not self.keep_casts:
+            self.ray_casts.clear()
+
         return ray_hit_distances
 
     def draw_raycasts(self, show_hit_point: bool):
@@ -489,6 +655,8 @@ class RaycastHandler:
         :return: None
         """
 
+        import arcade
+
         # Draw the raycast lines
         for ray in self.ray_casts:
             # Draw the line using the arcade library
@@ -0,0 +1,189 @@
+"""
+Kinematic Differential Drive Backend That Skips The Rigid Body Solver While Robots Are In The Open Field
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+import pymunk
+
+from .BodyStateArray import BodyStateArray, STATE_X, STATE_Y, STATE_ANGLE, STATE_X_VELOCITY, STATE_Y_VELOCITY, \
+    STATE_ANGULAR_VELOCITY
+
+
+class KinematicDriveBackend:
+    """
+    Advances robots analytically while nothing is close enough to touch them and falls back to a full pymunk step
+    otherwise.
+
+    With no gravity, a space damping of 1 and no contacts a pymunk step only moves each body by its velocity, so the
+    analytic update below produces the same positions and angles as the solver would.
+    """
+
+    def __init__(self, physics_environment, clearance=5.0):
+        """
+        Create the backend and cache the static geometry of the environment
+
+        :param physics_environment: The physics environment to advance
+        :param clearance: Extra distance (PX) around each robot that has to be free of geometry to skip the solver
+        """
+
+        self.physics_environment = physics_environment
+        self.clearance = clearance
+
+        self.body_states = BodyStateArray([physics_environment])
+        self.states = self.body_states.allocate()
+
+        # Radius of a circle around each body's center that contains its entire footprint at any rotation
+        self.body_radii = np.array([max(vertex.length for shape in body.shapes for vertex in shape.get_vertices())
+                                    for body in self.body_states.bodies], dtype=np.float64)
+
+        # How many steps were taken by each path, useful to see how much of the training is in the open field
+        self.analytic_steps = 0
+        self.solver_steps = 0
+
+        self.static_bounds = None
+        self.refresh_static_geometry()
+
+    def refresh_static_geometry(self):
+        """
+        Re-cache the bounding boxes of all static shapes, must be called whenever static geometry is moved
+
+        :return: None
+        """
+
+        static_shapes = [shape for shape in self.physics_environment.physics_space.shapes
+                         if shape.body.body_type == pymunk.Body.STATIC]
+
+        # Row of every static shape so single shapes can be updated later
+        self.static_shape_rows = {shape: row for row, shape in enumerate(static_shapes)}
+
+        # Left, Bottom, Right, Top of every static shape
+        self.static_bounds = np.array([(shape.bb.left, shape.bb.bottom, shape.bb.right, shape.bb.top)
+                                       for shape in static_shapes], dtype=np.float64).reshape(-1, 4)
+
+    def update_static_shapes(self, shapes):
+        """
+        Re-cache the bounding boxes of only the given static shapes after they were moved and reindexed
+
+        :param shapes: Static shapes that were moved
+
+        :return: None
+        """
+
+        for shape in shapes:
+            self.static_bounds[self.static_shape_rows[shape]] = (shape.bb.left, shape.bb.bottom, shape.bb.right,
+                                                                 shape.bb.top)
+
+    def is_clear(self, states, step_length):
+        """
+        Broadphase check of whether every robot is far enough away from the static geometry and other robots
+
+        :param states: Body states shaped like [N, 6]
+        :param step_length: Length of the step about to be taken
+
+        :return: True if the analytic update can be used for this step
+        """
+
+        positions = states[:, STATE_X:STATE_Y + 1]
+        speeds = np.hypot(states[:, STATE_X_VELOCITY], states[:, STATE_Y_VELOCITY])
+
+        # How far each robot could possibly reach by the end of the step
+        reach = self.body_radii + (speeds * step_length) + self.clearance
+
+        # Distance from each robot center to the closest point of each static bounding box
+        x_gap = np.maximum(np.maximum(self.static_bounds[None, :, 0] - positions[:, None, 0],
+                                      positions[:, None, 0] - self.static_bounds[None, :, 2]), 0)
+        y_gap = np.maximum(np.maximum(self.static_bounds[None, :, 1] - positions[:, None, 1],
+                                      positions[:, None, 1] - self.static_bounds[None, :, 3]), 0)
+
+        if np.any((x_gap * x_gap) + (y_gap * y_gap) < (reach * reach)[:, None]):
+            return False
+
+        # Robots sharing a space also have to stay clear of each other
+        if len(positions) > 1:
+            offsets = positions[:, None, :] - positions[None, :, :]
+            center_distances = np.hypot(offsets[..., 0], offsets[..., 1])
+            np.fill_diagonal(center_distances, np.inf)
+
+            if np.any(center_distances < (reach[:, None] + reach[None, :])):
+                return False
+
+        return True
+
+    def simulateStep(self, step_length):
+        """
+        Move the simulation forward, analytically if every robot is in the open field and with pymunk otherwise
+
+        :param step_length: The amount of time in seconds to move the simulation forward
+
+        :return: None
+        """
+
+        states = self.body_states.read(out=self.states)
+
+        if not self.is_clear(states, step_length):
+            self.solver_steps += 1
+            self.physics_environment.physics_space.step(step_length)
+            return
+
+        self.analytic_steps += 1
+
+        # Integrate the pose from the current velocity the same way the pymunk integrator does
+        states[:, STATE_X] += states[:, STATE_X_VELOCITY] * step_length
+        states[:, STATE_Y] += states[:, STATE_Y_VELOCITY] * step_length
+        states[:, STATE_ANGLE] += states[:, STATE_ANGULAR_VELOCITY] * step_length
+
+        self.body_states.write(states)
+
+    def apply_tank_impulses(self, left_impulses, right_impulses, left_offsets, right_offsets):
+        """
+        Vectorized equivalent of applying the two drive impulses of AgentController.control to every robot, matches the
+        per robot pymunk impulses up to floating point rounding
+
+        :param left_impulses: Impulse applied to the left side of each robot [N], in body order
+        :param right_impulses: Impulse applied to the right side of each robot [N]
+        :param left_offsets: Local X (PX) of the point the left impulse is applied at on each robot [N]
+        :param right_offsets: Local X (PX) of the point the right impulse is applied at on each robot [N]
+
+        :return: None
+        """
+
+        states = self.body_states.read(out=self.states)
+        bodies = self.body_states.bodies
+
+        # Mass and moment are read every time as they may be changed between episodes
+        masses = np.array([body.mass for body in bodies], dtype=np.float64)
+        moments = np.array([body.moment for body in bodies], dtype=np.float64)
+        centers = np.array([body.center_of_gravity.x for body in bodies], dtype=np.float64)
+
+        left_impulses = np.asarray(left_impulses, dtype=np.float64)
+        right_impulses = np.asarray(right_impulses, dtype=np.float64)
+
+        # Both impulses push along the local forward (Y) axis, so their sum accelerates the body and only the X offset
+        # of where each one pushes turns it
+        forward_change = (left_impulses + right_impulses) / masses
+        angle = states[:, STATE_ANGLE]
+
+        states[:, STATE_X_VELOCITY] -= forward_change * np.sin(angle)
+        states[:, STATE_Y_VELOCITY] += forward_change * np.cos(angle)
+        states[:, STATE_ANGULAR_VELOCITY] += ((np.asarray(left_offsets) - centers) * left_impulses +
+                                              (np.asarray(right_offsets) - centers) * right_impulses) / moments
+
+        self.body_states.write_velocities(states)
+
+    def apply_damping(self, dampings):
+        """
+        Vectorized equivalent of DynamicObject.apply_damping for every robot, exact as the robots carry no forces and
+        there is no gravity
+
+        :param dampings: Damping factor of each robot applied to its linear and angular velocity [N], in body order
+
+        :return: None
+        """
+
+        states = self.body_states.read(out=self.states)
+        states[:, STATE_X_VELOCITY:] *= np.asarray(dampings, dtype=np.float64)[:, None]
+
+        self.body_states.write_velocities(states)
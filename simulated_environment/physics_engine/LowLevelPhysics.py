@@ -6,25 +6,72 @@ __author__ = "Will Richards"
 __copyright__ = "Copyright 2020, AEMBOT"
 
 import math
-import arcade
 import pymunk
 
-from CollisionTypes import CollisionType
+from .collision_handling.CollisionTypes import CollisionType
+
+# NOTE: arcade is only imported once something is actually drawn, so headless simulation never loads the windowing and
+# OpenGL stack
+
+
+class PhysicsSprite:
+
+    # Fixed attribute layout, thousands of these are alive at once when many environments share a process
+    __slots__ = ("bounding_box", "filename", "center_x", "center_y", "angle", "width", "height", "sprite",
+                 "rotational_offset")
 
-class PhysicsSprite(arcade.Sprite):
     def __init__(self, bounding_box: pymunk.shapes.Poly, filename):
         """
         Creates a new physics object
 
         :param pymunk_shape: The bounding box created by pymunk
-        :param filename: Path to the displayed sprite
+        :param filename: Absolute path to the displayed sprite
         """
 
-        super().__init__(filename, center_x=bounding_box.body.position.x, center_y=bounding_box.body.position.y)
         self.bounding_box = bounding_box
+        self.filename = filename
+
+        # Where the sprite is drawn, copied onto the arcade sprite at draw time
+        self.center_x = bounding_box.body.position.x
+        self.center_y = bounding_box.body.position.y
+        self.angle = 0
+
+        # Size the sprite is drawn at, None keeps the size of the image
+        self.width = None
+        self.height = None
+
+        # The arcade sprite, only created the first time the object is drawn
+        self.sprite = None
 
         self.rotational_offset = 0
 
+    def get_sprite(self):
+        """
+        Get the arcade sprite of the object, loading its texture the first time
+
+        :return: The arcade sprite with the current position and angle of the object
+        """
+
+        if self.sprite is None:
+            import arcade
+
+            self.sprite = arcade.Sprite(self.filename)
+
+            if self.width is not None:
+                self.sprite.width = self.width
+                self.sprite.height = self.height
+
+        self.sprite.center_x = self.center_x
+        self.sprite.center_y = self.center_y
+        self.sprite.angle = self.angle
+
+        return self.sprite
+
+    def draw(self):
+        """Draw the object on its own"""
+
+        self.get_sprite().draw()
+
     def apply_impulse(self, impulse, point, is_world):
         """
         Apply an impulse to a location on a sprite
@@ -147,6 +194,8 @@ class PhysicsSprite(arcade.Sprite):
 class CircleSprite(PhysicsSprite):
     """Creates a Circular Physics Sprite"""
 
+    __slots__ = ()
+
     def __init__(self, pymunk_shape, filename):
         """
         Create a new Circular Sprite that inherits from the PhysicsSprite class
@@ -162,6 +211,8 @@ class CircleSprite(PhysicsSprite):
 class BoxSprite(PhysicsSprite):
     """Creates A Box Physics Sprite"""
 
+    __slots__ = ()
+
     def __init__(self, bounding_box, filename, width, height):
         """
         Create a new Box Sprite that inherits from the PhysicsSprite class
@@ -176,18 +227,81 @@ class BoxSprite(PhysicsSprite):
         self.height = height
 
 
+class StaticBoxRecord(BoxSprite):
+    """
+    Box whose shape is attached to the shared static body of the space with its vertices in world coordinates, used
+    by the lean mode instead of giving every field element a static body of its own
+    """
+
+    __slots__ = ()
+
+    def __init__(self, bounding_box, filename, width, height, center_x, center_y):
+        """
+        Create a new record of a static box
+
+        :param bounding_box: Bounding box of the object, attached to the static body of the space
+        :param filename: Path to sprite
+        :param width: Width of the box
+        :param height: Height of the box
+        :param center_x: X coordinate of the center of the box
+        :param center_y: Y coordinate of the center of the box
+        """
+        super().__init__(bounding_box, filename, width, height)
+        self.center_x = center_x
+        self.center_y = center_y
+
+    @staticmethod
+    def get_box_vertices(width, height, center_x, center_y):
+        """
+        Get the world vertices of a box in the same order pymunk.Poly.create_box uses
+
+        :param width: Width of the box
+        :param height: Height of the box
+        :param center_x: X coordinate of the center of the box
+        :param center_y: Y coordinate of the center of the box
+
+        :return: List of the four corners
+        """
+
+        half_width = width / 2
+        half_height = height / 2
+
+        return [(center_x + half_width, center_y - half_height), (center_x + half_width, center_y + half_height),
+                (center_x - half_width, center_y + half_height), (center_x - half_width, center_y - half_height)]
+
+    def get_position(self):
+        """Gets the center of the box, the body it is attached to is shared and always at the origin"""
+        return pymunk.Vec2d(self.center_x, self.center_y)
+
+    def set_position(self, x, y):
+        """
+        Move the box by rewriting its vertices, the space must reindex the shape afterwards
+
+        :param x: X coord of new position
+        :param y: Y coord of new position
+        :return: None
+        """
+
+        self.bounding_box.unsafe_set_vertices(self.get_box_vertices(self.width, self.height, x, y))
+        self.center_x = x
+        self.center_y = y
+
+
 class LineHandler:
     """Allows for the creation and management of many different line segments"""
 
-    def __init__(self, physics_space):
+    def __init__(self, physics_space, share_static_body=False):
         """
         Create a new LineSegments class and make a list to hold different line segments
 
         :param physics_space: Reference to the physics space that these lines will be created within
+        :param share_static_body: Whether static lines are attached to the static body of the space instead of each
+            getting a body of their own
         """
 
         self.lines = []
         self.physics_space = physics_space
+        self.share_static_body = share_static_body
 
     def createLine(self, body_type, collision_type: CollisionType, first_endpoint: tuple, second_endpoint: tuple, thickness):
         """
@@ -202,7 +316,10 @@ class LineHandler:
         """
 
         # Physical body of the line segment
-        physics_body = pymunk.Body(body_type=body_type)
+        if self.share_static_body and body_type == pymunk.Body.STATIC:
+            physics_body = self.physics_space.static_body
+        else:
+            physics_body = pymunk.Body(body_type=body_type)
 
         # Create the line segment with the given parameters
         line_segment = pymunk.Segment(physics_body, [first_endpoint[0], first_endpoint[1]], [second_endpoint[0], second_endpoint[1]], thickness)
@@ -217,6 +334,8 @@ class LineHandler:
     def drawLines(self):
         """Draw all the lines within the lines array"""
 
+        import arcade
+
         for line in self.lines:
 
             # The physical body of the line
@@ -0,0 +1,4 @@
+"""Physics Layer Built On pymunk, Free Of Any Rendering Dependencies"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
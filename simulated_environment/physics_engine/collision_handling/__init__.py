@@ -0,0 +1,4 @@
+"""Collision Categories Shared By The Physics And Environment Layers"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
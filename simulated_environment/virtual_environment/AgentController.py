@@ -3,31 +3,53 @@
 __author__ = "Will Richards"
 __copyright__ = "Copyright 2020, AEMBOT"
 
-import os
-
-from EasyPhysics import *
-from CollisionTypes import CollisionType
+from ..physics_engine.EasyPhysics import *
+from ..physics_engine.collision_handling.CollisionTypes import CollisionType
+from .EnvironmentObjectManager import get_graphic_path
 
 
 class AgentController(DynamicObject):
-    def __init__(self, physics_environment: PhysicsEnvironment, screen_width, screen_height):
-        # Change the current working directory to the sprites director to get relative file access
-        os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/Graphics/")
+    def __init__(self, physics_environment: PhysicsEnvironment, screen_width, screen_height,
+                 initialX=None, initialY=None, shape_filter: pymunk.ShapeFilter = None, mass=1.0, friction=0.9,
+                 damping=0.92, left_impulse_point=(6, 0), right_impulse_point=(-6, 0)):
+        """
+        Create the agent and its physics object
+
+        :param physics_environment: The physics environment the agent lives in
+        :param screen_width: Width of the window
+        :param screen_height: Height of the window
+        :param initialX: Starting X coordinate of the agent, defaults to the standard starting position
+        :param initialY: Starting Y coordinate of the agent, defaults to the standard starting position
+        :param shape_filter: Filter for the agents bounding box, defaults to the shared dynamic object category
+        :param mass: Mass of the robot
+        :param friction: Friction of the robots bounding box
+        :param damping: How quickly the robot slows down (Lower numbers = more damping)
+        :param left_impulse_point: Local point the left side impulse is applied at
+        :param right_impulse_point: Local point the right side impulse is applied at
+        """
 
         self.physics_environment = physics_environment
 
+        # Default to the standard starting position of the robot
+        if initialX is None:
+            initialX = screen_width / 1.3
+
+        if initialY is None:
+            initialY = screen_height / 7
+
         # Create the dynamic player object
         player_object: DynamicObject = DynamicPhysics.createDynamicRectangularObject(
             physics_environment=physics_environment,
             width=50,
             height=60,
-            mass=1.0,
-            friction=0.9,
-            damping=0.92,
-            initialX=(screen_width / 1.3),
-            initialY=(screen_height / 7),
+            mass=mass,
+            friction=friction,
+            damping=damping,
+            initialX=initialX,
+            initialY=initialY,
             collision_type=CollisionType.DYNAMIC_OBJECT,
-            sprite_path="Player.png")
+            sprite_path=get_graphic_path("Player.png"),
+            shape_filter=shape_filter)
 
         # Inherit the dynamic object
         super().__init__(bounding_box=player_object.bounding_box,
@@ -35,14 +57,27 @@ class AgentController(DynamicObject):
                          width=player_object.width,
                          height=player_object.height,
                          damping=player_object.damping,
-                         initialX=(screen_width / 1.3),
-                         initialY=(screen_height / 7))
+                         initialX=initialX,
+                         initialY=initialY)
 
         # Get local variable of self
         self.player: DynamicObject = super().get_instance()
 
         self.raycast_handler = None
 
+        # Where on the robot each side pushes
+        self.left_impulse_point = left_impulse_point
+        self.right_impulse_point = right_impulse_point
+
+        # Multiplier on both sides' impulses and standard deviation (PX) of the noise added to each ray distance, both
+        # are changed per episode by a DomainRandomizer
+        self.impulse_scale = 1.0
+        self.sensor_noise = 0.0
+        self.sensor_random_generator = None
+
+        # Optional DomainRandomizer that is given a chance to change the agent on every reset
+        self.domain_randomizer = None
+
         # Set the initial rotation offset
         self.player.set_rotational_offset(offset=90)
 
@@ -72,6 +107,28 @@ class AgentController(DynamicObject):
 
         self.raycast_handler = raycast_handler
 
+    def get_training_state(self):
+        """
+        Get the training variables of the current episode, together with the body state this fully describes the agent
+
+        :return: Tuple of (current_step, current_episode_done, last_reward, hit_goal, last_distance, starting_distance)
+        """
+
+        return (self.current_step, self.current_episode_done, self.last_reward, self.hit_goal, self.last_distance,
+                self.starting_distance)
+
+    def set_training_state(self, training_state):
+        """
+        Restore training variables captured by get_training_state
+
+        :param training_state: Tuple returned by get_training_state
+
+        :return: None
+        """
+
+        (self.current_step, self.current_episode_done, self.last_reward, self.hit_goal, self.last_distance,
+         self.starting_distance) = training_state
+
     def collect_obeservations(self):
         """
         Collect required observations of the space
@@ -107,6 +164,11 @@ class AgentController(DynamicObject):
 
         # Separate the raycast distances out into single values
         for distance in spacial_distances:
+
+            # Blur the distance sensors if requested, rays that hit nothing stay None
+            if self.sensor_noise > 0 and distance is not None:
+                distance += self.sensor_random_generator.normal(0.0, self.sensor_noise)
+
             observations.append(distance)
 
         # Information about the agents current location
@@ -158,6 +220,10 @@ class AgentController(DynamicObject):
         :return: The new observation
         """
 
+        # Pick the physical parameters of the next episode before anything is measured
+        if self.domain_randomizer is not None:
+            self.domain_randomizer.randomize(self)
+
         # Stop the objects movement
         self.player.stop_object()
 
@@ -170,6 +236,9 @@ class AgentController(DynamicObject):
         self.player.set_position(x=self.player.initialX,
                                  y=self.player.initialY)
 
+        # Measure progress from the standard starting position again, a random start of the last episode may have moved it
+        self.starting_distance = self.get_distance_to_goal()
+
         self.last_distance = self.starting_distance  # On reset set the distance from the last step equal to the current distance
         self.last_reward = 0  # Set the reward from the last step equal to 0
         self.hit_goal = False  # Reset whether or not the goal has been reached
@@ -181,25 +250,27 @@ class AgentController(DynamicObject):
         self.current_episode_done = False # Start a new episode
         return observation # Return the starting observation
 
-    def step(self, action: tuple):
+    def step(self, action: tuple, apply_control=True):
         """
         Called whenever the agent attempts to take an action
 
         :param delta_time: Simulation delta time
         :param action: The action as a tuple (left_power, right_power)
+        :param apply_control: Whether or not to apply the action, False when the caller already applied the impulses of
+            every robot at once (see MultiAgentEnvironment.step)
 
         :return: Observation, Step reward, and episode completion status
         """
 
 
 
-        # If the current episode is still happening process the specified actions
-        if not self.current_episode_done:
+        # If the current episode is still happening process the specified actions, unless the caller already did
+        if apply_control and not self.current_episode_done:
 
             # Pass the action values into the step to move us one action forward
             self.control(left_input=action[0],
                          right_input=action[1])
-        else:
+        elif apply_control:
 
             # If the episode is done and we are waiting for the next episode to start dont provide any input
             self.control(left_input=0,
@@ -320,23 +391,26 @@ class AgentController(DynamicObject):
             if control_array[3]:
                 left_power = -control_speed
 
+            left_power *= self.impulse_scale
+            right_power *= self.impulse_scale
+
             # Move Right Side
             self.player.impulse_move(impulse=right_power,
-                                     point=(-6, 0),
+                                     point=self.right_impulse_point,
                                      isWorld=False)
 
             # Move Left Side
             self.player.impulse_move(impulse=left_power,
-                                     point=(6, 0),
+                                     point=self.left_impulse_point,
                                      isWorld=False)
         else:
 
             # Move Right Side
-            self.player.impulse_move(impulse=right_input,
-                                     point=(-6, 0),
+            self.player.impulse_move(impulse=right_input * self.impulse_scale,
+                                     point=self.right_impulse_point,
                                      isWorld=False)
 
             # Move Left Side
-            self.player.impulse_move(impulse=left_input,
-                                     point=(6, 0),
+            self.player.impulse_move(impulse=left_input * self.impulse_scale,
+                                     point=self.left_impulse_point,
                                      isWorld=False)
@@ -3,17 +3,16 @@
 __author__ = "Will Richards"
 __copyright__ = "Copyright 2020, AEMBOT"
 
-import os, signal, threading
-from Keymapping.Keymap import Keymap
+import signal, threading
+import arcade
+from .keymapping.Keymap import Keymap
 
-from EasyPhysics import *
-from CollisionTypes import CollisionType
-from EnvironmentObjectManager import EnvironmentGameObjects
-from AgentController import AgentController
+from ..physics_engine.EasyPhysics import *
+from ..physics_engine.collision_handling.CollisionTypes import CollisionType
+from .EnvironmentObjectManager import EnvironmentGameObjects, SCREEN_WIDTH, SCREEN_HEIGHT
+from .AgentController import AgentController
 
 # Create window parameters
-SCREEN_WIDTH = 450
-SCREEN_HEIGHT = 525
 WINDOW_TITLE = "AI FRC Drive Training"
 
 ENVIRONMENT_RUNNING = False
@@ -34,9 +33,6 @@ class VirtualEnvironment(arcade.Window):
         # Set the background to black
         arcade.set_background_color(arcade.color.BLACK)
 
-        # Change the current working directory to the sprites director to get relative file access
-        os.chdir(os.path.dirname(os.path.abspath(__file__)) + "/Graphics/")
-
         # Create a new physics environment to control physics from
         self.physics_environment = PhysicsEnvironment(window_width=SCREEN_WIDTH,
                                                       window_height=SCREEN_HEIGHT,
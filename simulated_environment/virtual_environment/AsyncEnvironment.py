@@ -0,0 +1,160 @@
+"""Asyncio Interface That Overlaps Policy Inference With Simulation"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class AsyncEnvironment:
+    """
+    Runs the step and reset of an environment on a worker thread so the caller can keep working while it simulates.
+
+    Results are written into a ring of preallocated slots. The arrays returned by step_wait stay valid until
+    slot_count more steps have been started, with the default of two slots the trainer can keep using the observation
+    of batch k while batch k + 1 simulates.
+
+    Usage:
+        env.step_async(actions)
+        ... run inference on the previous batch ...
+        obs, reward, done = await env.step_wait()
+    """
+
+    def __init__(self, environment, executor: ThreadPoolExecutor = None, slot_count=2):
+        """
+        Wrap an environment
+
+        :param environment: Environment with step(actions) and reset() such as VirtualEnvironment or VectorEnvironment
+        :param executor: Thread pool to simulate in, a private single thread pool is created if not given. pymunk
+            releases the GIL while stepping the space so several environments can share one pool
+        :param slot_count: How many result slots to rotate through
+        """
+
+        self.environment = environment
+
+        self.owns_executor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=1)
+
+        self.slot_count = slot_count
+        self.current_slot = 0
+
+        # Allocated on the first reset once the shape of the observations is known
+        self.observations = None
+        self.rewards = None
+        self.dones = None
+
+        self.pending_step = None
+
+    async def reset(self):
+        """
+        Reset the environment on the worker thread
+
+        :return: Observation at reset
+        """
+
+        if self.pending_step is not None:
+            raise RuntimeError("Can not reset while a step is in progress, call step_wait first")
+
+        loop = asyncio.get_running_loop()
+        observation = np.asarray(await loop.run_in_executor(self.executor, self.environment.reset), dtype=np.float64)
+
+        if self.observations is None:
+            self.allocate_slots(observation.shape)
+
+        return observation
+
+    def allocate_slots(self, observation_shape):
+        """
+        Allocate the result slots
+
+        :param observation_shape: Shape of a single observation returned by the environment
+
+        :return: None
+        """
+
+        batch_shape = observation_shape[:-1]
+
+        self.observations = np.zeros((self.slot_count,) + tuple(observation_shape), dtype=np.float64)
+        self.rewards = np.zeros((self.slot_count,) + tuple(batch_shape), dtype=np.float64)
+        self.dones = np.zeros((self.slot_count,) + tuple(batch_shape), dtype=bool)
+
+    def step_async(self, actions):
+        """
+        Start simulating a step and return immediately
+
+        :param actions: Actions for the environment, copied before returning so the caller may reuse its buffer
+
+        :return: None
+        """
+
+        if self.pending_step is not None:
+            raise RuntimeError("A step is already in progress, call step_wait first")
+
+        if self.observations is None:
+            raise RuntimeError("The environment has to be reset before stepping")
+
+        self.current_slot = (self.current_slot + 1) % self.slot_count
+
+        loop = asyncio.get_running_loop()
+        self.pending_step = loop.run_in_executor(self.executor, self.step_into_slot,
+                                                 self.current_slot, np.array(actions))
+
+    async def step_wait(self):
+        """
+        Wait for the step started by step_async
+
+        :return: Observation, Step Reward and Episode Completion Status views into the current slot
+        """
+
+        if self.pending_step is None:
+            raise RuntimeError("No step in progress, call step_async first")
+
+        try:
+            slot = await self.pending_step
+        finally:
+            self.pending_step = None
+
+        return self.observations[slot], self.rewards[slot], self.dones[slot]
+
+    async def step(self, actions):
+        """
+        Start a step and wait for it
+
+        :param actions: Actions for the environment
+
+        :return: Observation, Step Reward and Episode Completion Status
+        """
+
+        self.step_async(actions)
+        return await self.step_wait()
+
+    def step_into_slot(self, slot, actions):
+        """
+        Simulate a step on the worker thread and copy the results into a slot
+
+        :param slot: Index of the slot to fill
+        :param actions: Actions for the environment
+
+        :return: The filled slot
+        """
+
+        observation, reward, done = self.environment.step(actions)
+
+        self.observations[slot] = observation
+        self.rewards[slot] = reward
+        self.dones[slot] = done
+
+        return slot
+
+    def close(self):
+        """
+        Shut down the private worker thread
+
+        :return: None
+        """
+
+        if self.owns_executor:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,261 @@
+"""Agent And Environment Layer For The Pure NumPy Batched Physics Engine"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+
+from ..physics_engine.EasyPhysics import *
+from ..physics_engine.BatchedPhysics import BatchedPhysicsEnvironment
+from .EnvironmentObjectManager import EnvironmentGameObjects, SCREEN_WIDTH, SCREEN_HEIGHT
+from .RewardKernel import RewardKernel, RewardContext
+
+# Offsets (degrees) of the 8 rays from the robots heading, in the same order as RaycastHandler.calculate_multiraycast
+RAY_OFFSETS = np.array([0, 180, 90, 270, -45, 135, 45, 225], dtype=np.float64)
+
+
+class BatchedAgentController:
+    """Vectorized version of AgentController's observation and reward logic for every environment at once"""
+
+    def __init__(self, physics_environment: BatchedPhysicsEnvironment, goal_position, reward_kernel=None):
+        """
+        Create the per environment training variables
+
+        :param physics_environment: The batched physics environment holding the robots
+        :param goal_position: Position of the goal as a Vec2d
+        :param reward_kernel: RewardKernel calculating the reward, defaults to the same reward as AgentController
+        """
+
+        self.physics_environment = physics_environment
+        self.environment_count = physics_environment.environment_count
+
+        # Same rotational offset AgentController gives its player
+        self.rotational_offset = 90
+
+        self.goal_position = np.array([goal_position.x, goal_position.y], dtype=np.float64)
+
+        # Training variables
+        self.current_step = np.zeros(self.environment_count, dtype=np.int64)
+        self.current_episode_done = np.zeros(self.environment_count, dtype=bool)
+        self.hit_goal = np.zeros(self.environment_count, dtype=bool)
+
+        # Observation Data
+        self.starting_distance = self.get_distance_to_goal()
+
+        # Set the last distance to the starting difference so they agent doesnt get a huge penalty at the start
+        self.last_distance = self.starting_distance.copy()
+
+        if reward_kernel is None:
+            reward_kernel = RewardKernel(self.environment_count)
+
+        self.reward_kernel = reward_kernel
+
+    def collect_obeservations(self, indices=None):
+        """
+        Collect the same 13 observations as AgentController.collect_obeservations for every environment
+
+        :param indices: Indices or boolean mask of the environments to observe, defaults to every environment
+
+        :return: Observations shaped like [N, 13], rays that hit nothing are NaN
+        """
+
+        if indices is None:
+            indices = slice(None)
+
+        angles = np.degrees(self.physics_environment.angles[indices])
+
+        ray_angles = (angles + self.rotational_offset)[:, None] + RAY_OFFSETS[None, :]
+        spacial_distances = self.physics_environment.raycast(ray_angles=ray_angles,
+                                                             ray_length=RaycastHandler.RAYCAST_LENGTH,
+                                                             indices=indices)
+
+        observations = np.empty((len(angles), 13), dtype=np.float64)
+        observations[:, 0:8] = spacial_distances
+        observations[:, 8:10] = self.physics_environment.positions[indices]
+        observations[:, 10] = angles % 360
+        observations[:, 11:13] = self.goal_position
+
+        return observations
+
+    def update_collisions(self):
+        """
+        Equivalent of the collision callbacks, reads the contacts of the last physics step
+
+        :return: None
+        """
+
+        self.current_episode_done |= self.physics_environment.static_contacts | self.physics_environment.goal_contacts
+        self.hit_goal |= self.physics_environment.goal_contacts
+
+    def reset(self, indices=None):
+        """
+        Reset some or all of the environments
+
+        :param indices: Boolean mask of the environments to reset, defaults to every environment
+
+        :return: The new observation of the reset environments
+        """
+
+        if indices is None:
+            indices = np.ones(self.environment_count, dtype=bool)
+
+        # Stop the objects movement and move them back to the start
+        self.physics_environment.stop_objects(indices)
+        self.physics_environment.set_poses(indices,
+                                           x=self.physics_environment.initial_position[0],
+                                           y=self.physics_environment.initial_position[1],
+                                           angle=0)
+
+        self.last_distance[indices] = self.starting_distance[indices]
+        self.reward_kernel.reset(indices)
+        self.hit_goal[indices] = False
+        self.current_step[indices] = 0
+
+        observation = self.collect_obeservations(indices)
+
+        self.current_episode_done[indices] = False
+        return observation
+
+    def step(self, actions):
+        """
+        Called whenever the agents attempt to take an action
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every environment
+
+        :return: Observations, Step rewards, and episode completion statuses
+        """
+
+        actions = np.asarray(actions, dtype=np.float64)
+
+        # Environments waiting for their next episode get no input
+        running = ~self.current_episode_done
+        self.control(left_input=np.where(running, actions[:, 0], 0),
+                     right_input=np.where(running, actions[:, 1], 0))
+
+        observations = self.collect_obeservations()
+
+        self.current_step += 1
+
+        reward = self.calculate_agent_reward()
+
+        self.last_distance = self.get_distance_to_goal()
+
+        return observations, reward, self.current_episode_done.copy()
+
+    def calculate_agent_reward(self):
+        """
+        Vectorized AgentController.calculate_agent_reward including the terminal bonus or penalty, see RewardKernel.py
+
+        :return: The reward obtained by every environment for that step
+        """
+
+        context = RewardContext(distance=self.get_distance_to_goal(),
+                                last_distance=self.last_distance,
+                                starting_distance=self.starting_distance,
+                                done=self.current_episode_done,
+                                hit_goal=self.hit_goal,
+                                positions=self.physics_environment.positions,
+                                headings=self.physics_environment.angles + np.radians(self.rotational_offset),
+                                goal_position=self.goal_position)
+
+        return self.reward_kernel(context)
+
+    def get_distance_to_goal(self):
+        """
+        Get the current distance of every robot to the goal
+
+        :return: Distances shaped like [N]
+        """
+
+        offset = self.physics_environment.positions - self.goal_position
+        return np.hypot(offset[:, 0], offset[:, 1])
+
+    def control(self, left_input, right_input):
+        """
+        Apply the left and right drive power of every robot
+
+        :param left_input: Power applied to the left side of each robot
+        :param right_input: Power applied to the right side of each robot
+
+        :return: None
+        """
+
+        self.physics_environment.apply_forward_impulses(left_impulses=left_input,
+                                                        right_impulses=right_input)
+
+
+class BatchedEnvironment:
+    """Drop in batched counterpart to VirtualEnvironment.step and reset, without any window"""
+
+    def __init__(self, environment_count, screen_width=SCREEN_WIDTH, screen_height=SCREEN_HEIGHT, reward_terms=None):
+        """
+        Build the field once with pymunk and copy it into the batched engine
+
+        :param environment_count: How many independent environments to simulate
+        :param screen_width: Width of the field
+        :param screen_height: Height of the field
+        :param reward_terms: Ordered dictionary of name to RewardTerm, defaults to the reward of AgentController
+        """
+
+        self.environment_count = environment_count
+
+        # The pymunk environment is only used as the source of the static field
+        self.field_environment = PhysicsEnvironment(window_width=screen_width,
+                                                    window_height=screen_height,
+                                                    simulation_accuracy=45,
+                                                    step_length=0.01)
+
+        self.StaticObjectManager = EnvironmentGameObjects(physics_environment=self.field_environment,
+                                                          screen_width=screen_width,
+                                                          screen_height=screen_height)
+
+        # Same robot as AgentController creates
+        self.physics_environment = BatchedPhysicsEnvironment(static_environment=self.field_environment,
+                                                             environment_count=environment_count,
+                                                             width=50,
+                                                             height=60,
+                                                             mass=1.0,
+                                                             damping=0.92,
+                                                             initialX=(screen_width / 1.3),
+                                                             initialY=(screen_height / 7),
+                                                             step_length=self.field_environment.step_length)
+
+        goal_position = self.field_environment.sprite_list[len(self.field_environment.sprite_list) - 1].get_position()
+
+        self.player = BatchedAgentController(physics_environment=self.physics_environment,
+                                             goal_position=goal_position,
+                                             reward_kernel=RewardKernel(environment_count, reward_terms))
+        self.player.reset()
+
+    def step(self, actions):
+        """
+        Simulation Step for every environment
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every environment
+
+        :return: Observations, Step Rewards, Episode Completion Statuses
+        """
+
+        self.physics_environment.simulateStep()
+        self.player.update_collisions()
+
+        obs, reward, done = self.player.step(actions=actions)
+
+        self.physics_environment.apply_damping(dt=self.physics_environment.step_length)
+
+        return obs, reward, done
+
+    @property
+    def reward_contributions(self):
+        """Contribution of every reward term to the last step [N], by name"""
+        return self.player.reward_kernel.contributions
+
+    def reset(self, indices=None):
+        """
+        Wrapper for player reset inside the environment
+
+        :param indices: Boolean mask of the environments to reset, defaults to every environment
+
+        :return: Observations of the reset environments
+        """
+        return self.player.reset(indices)
@@ -0,0 +1,216 @@
+"""Per Episode Domain Randomization Applied In Place To The Existing Physics Objects"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+import pymunk
+
+# Names of the per robot parameters drawn for every episode
+PARAMETER_NAMES = ("mass", "friction", "damping", "impulse_scale", "sensor_noise")
+
+
+class FieldElements:
+    """The movable static elements of one physics environment and where they were originally placed"""
+
+    def __init__(self, physics_environment, agents):
+        """
+        Find the field elements of a physics environment
+
+        :param physics_environment: The physics environment
+        :param agents: Every robot sharing the environment
+        """
+
+        self.physics_environment = physics_environment
+        self.agents = agents
+        self.robot_count = len(agents)
+
+        # Every static sprite except the goal, which is the last one and stays put so the reward stays comparable
+        self.sprites = list(physics_environment.sprite_list)[:-1]
+        self.nominal_positions = np.array([tuple(sprite.get_position()) for sprite in self.sprites],
+                                          dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def move(self, offsets):
+        """
+        Move every field element to its original position plus an offset
+
+        :param offsets: Offsets [elements, 2] in PX
+
+        :return: None
+        """
+
+        physics_space = self.physics_environment.physics_space
+        positions = (self.nominal_positions + offsets).tolist()
+
+        for sprite, (x, y) in zip(self.sprites, positions):
+
+            # Moves the body, or in lean mode the vertices on the shared static body
+            sprite.set_position(x, y)
+
+            # Static shapes are not reindexed by the solver, without this the moved shapes would be found at their old
+            # place by collisions and raycasts
+            physics_space.reindex_shape(sprite.get_shape())
+
+            sprite.center_x = x
+            sprite.center_y = y
+
+        # Keep cached copies of the static geometry in sync without rebuilding them
+        drive_backend = self.physics_environment.drive_backend
+
+        if drive_backend is not None and hasattr(drive_backend, "update_static_shapes"):
+            drive_backend.update_static_shapes([sprite.get_shape() for sprite in self.sprites])
+
+        # Cached ray results were measured against the old field
+        for agent in self.agents:
+            if agent.raycast_handler is not None:
+                agent.raycast_handler.clear_cache()
+
+
+class DomainRandomizer:
+    """
+    Draws new physical parameters for a robot every time it is reset and applies them to the existing pymunk body and
+    shape, so nothing has to be rebuilt between episodes.
+
+    Parameters are sampled in vectorized blocks shared by every attached agent, so the per reset cost is a handful of
+    attribute writes no matter how many environments are attached.
+    """
+
+    def __init__(self, mass_range=(0.8, 1.2), friction_range=(0.6, 1.0), damping_range=(0.9, 0.94),
+                 impulse_scale_range=(0.9, 1.1), sensor_noise_range=(0.0, 2.0), field_offset=5.0, seed=None,
+                 block_size=256):
+        """
+        Set up the sampling ranges, each parameter is drawn uniformly from its (low, high) range
+
+        :param mass_range: Mass of the robot
+        :param friction_range: Friction of the robots bounding box
+        :param damping_range: Velocity damping of the robot (Lower numbers = more damping)
+        :param impulse_scale_range: Multiplier on both sides' impulses
+        :param sensor_noise_range: Standard deviation (PX) of the noise added to every ray distance
+        :param field_offset: Largest offset (PX) along each axis of each field element, 0 leaves the field alone.
+            Field elements are only moved in environments holding a single robot, as moving a shared field would
+            change it under the other robots in the middle of their episodes
+        :param seed: Seed of the random generator
+        :param block_size: Number of parameter sets drawn at once
+        """
+
+        self.ranges = {"mass": mass_range,
+                       "friction": friction_range,
+                       "damping": damping_range,
+                       "impulse_scale": impulse_scale_range,
+                       "sensor_noise": sensor_noise_range}
+
+        self.field_offset = field_offset
+        self.block_size = block_size
+
+        self.random_generator = np.random.default_rng(seed)
+
+        # Field elements of every attached physics environment
+        self.field_elements = {}
+        self.field_element_count = 0
+
+        self.block = None
+        self.block_position = block_size
+
+    def attach(self, environment):
+        """
+        Randomize every agent of an environment from now on, the current episode is left as is
+
+        :param environment: VirtualEnvironment, MultiAgentEnvironment or VectorEnvironment
+
+        :return: None
+        """
+
+        # A vector environment is a list of single robot environments
+        if hasattr(environment, "environments"):
+            for child_environment in environment.environments:
+                self.attach(child_environment)
+
+            return
+
+        agents = environment.agents if hasattr(environment, "agents") else [environment.player]
+
+        self.field_elements[environment.physics_environment] = FieldElements(environment.physics_environment,
+                                                                             agents=agents)
+        self.field_element_count = max(len(elements) for elements in self.field_elements.values())
+
+        # Offsets already drawn may not cover the new environment's field
+        self.block_position = self.block_size
+
+        for agent in agents:
+            agent.domain_randomizer = self
+
+            # Every agent gets its own noise stream so results do not depend on the order agents are stepped in
+            agent.sensor_random_generator = np.random.default_rng(self.random_generator.integers(2 ** 63))
+
+    def sample(self, count):
+        """
+        Draw many parameter sets at once
+
+        :param count: Number of parameter sets
+
+        :return: Dictionary of arrays [count] for every name in PARAMETER_NAMES plus "field_offsets" [count, elements, 2]
+        """
+
+        samples = {name: self.random_generator.uniform(low, high, size=count)
+                   for name, (low, high) in self.ranges.items()}
+
+        samples["field_offsets"] = self.random_generator.uniform(-self.field_offset, self.field_offset,
+                                                                 size=(count, self.field_element_count, 2))
+
+        return samples
+
+    def next_parameters(self):
+        """
+        Take the next unused parameter set, drawing a new block when the current one runs out
+
+        :return: Dictionary of values for every name in PARAMETER_NAMES plus "field_offsets"
+        """
+
+        if self.block_position >= self.block_size:
+            self.block = self.sample(self.block_size)
+            self.block_position = 0
+
+        parameters = {name: values[self.block_position] for name, values in self.block.items()}
+        self.block_position += 1
+
+        return parameters
+
+    def randomize(self, agent):
+        """
+        Called by AgentController.reset, apply a fresh parameter set to the agent
+
+        :param agent: The agent being reset
+
+        :return: None
+        """
+
+        self.apply(agent, self.next_parameters())
+
+    def apply(self, agent, parameters):
+        """
+        Apply a parameter set to an agent by changing its existing body and shape
+
+        :param agent: The agent
+        :param parameters: Dictionary as returned by next_parameters
+
+        :return: None
+        """
+
+        body = agent.get_body()
+        mass = float(parameters["mass"])
+
+        body.mass = mass
+        body.moment = pymunk.moment_for_poly(mass=mass, vertices=agent.get_shape().get_vertices())
+
+        agent.get_shape().friction = float(parameters["friction"])
+        agent.damping = float(parameters["damping"])
+        agent.impulse_scale = float(parameters["impulse_scale"])
+        agent.sensor_noise = float(parameters["sensor_noise"])
+
+        field_elements = self.field_elements.get(agent.physics_environment)
+
+        if self.field_offset > 0 and field_elements is not None and field_elements.robot_count == 1:
+            field_elements.move(parameters["field_offsets"][:len(field_elements)])
@@ -1,5 +1,26 @@
-from EasyPhysics import StaticPhysics, PhysicsEnvironment
-from CollisionTypes import CollisionType
+import os
+
+from ..physics_engine.EasyPhysics import StaticPhysics, PhysicsEnvironment
+from ..physics_engine.collision_handling.CollisionTypes import CollisionType
+
+# Size of the field, also used as the window size when it is drawn
+SCREEN_WIDTH = 450
+SCREEN_HEIGHT = 525
+
+# Directory holding every sprite, sprites are loaded by absolute path so the working directory never has to change
+GRAPHICS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Graphics")
+
+
+def get_graphic_path(file_name):
+    """
+    Get the absolute path of a sprite
+
+    :param file_name: File name of the sprite within the graphics directory
+
+    :return: Absolute path of the sprite
+    """
+
+    return os.path.join(GRAPHICS_DIRECTORY, file_name)
 
 
 class EnvironmentGameObjects:
@@ -28,7 +49,7 @@ class EnvironmentGameObjects:
                                                                  initialX=(self.screen_width / 2),
                                                                  initialY=(self.screen_height / 2),
                                                                  collision_type=CollisionType.STATIC_OBJECT,
-                                                                 sprite_path="Cargo Ship.png")
+                                                                 sprite_path=get_graphic_path("Cargo Ship.png"))
         # Create the 4 rocket objects on the sides of the arena
         self.create_rocket_objects()
 
@@ -42,7 +63,7 @@ class EnvironmentGameObjects:
                                                                  initialX=placement_station_x,
                                                                  initialY=placement_station_y,
                                                                  collision_type=CollisionType.STATIC_OBJECT,
-                                                                 sprite_path="Placement.png")
+                                                                 sprite_path=get_graphic_path("Placement.png"))
 
         # Create the placement station goal
         self.static_object_manager.createStaticRectangularObject(width=30,
@@ -50,7 +71,7 @@ class EnvironmentGameObjects:
                                                                  initialX=(placement_station_x + 1),
                                                                  initialY=(placement_station_y - 18),
                                                                  collision_type=CollisionType.GOAL_OBJECT,
-                                                                 sprite_path="Placement_Goal.png")
+                                                                 sprite_path=get_graphic_path("Placement_Goal.png"))
 
     def create_rocket_objects(self):
         """Create all the rocket objects"""
@@ -61,7 +82,7 @@ class EnvironmentGameObjects:
                                                                  initialX=17,
                                                                  initialY=(self.screen_height / 1.6),
                                                                  collision_type=CollisionType.STATIC_OBJECT,
-                                                                 sprite_path="Rocket_Left.png")
+                                                                 sprite_path=get_graphic_path("Rocket_Left.png"))
 
         # Create the Bottom Left Rocket
         self.static_object_manager.createStaticRectangularObject(width=35,
@@ -69,7 +90,7 @@ class EnvironmentGameObjects:
                                                                  initialX=17,
                                                                  initialY=(self.screen_height / 2.6666666667),
                                                                  collision_type=CollisionType.STATIC_OBJECT,
-                                                                 sprite_path="Rocket_Left.png")
+                                                                 sprite_path=get_graphic_path("Rocket_Left.png"))
 
         # Create the Top Right Rocket
         self.static_object_manager.createStaticRectangularObject(width=35,
@@ -77,7 +98,7 @@ class EnvironmentGameObjects:
                                                                  initialX=(self.screen_width - 17),
                                                                  initialY=(self.screen_height / 1.6),
                                                                  collision_type=CollisionType.STATIC_OBJECT,
-                                                                 sprite_path="Rocket_Right.png")
+                                                                 sprite_path=get_graphic_path("Rocket_Right.png"))
 
         # Create the Bottom Right Rocket
         self.static_object_manager.createStaticRectangularObject(width=35,
@@ -85,7 +106,7 @@ class EnvironmentGameObjects:
                                                                  initialX=(self.screen_width - 17),
                                                                  initialY=(self.screen_height / 2.6666666667),
                                                                  collision_type=CollisionType.STATIC_OBJECT,
-                                                                 sprite_path="Rocket_Right.png")
+                                                                 sprite_path=get_graphic_path("Rocket_Right.png"))
 
     def draw_environment_objects(self):
         """Draw the needed environment objects"""
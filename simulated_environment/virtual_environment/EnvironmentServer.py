@@ -0,0 +1,524 @@
+"""Local Environment Server Speaking A Fixed Binary Batched Step Protocol For Out Of Process Trainers
+
+Every message starts with a 16 byte little endian header followed by a payload:
+
+    Header:  magic (4s "FRCS") | version (uint16) | message type (uint16) | environment count (uint32) |
+             payload size in bytes (uint32)
+
+    Requests:
+        INFO   - no payload
+        RESET  - uint8 mask [N], environments with a non zero entry are reset
+        STEP   - float32 actions [N, 2] holding (left_power, right_power)
+        CLOSE  - no payload, ends the connection
+
+    Replies (same message type as the request):
+        INFO   - uint32 environment count | uint32 observation size
+        RESET  - float32 observations [N, 13] holding the latest observation of every environment
+        STEP   - float32 observations [N, 13] | float32 rewards [N] | uint8 dones [N]
+        ERROR  - utf-8 error message
+
+Rays that hit nothing are sent as NaN.
+
+A server given an ObservationCodec sends observations and receives actions as its uint16 codes instead (see
+ObservationCodec.py for the error bounds), and says so with a third field in its INFO reply:
+
+        INFO   - uint32 environment count | uint32 observation size | uint32 encoding (ENCODING_QUANTIZED)
+        STEP   - uint16 action codes [N, 2]                                             (request)
+        RESET  - uint16 observation codes [N, 13]
+        STEP   - uint16 observation codes [N, 13] | float32 rewards [N] | uint8 dones [N]
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import os
+import socket
+import struct
+import traceback
+
+import numpy as np
+
+from .ObservationCodec import ObservationCodec
+
+PROTOCOL_MAGIC = b"FRCS"
+PROTOCOL_VERSION = 1
+
+HEADER = struct.Struct("<4sHHII")
+
+MESSAGE_INFO = 1
+MESSAGE_RESET = 2
+MESSAGE_STEP = 3
+MESSAGE_CLOSE = 4
+MESSAGE_ERROR = 255
+
+OBSERVATION_SIZE = 13
+ACTION_SIZE = 2
+
+# Encodings reported in the INFO reply, servers sending float32 leave the field out
+ENCODING_FLOAT32 = 0
+ENCODING_QUANTIZED = 1
+
+# Largest payload of a rejected request that is read off the socket before replying with an error
+MAXIMUM_DISCARDED_PAYLOAD = 1 << 24
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends a message that does not follow the protocol"""
+
+
+def create_socket(address):
+    """
+    Create an unconnected socket for the given address
+
+    :param address: Path of a Unix socket or a (host, port) tuple for TCP
+
+    :return: The created socket
+    """
+
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    # Small messages go out immediately instead of waiting to be coalesced
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return connection
+
+
+def receive_exactly(connection, buffer: memoryview):
+    """
+    Fill the whole buffer from the socket
+
+    :param connection: Socket to read from
+    :param buffer: Writable buffer to fill
+
+    :return: None
+    """
+
+    received = 0
+
+    while received < len(buffer):
+        count = connection.recv_into(buffer[received:])
+
+        if count == 0:
+            raise ConnectionError("Connection closed by peer")
+
+        received += count
+
+
+def send_message(connection, message_type, environment_count, *payloads):
+    """
+    Frame and send a message
+
+    :param connection: Socket to write to
+    :param message_type: One of the MESSAGE_ constants
+    :param environment_count: Number of environments the payload covers
+    :param payloads: Bytes like objects (or NumPy arrays) sent back to back as the payload
+
+    :return: None
+    """
+
+    payloads = [memoryview(payload).cast("B") for payload in payloads]
+
+    header = HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, message_type, environment_count,
+                         sum(len(payload) for payload in payloads))
+
+    connection.sendall(header)
+
+    for payload in payloads:
+        connection.sendall(payload)
+
+
+def receive_header(connection, header_buffer: bytearray):
+    """
+    Receive and validate a message header
+
+    :param connection: Socket to read from
+    :param header_buffer: Reusable buffer of HEADER.size bytes
+
+    :return: Message type, environment count and payload size
+    """
+
+    receive_exactly(connection, memoryview(header_buffer))
+
+    magic, version, message_type, environment_count, payload_size = HEADER.unpack(header_buffer)
+
+    if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION:
+        raise ProtocolError("Unsupported protocol " + repr(magic) + " version " + str(version))
+
+    return message_type, environment_count, payload_size
+
+
+class EnvironmentServer:
+    """Serves a batched environment to one trainer connection at a time"""
+
+    def __init__(self, environment, address, codec: ObservationCodec = None):
+        """
+        Create the server and bind it to a loopback address
+
+        :param environment: Batched environment with step(actions [N, 2]) and reset(indices) such as VectorEnvironment
+        :param address: Path of a Unix socket or a (host, port) tuple, TCP hosts should be loopback
+        :param codec: ObservationCodec to quantize observations and actions with, None sends them as float32
+        """
+
+        self.environment = environment
+        self.address = address
+        self.codec = codec
+
+        # Latest observation of every environment, RESET replies always cover every environment
+        self.observations = np.array(environment.reset(), dtype=np.float32)
+        self.environment_count = len(self.observations)
+
+        self.rewards = np.zeros(self.environment_count, dtype=np.float32)
+        self.dones = np.zeros(self.environment_count, dtype=np.uint8)
+
+        # Request payloads are received straight into these buffers
+        self.actions = np.zeros((self.environment_count, ACTION_SIZE), dtype=np.float32)
+        self.reset_mask = np.zeros(self.environment_count, dtype=np.uint8)
+        self.header_buffer = bytearray(HEADER.size)
+
+        if codec is not None:
+            self.action_codes = np.zeros((self.environment_count, ACTION_SIZE), dtype=np.uint16)
+
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+
+        self.listener = create_socket(address)
+
+        if not isinstance(address, str):
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        self.listener.bind(address)
+        self.listener.listen(1)
+
+        self.running = False
+
+    def serve_forever(self):
+        """
+        Accept trainer connections one after another until close is called
+
+        :return: None
+        """
+
+        self.running = True
+
+        while self.running:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                # The listener was closed from another thread
+                break
+
+            # Whatever goes wrong with one trainer only ends its connection, the server keeps accepting
+            with connection:
+                try:
+                    self.handle_connection(connection)
+                except (ConnectionError, ProtocolError):
+                    pass
+                except Exception:
+                    traceback.print_exc()
+
+    def handle_connection(self, connection):
+        """
+        Answer requests from one trainer until it disconnects or sends CLOSE
+
+        :param connection: The connected socket
+
+        :return: None
+        """
+
+        if not isinstance(self.address, str):
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        while True:
+            # Unknown until a valid header arrives, a broken header leaves nothing that can be skipped
+            payload_size = None
+
+            try:
+                message_type, environment_count, payload_size = receive_header(connection, self.header_buffer)
+
+                if message_type == MESSAGE_CLOSE:
+                    return
+
+                if environment_count != self.environment_count and message_type != MESSAGE_INFO:
+                    raise ProtocolError("Server holds " + str(self.environment_count) + " environments, request was for "
+                                        + str(environment_count))
+
+                if message_type == MESSAGE_INFO:
+                    self.expect_payload(payload_size, 0)
+
+                    if self.codec is None:
+                        info = struct.pack("<II", self.environment_count, OBSERVATION_SIZE)
+                    else:
+                        info = struct.pack("<III", self.environment_count, OBSERVATION_SIZE, ENCODING_QUANTIZED)
+
+                    send_message(connection, MESSAGE_INFO, self.environment_count, info)
+
+                elif message_type == MESSAGE_RESET:
+                    self.expect_payload(payload_size, self.reset_mask.nbytes)
+                    receive_exactly(connection, memoryview(self.reset_mask))
+
+                    indices = np.nonzero(self.reset_mask)[0]
+
+                    if len(indices) > 0:
+                        self.observations[indices] = self.environment.reset(indices)
+
+                    send_message(connection, MESSAGE_RESET, self.environment_count, self.encoded_observations())
+
+                elif message_type == MESSAGE_STEP:
+                    if self.codec is None:
+                        self.expect_payload(payload_size, self.actions.nbytes)
+                        receive_exactly(connection, memoryview(self.actions).cast("B"))
+                    else:
+                        self.expect_payload(payload_size, self.action_codes.nbytes)
+                        receive_exactly(connection, memoryview(self.action_codes).cast("B"))
+                        self.actions[:] = self.codec.decode_actions(self.action_codes)
+
+                    observations, rewards, dones = self.environment.step(self.actions)
+
+                    self.observations[:] = observations
+                    self.rewards[:] = rewards
+                    self.dones[:] = dones
+
+                    send_message(connection, MESSAGE_STEP, self.environment_count,
+                                 self.encoded_observations(), self.rewards, self.dones)
+
+                else:
+                    raise ProtocolError("Unknown message type " + str(message_type))
+
+            except ProtocolError as error:
+                # Requests are always rejected before their payload is read, so read it to let the trainer finish
+                # sending and receive the error, then drop the trainer as the stream can no longer be trusted
+                if payload_size is not None and payload_size <= MAXIMUM_DISCARDED_PAYLOAD:
+                    receive_exactly(connection, memoryview(bytearray(payload_size)))
+
+                send_message(connection, MESSAGE_ERROR, self.environment_count, str(error).encode("utf-8"))
+                return
+
+            except (ConnectionError, socket.timeout):
+                raise
+
+            except Exception as error:
+                # The environment failed after the payload was read, tell the trainer and drop it
+                traceback.print_exc()
+                send_message(connection, MESSAGE_ERROR, self.environment_count,
+                             ("Environment failed: " + repr(error)).encode("utf-8"))
+                return
+
+    def encoded_observations(self):
+        """
+        The latest observation of every environment as it goes on the wire
+
+        :return: float32 observations, or their uint16 codes if the server has a codec
+        """
+
+        if self.codec is None:
+            return self.observations
+
+        return self.codec.encode_observations(self.observations)
+
+    @staticmethod
+    def expect_payload(payload_size, expected_size):
+        """
+        Check that a request carries the payload size its message type requires
+
+        :param payload_size: Size given in the header
+        :param expected_size: Size the message type requires
+
+        :return: None
+        """
+
+        if payload_size != expected_size:
+            raise ProtocolError("Expected a payload of " + str(expected_size) + " bytes but got " + str(payload_size))
+
+    def close(self):
+        """
+        Stop serving and release the socket
+
+        :return: None
+        """
+
+        self.running = False
+
+        # Shutting the listener down wakes up a serve_forever blocked in accept on another thread
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.listener.close()
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class EnvironmentClient:
+    """Trainer side of the protocol"""
+
+    def __init__(self, address, codec: ObservationCodec = None):
+        """
+        Connect to a running EnvironmentServer
+
+        :param address: Path of a Unix socket or a (host, port) tuple
+        :param codec: ObservationCodec matching the server's, only used if the server quantizes. Defaults to the default
+            ranges
+        """
+
+        self.connection = create_socket(address)
+        self.connection.connect(address)
+
+        self.header_buffer = bytearray(HEADER.size)
+
+        send_message(self.connection, MESSAGE_INFO, 0)
+        payload = self.receive_reply(MESSAGE_INFO)
+
+        self.environment_count, self.observation_size = struct.unpack_from("<II", payload)
+        encoding, = struct.unpack_from("<I", payload, 8) if len(payload) > 8 else (ENCODING_FLOAT32,)
+
+        # The server decides the encoding, the client follows
+        if encoding == ENCODING_QUANTIZED:
+            self.codec = codec if codec is not None else ObservationCodec()
+            self.observation_dtype = np.uint16
+        else:
+            self.codec = None
+            self.observation_dtype = np.float32
+
+        observation_bytes = np.dtype(self.observation_dtype).itemsize
+
+        # Replies are received into one reusable buffer
+        self.step_reply = bytearray((self.environment_count * self.observation_size * observation_bytes) +
+                                    (self.environment_count * 4) + self.environment_count)
+
+    def receive_reply(self, expected_type, buffer: bytearray = None):
+        """
+        Receive a reply and raise if the server reported an error
+
+        :param expected_type: Message type the reply should have
+        :param buffer: Buffer to receive the payload into, a new one is created if not given
+
+        :return: The payload
+        """
+
+        message_type, _, payload_size = receive_header(self.connection, self.header_buffer)
+
+        if buffer is None or len(buffer) != payload_size:
+            buffer = bytearray(payload_size)
+
+        receive_exactly(self.connection, memoryview(buffer))
+
+        if message_type == MESSAGE_ERROR:
+            raise ProtocolError(buffer.decode("utf-8"))
+
+        if message_type != expected_type:
+            raise ProtocolError("Expected reply type " + str(expected_type) + " but got " + str(message_type))
+
+        return buffer
+
+    def reset(self, mask=None):
+        """
+        Reset some or all of the environments
+
+        :param mask: Boolean mask of the environments to reset, defaults to every environment
+
+        :return: Latest observation of every environment as float32 [N, 13]
+        """
+
+        if mask is None:
+            mask = np.ones(self.environment_count, dtype=np.uint8)
+
+        send_message(self.connection, MESSAGE_RESET, self.environment_count, np.ascontiguousarray(mask, dtype=np.uint8))
+        payload = self.receive_reply(MESSAGE_RESET)
+
+        return self.decode_observations(np.frombuffer(payload, dtype=self.observation_dtype))
+
+    def decode_observations(self, observations):
+        """
+        Turn the observations of a reply into float32 [N, 13]
+
+        :param observations: Flat float32 observations or uint16 codes straight from the payload
+
+        :return: float32 observations [N, 13]
+        """
+
+        observations = observations.reshape(self.environment_count, self.observation_size)
+
+        if self.codec is None:
+            return observations
+
+        return self.codec.decode_observations(observations, dtype=np.float32)
+
+    def step(self, actions):
+        """
+        Step every environment on the server
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every environment
+
+        :return: Observations float32 [N, 13], Rewards float32 [N], Dones bool [N]. The arrays are only valid until the
+            next call to step
+        """
+
+        if self.codec is None:
+            actions = np.ascontiguousarray(actions, dtype=np.float32)
+        else:
+            actions = self.codec.encode_actions(actions)
+
+        send_message(self.connection, MESSAGE_STEP, self.environment_count, actions)
+        payload = self.receive_reply(MESSAGE_STEP, self.step_reply)
+
+        observation_count = self.environment_count * self.observation_size
+        observations = np.frombuffer(payload, dtype=self.observation_dtype, count=observation_count)
+
+        observation_bytes = observations.nbytes
+        rewards = np.frombuffer(payload, dtype=np.float32, count=self.environment_count, offset=observation_bytes)
+        dones = np.frombuffer(payload, dtype=np.uint8, count=self.environment_count,
+                              offset=observation_bytes + self.environment_count * 4)
+
+        return self.decode_observations(observations), rewards, dones.astype(bool)
+
+    def close(self):
+        """
+        Tell the server the trainer is done and disconnect
+
+        :return: None
+        """
+
+        try:
+            send_message(self.connection, MESSAGE_CLOSE, self.environment_count)
+        finally:
+            self.connection.close()
+
+
+if __name__ == '__main__':
+    from .VectorEnvironment import VectorEnvironment
+    from .MetricsRegistry import MetricsRegistry, MetricsExporter
+
+    parser = argparse.ArgumentParser(description="Serve headless environments to an out of process trainer")
+    parser.add_argument("--environments", type=int, default=1, help="Number of independent environments to serve")
+    parser.add_argument("--unix", help="Path of the Unix socket to listen on")
+    parser.add_argument("--port", type=int, default=5757, help="Loopback TCP port to listen on if --unix is not given")
+    parser.add_argument("--quantized", action="store_true", help="Send observations and receive actions as 16 bit codes")
+    parser.add_argument("--metrics-file", help="File to write the step and episode metrics to every few seconds")
+    parser.add_argument("--metrics-port", type=int, help="Loopback port to serve the metrics on at /metrics")
+    arguments = parser.parse_args()
+
+    metrics = None
+    exporter = None
+
+    if arguments.metrics_file or arguments.metrics_port is not None:
+        metrics = MetricsRegistry()
+        exporter = MetricsExporter(metrics, path=arguments.metrics_file, port=arguments.metrics_port)
+
+    server = EnvironmentServer(environment=VectorEnvironment(environment_count=arguments.environments, metrics=metrics),
+                               address=arguments.unix if arguments.unix else ("127.0.0.1", arguments.port),
+                               codec=ObservationCodec() if arguments.quantized else None)
+
+    print("Serving " + str(arguments.environments) + " environments")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+        if exporter is not None:
+            exporter.close()
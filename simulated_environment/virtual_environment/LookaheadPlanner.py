@@ -0,0 +1,249 @@
+"""Batched Lookahead Rollouts From An Arbitrary Environment State For Planning And MPC"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ..physics_engine.BodyStateArray import BodyStateArray
+from .DomainRandomization import FieldElements
+from .MultiAgentEnvironment import MultiAgentEnvironment
+
+# Scratch environments of the current worker process by their environment options, built the first time they are needed
+worker_environments = {}
+
+
+def capture_environment_options(environment):
+    """
+    Read the options a scratch environment has to be built with to simulate like the given one
+
+    :param environment: VirtualEnvironment or a single robot MultiAgentEnvironment, it is only read
+
+    :return: Tuple of (name, value) pairs of MultiAgentEnvironment keyword arguments, usable as a dictionary key
+    """
+
+    physics_environment = environment.physics_environment
+
+    return (("screen_width", physics_environment.window_width),
+            ("screen_height", physics_environment.window_height),
+            ("simulation_accuracy", physics_environment.physics_space.iterations),
+            ("step_length", physics_environment.step_length),
+            ("kinematic_drive", physics_environment.drive_backend is not None))
+
+
+def capture_robot_parameters(agent):
+    """
+    Read the physical parameters of a robot, whether they were given at construction or drawn by a DomainRandomizer
+
+    :param agent: The AgentController
+
+    :return: Dictionary of the parameters
+    """
+
+    return {"mass": agent.get_body().mass,
+            "moment": agent.get_body().moment,
+            "friction": agent.get_shape().friction,
+            "damping": agent.damping,
+            "impulse_scale": agent.impulse_scale,
+            "left_impulse_point": tuple(agent.left_impulse_point),
+            "right_impulse_point": tuple(agent.right_impulse_point)}
+
+
+def apply_robot_parameters(agent, parameters):
+    """
+    Give a robot the physical parameters read by capture_robot_parameters
+
+    :param agent: The AgentController
+    :param parameters: Dictionary returned by capture_robot_parameters
+
+    :return: None
+    """
+
+    agent.get_body().mass = parameters["mass"]
+    agent.get_body().moment = parameters["moment"]
+    agent.get_shape().friction = parameters["friction"]
+    agent.damping = parameters["damping"]
+    agent.impulse_scale = parameters["impulse_scale"]
+    agent.left_impulse_point = parameters["left_impulse_point"]
+    agent.right_impulse_point = parameters["right_impulse_point"]
+
+
+def get_field_positions(physics_environment):
+    """
+    Read where the field elements a DomainRandomizer may move are, every static sprite except the goal
+
+    :param physics_environment: The physics environment
+
+    :return: Positions [elements, 2]
+    """
+
+    return np.array([tuple(sprite.get_position()) for sprite in list(physics_environment.sprite_list)[:-1]],
+                    dtype=np.float64).reshape(-1, 2)
+
+
+def capture_state(environment):
+    """
+    Capture everything needed to continue a single robot environment from its current state
+
+    Sensor noise is left out, candidates are scored on noiseless rays so identical sequences score identically
+
+    :param environment: VirtualEnvironment or a single robot MultiAgentEnvironment, it is only read
+
+    :return: Tuple of (body states [bodies, 6], agent training state, robot parameters, field element positions
+        [elements, 2], environment options)
+    """
+
+    agent = environment.agents[0] if hasattr(environment, "agents") else environment.player
+
+    return (BodyStateArray([environment.physics_environment]).read(), agent.get_training_state(),
+            capture_robot_parameters(agent), get_field_positions(environment.physics_environment),
+            capture_environment_options(environment))
+
+
+def get_scratch_environment(environments, environment_options):
+    """
+    Get the scratch environment built with some options, building it the first time
+
+    :param environments: Dictionary of environment options to (scratch environment, its FieldElements)
+    :param environment_options: Options returned by capture_environment_options
+
+    :return: Tuple of (scratch environment, its FieldElements)
+    """
+
+    if environment_options not in environments:
+        environment = MultiAgentEnvironment(robot_count=1, **dict(environment_options))
+        environments[environment_options] = (environment, FieldElements(environment.physics_environment,
+                                                                        environment.agents))
+
+    return environments[environment_options]
+
+
+def rollout(environment: MultiAgentEnvironment, field_elements: FieldElements, state, action_sequences, discount):
+    """
+    Simulate every action sequence from the same starting state, one after another
+
+    :param environment: Scratch single robot environment to simulate in, built with the captured environment options
+    :param field_elements: FieldElements of the scratch environment
+    :param state: Tuple returned by capture_state
+    :param action_sequences: Array shaped like [K, H, 2]
+    :param discount: Discount applied to each later step reward
+
+    :return: Returns [K], final observations [K, 13], whether each sequence ended its episode [K]
+    """
+
+    physics_state, training_state, robot_parameters, field_positions, _ = state
+
+    agent = environment.agents[0]
+    body_states = BodyStateArray([environment.physics_environment])
+
+    # Simulate the same robot on the same field as the live environment
+    apply_robot_parameters(agent, robot_parameters)
+
+    # Moving the field reindexes every element, so only do it when the live field differs from the scratch one
+    if not np.array_equal(field_positions, get_field_positions(environment.physics_environment)):
+        field_elements.move(field_positions - field_elements.nominal_positions)
+
+    sequence_count, horizon = action_sequences.shape[:2]
+
+    returns = np.zeros(sequence_count, dtype=np.float64)
+    final_observations = np.zeros((sequence_count, 13), dtype=np.float64)
+    dones = np.zeros(sequence_count, dtype=bool)
+
+    for sequence in range(sequence_count):
+        body_states.write(physics_state)
+        agent.set_training_state(training_state)
+
+        scale = 1.0
+        observation = None
+
+        for step in range(horizon):
+            observation, reward, done = environment.step(action_sequences[sequence, step][None, :])
+
+            returns[sequence] += scale * reward[0]
+            scale *= discount
+
+            # Rewards after the end of the episode are not part of the return
+            if done[0]:
+                dones[sequence] = True
+                break
+
+        if observation is not None:
+            final_observations[sequence] = observation[0]
+
+    return returns, final_observations, dones
+
+
+def rollout_in_worker(state, action_sequences, discount):
+    """Run rollout in the scratch environment of the worker process matching the captured environment options"""
+
+    environment, field_elements = get_scratch_environment(worker_environments, state[-1])
+    return rollout(environment, field_elements, state, action_sequences, discount)
+
+
+class LookaheadPlanner:
+    """Evaluates candidate action sequences from a state without touching the live environment"""
+
+    def __init__(self, worker_count=0):
+        """
+        Create the worker processes, scratch environments are built the first time a state with their environment
+        options is evaluated
+
+        :param worker_count: Number of worker processes to spread the candidates over, 0 simulates in this process
+        """
+
+        self.worker_count = worker_count
+
+        # Scratch environments of this process by their environment options
+        self.environments = {}
+
+        self.pool = ProcessPoolExecutor(max_workers=worker_count) if worker_count > 0 else None
+
+    def evaluate(self, environment, action_sequences, discount=1.0):
+        """
+        Simulate K candidate action sequences of horizon H from the current state of an environment
+
+        :param environment: The live single robot environment (VirtualEnvironment or MultiAgentEnvironment), only read
+        :param action_sequences: Array shaped like [K, H, 2] of (left_power, right_power)
+        :param discount: Discount applied to each later step reward
+
+        :return: Returns [K], final observations [K, 13], whether each sequence ended its episode [K]
+        """
+
+        return self.evaluate_state(capture_state(environment), action_sequences, discount)
+
+    def evaluate_state(self, state, action_sequences, discount=1.0):
+        """
+        Simulate K candidate action sequences of horizon H from a captured state
+
+        :param state: Tuple returned by capture_state
+        :param action_sequences: Array shaped like [K, H, 2] of (left_power, right_power)
+        :param discount: Discount applied to each later step reward
+
+        :return: Returns [K], final observations [K, 13], whether each sequence ended its episode [K]
+        """
+
+        action_sequences = np.asarray(action_sequences, dtype=np.float64)
+
+        if self.pool is None:
+            environment, field_elements = get_scratch_environment(self.environments, state[-1])
+            return rollout(environment, field_elements, state, action_sequences, discount)
+
+        # One contiguous block of candidates per worker keeps the number of messages low
+        blocks = [block for block in np.array_split(action_sequences, self.worker_count) if len(block) > 0]
+        results = list(self.pool.map(rollout_in_worker, [state] * len(blocks), blocks, [discount] * len(blocks)))
+
+        return (np.concatenate([result[0] for result in results]),
+                np.concatenate([result[1] for result in results]),
+                np.concatenate([result[2] for result in results]))
+
+    def close(self):
+        """
+        Stop the worker processes
+
+        :return: None
+        """
+
+        if self.pool is not None:
+            self.pool.shutdown()
@@ -0,0 +1,128 @@
+"""Measures Memory Used Per Environment When Many Environments Share One Process
+
+Every environment is built and stepped once in a fresh interpreter, so the numbers are not skewed by whatever the
+calling process already allocated:
+
+    python -m simulated_environment.virtual_environment.MemoryBenchmark --count 1000 --output memory.jsonl
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from .StartupBenchmark import PACKAGE_PARENT
+
+# Code run in every fresh interpreter. The resident set size is read from /proc/self/statm where it exists, otherwise
+# the peak from resource is used, which only differs when memory was freed in between. Tracing slows construction down
+# and takes memory of its own, so it is only turned on in a separate run
+MEASUREMENT_SCRIPT = """
+import json, os, sys, tracemalloc
+from simulated_environment.virtual_environment.MultiAgentEnvironment import MultiAgentEnvironment
+from simulated_environment.virtual_environment.EnvironmentObjectManager import SCREEN_WIDTH, SCREEN_HEIGHT
+
+def resident_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def build(count):
+    environments = {construction}
+    for environment in environments:
+        environment.step([(50, 50)] * environment.robot_count)
+    return environments
+
+# One environment is built first so lazily created module state is not counted against the rest
+warm_up = build(1)
+
+if {trace}:
+    tracemalloc.start()
+
+resident_before = resident_bytes()
+environments = build({count})
+resident_after = resident_bytes()
+
+print(json.dumps({{"resident_bytes": resident_after - resident_before,
+                   "traced_bytes": tracemalloc.get_traced_memory()[0] if {trace} else None}}))
+"""
+
+# How each mode builds a list of environments holding count robots in total, each running an independent episode
+MODES = {
+    "default": "[MultiAgentEnvironment(robot_count=1) for _ in range(count)]",
+    "lean": "[MultiAgentEnvironment(robot_count=1, lean=True) for _ in range(count)]",
+    "shared": "[MultiAgentEnvironment(robot_count=count, start_positions=[(SCREEN_WIDTH / 1.3, SCREEN_HEIGHT / 7)] * count, lean=True, "
+              "robots_collide=False)]",
+}
+
+
+def measure_memory(count=500, mode="default", trace=False):
+    """
+    Start a fresh interpreter, build and step a number of environments and measure how much memory they took
+
+    :param count: Number of environments to build
+    :param mode: Name of the entry in MODES to build them with
+    :param trace: Whether the Python heap is measured with tracemalloc as well
+
+    :return: Dictionary of resident_bytes (growth of the resident set size) and traced_bytes (Python allocations still
+        alive, None unless traced)
+    """
+
+    script = MEASUREMENT_SCRIPT.format(count=int(count), construction=MODES[mode], trace=bool(trace))
+
+    environment_variables = dict(os.environ)
+    environment_variables["PYTHONPATH"] = os.pathsep.join(
+        [PACKAGE_PARENT] + ([environment_variables["PYTHONPATH"]] if environment_variables.get("PYTHONPATH") else []))
+
+    completed = subprocess.run([sys.executable, "-c", script], env=environment_variables, stdout=subprocess.PIPE,
+                               check=True, universal_newlines=True)
+
+    # The result is the last line, anything printed while building the environments comes before it
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def benchmark_memory(count=500, mode="default"):
+    """
+    Measure the memory of a number of environments and divide it up per environment
+
+    :param count: Number of environments to build
+    :param mode: Name of the entry in MODES to build them with
+
+    :return: Dictionary with the resident and traced bytes per environment
+    """
+
+    resident = measure_memory(count, mode, trace=False)
+    traced = measure_memory(count, mode, trace=True)
+
+    return {"count": count,
+            "mode": mode,
+            "timestamp": time.time(),
+            "resident_bytes_per_environment": resident["resident_bytes"] / count,
+            "traced_bytes_per_environment": traced["traced_bytes"] / count}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure memory used per environment")
+    parser.add_argument("--count", type=int, default=500, help="Number of environments built in each interpreter")
+    parser.add_argument("--mode", choices=sorted(MODES), action="append", help="Environment mode to measure, "
+                                                                               "defaults to every one")
+    parser.add_argument("--output", help="JSON lines file to append the results to, for tracking over time")
+    arguments = parser.parse_args()
+
+    for benchmark_mode in arguments.mode or sorted(MODES):
+        memory = benchmark_memory(arguments.count, benchmark_mode)
+
+        print("{:<8} {:5d} environments  resident {:8.1f} KB/env  python heap {:8.1f} KB/env".format(
+            benchmark_mode, memory["count"], memory["resident_bytes_per_environment"] / 1024,
+            memory["traced_bytes_per_environment"] / 1024))
+
+        if arguments.output:
+            with open(arguments.output, "a") as output_file:
+                output_file.write(json.dumps(memory) + "\n")
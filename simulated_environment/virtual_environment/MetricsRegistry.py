@@ -0,0 +1,431 @@
+"""Counters, Gauges And Histograms Of A Training Run, Exported As Prometheus Style Text
+
+Metrics are plain Python attributes updated without locks from the simulation thread. The exporter thread only reads
+them, and a read racing an update is at worst one update behind, so the step loop never waits on anything.
+
+The exposition is written periodically to a text file (atomically replaced, for node exporter's textfile collector or
+just tail) and/or served at http://127.0.0.1:<port>/metrics:
+
+    registry = MetricsRegistry()
+    environment = MultiAgentEnvironment(metrics=registry)
+    exporter = MetricsExporter(registry, path="metrics.prom", port=9464)
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import bisect
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper edges of the default episode length (steps) and episode return buckets, the last bucket holds everything above
+EPISODE_LENGTH_EDGES = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+EPISODE_RETURN_EDGES = (-150, -100, -50, -10, 0, 10, 50, 100, 150)
+
+
+def format_value(value):
+    """Format a sample value the way the text exposition format expects"""
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Value that only ever goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+
+class Gauge:
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+
+class RateGauge(Gauge):
+    """Gauge holding how quickly a counter grew per second between the last two exports"""
+
+    def __init__(self, name, description, counter: Counter, clock=time.perf_counter):
+        """
+        :param name: Name of the gauge
+        :param description: Help text
+        :param counter: Counter whose rate is measured
+        :param clock: Monotonic clock returning seconds
+        """
+
+        super().__init__(name, description)
+
+        self.counter = counter
+        self.clock = clock
+
+        self.last_value = counter.value
+        self.last_time = clock()
+
+    def update(self):
+        """
+        Measure the rate since the last update, called by the exporter so the step loop never pays for it
+
+        :return: None
+        """
+
+        now = self.clock()
+        value = self.counter.value
+
+        if now > self.last_time:
+            self.value = (value - self.last_value) / (now - self.last_time)
+
+        self.last_value = value
+        self.last_time = now
+
+
+class Histogram:
+    """Counts of observed values per bucket, plus their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, edges):
+        """
+        :param name: Name of the histogram
+        :param description: Help text
+        :param edges: Increasing upper edges of the buckets
+        """
+
+        self.name = name
+        self.description = description
+        self.edges = tuple(edges)
+
+        self.buckets = [0] * (len(self.edges) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.edges, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+
+        for upper_edge, count in zip(self.edges + (math.inf,), list(self.buckets)):
+            cumulative += count
+            samples.append((self.name + "_bucket", '{le="' + format_value(float(upper_edge)) + '"}', cumulative))
+
+        samples.append((self.name + "_sum", "", self.sum))
+        samples.append((self.name + "_count", "", self.count))
+
+        return samples
+
+
+class MetricsRegistry:
+    """Every metric of a process by name, asking for an existing name returns the metric already registered"""
+
+    def __init__(self, prefix="frc_"):
+        """
+        :param prefix: Prepended to the name of every metric
+        """
+
+        self.prefix = prefix
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, metric_type, name, *arguments):
+        """
+        Get or create a metric
+
+        :param metric_type: Class of the metric
+        :param name: Name of the metric without the prefix
+        :param arguments: Description and any further constructor arguments
+
+        :return: The metric
+        """
+
+        name = self.prefix + name
+
+        # Only registration takes the lock, updating a metric never does
+        with self.lock:
+            metric = self.metrics.get(name)
+
+            if metric is None:
+                metric = metric_type(name, *arguments)
+                self.metrics[name] = metric
+
+            elif type(metric) is not metric_type:
+                raise ValueError("Metric " + name + " is already registered as a " + type(metric).__name__)
+
+        return metric
+
+    def counter(self, name, description):
+        return self.register(Counter, name, description)
+
+    def gauge(self, name, description):
+        return self.register(Gauge, name, description)
+
+    def rate(self, name, description, counter: Counter):
+        return self.register(RateGauge, name, description, counter)
+
+    def histogram(self, name, description, edges):
+        return self.register(Histogram, name, description, edges)
+
+    def update_rates(self):
+        """
+        Update every RateGauge
+
+        :return: None
+        """
+
+        for metric in list(self.metrics.values()):
+            if isinstance(metric, RateGauge):
+                metric.update()
+
+    def exposition(self):
+        """
+        Render every metric in the Prometheus text exposition format
+
+        :return: The text
+        """
+
+        lines = []
+
+        for metric in list(self.metrics.values()):
+            lines.append("# HELP " + metric.name + " " + metric.description)
+            lines.append("# TYPE " + metric.name + " " + metric.kind)
+
+            for name, labels, value in metric.samples():
+                lines.append(name + labels + " " + format_value(value))
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the exposition to a file, replacing it atomically so readers never see half of it
+
+        :param path: Path of the file
+
+        :return: None
+        """
+
+        with open(path + ".partial", "w") as metrics_file:
+            metrics_file.write(self.exposition())
+
+        os.replace(path + ".partial", path)
+
+
+class EpisodeMetrics:
+    """Step, episode, goal and collision counters plus episode length and return histograms of a set of robots"""
+
+    def __init__(self, registry: MetricsRegistry, robot_count):
+        """
+        Register the metrics, robots of every environment sharing the registry add up into the same metrics
+
+        :param registry: Registry to register the metrics in
+        :param robot_count: Number of robots whose episodes are followed
+        """
+
+        self.steps = registry.counter("steps_total", "Simulation steps taken, counting every robot")
+        self.episodes = registry.counter("episodes_total", "Episodes finished")
+        self.goals = registry.counter("goals_total", "Episodes finished by reaching the goal")
+        self.collisions = registry.counter("collisions_total", "Episodes finished by hitting the field")
+        self.steps_per_second = registry.rate("steps_per_second", "Simulation steps per second, counting every robot",
+                                              self.steps)
+
+        self.episode_length = registry.histogram("episode_length_steps", "Steps per finished episode",
+                                                 EPISODE_LENGTH_EDGES)
+        self.episode_return = registry.histogram("episode_return", "Total reward of every finished episode",
+                                                 EPISODE_RETURN_EDGES)
+
+        self.robot_count = robot_count
+
+        # Progress of the running episode of every robot, plain lists as NumPy costs more than it saves for the handful
+        # of robots a step usually has
+        self.returns = [0.0] * robot_count
+        self.lengths = [0] * robot_count
+
+        # Robots whose episode ended and that keep stepping until they are reset
+        self.finished = [False] * robot_count
+
+    def record_step(self, rewards, dones, agents):
+        """
+        Record one step of every robot
+
+        :param rewards: Step rewards as a NumPy array [N]
+        :param dones: Episode completion statuses as a NumPy array [N]
+        :param agents: Agents of the robots, read for hit_goal once an episode ends
+
+        :return: None
+        """
+
+        self.steps.inc(self.robot_count)
+
+        returns = self.returns
+        lengths = self.lengths
+
+        # Robots that already finished keep adding up too, their totals are never read again before the reset
+        for index, reward in enumerate(rewards.tolist()):
+            returns[index] += reward
+            lengths[index] += 1
+
+        dones = dones.tolist()
+
+        if True not in dones:
+            return
+
+        for index, done in enumerate(dones):
+            # Episodes are only counted on the step they end
+            if not done or self.finished[index]:
+                continue
+
+            self.episodes.inc()
+
+            if agents[index].hit_goal:
+                self.goals.inc()
+            else:
+                self.collisions.inc()
+
+            self.episode_length.observe(lengths[index])
+            self.episode_return.observe(returns[index])
+
+            self.finished[index] = True
+
+    def reset(self, robot_indices):
+        """
+        Start following new episodes
+
+        :param robot_indices: Iterable of the indices of the robots being reset
+
+        :return: None
+        """
+
+        for index in robot_indices:
+            self.returns[index] = 0.0
+            self.lengths[index] = 0
+            self.finished[index] = False
+
+
+class MetricsExporter:
+    """Background thread writing the metrics to a file every interval and/or serving them over loopback HTTP"""
+
+    def __init__(self, registry: MetricsRegistry, path=None, port=None, interval=5.0, host="127.0.0.1"):
+        """
+        Start exporting
+
+        :param registry: Registry to export
+        :param path: File to write the exposition to every interval, None writes no file
+        :param port: Port to serve GET /metrics on, None serves nothing. 0 picks a free port (see bound_address)
+        :param interval: Seconds between updates of the rates and writes of the file
+        :param host: Address to serve on, keep it loopback
+        """
+
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+
+        self.stopped = threading.Event()
+
+        self.http_server = None
+        self.bound_address = None
+
+        if port is not None:
+            self.http_server = ThreadingHTTPServer((host, port), self.create_handler())
+            self.http_server.daemon_threads = True
+            self.bound_address = self.http_server.server_address[:2]
+
+            threading.Thread(target=self.http_server.serve_forever, name="MetricsHTTP", daemon=True).start()
+
+        self.thread = threading.Thread(target=self.export_loop, name="MetricsExporter", daemon=True)
+        self.thread.start()
+
+    def create_handler(self):
+        """
+        Create the request handler class serving this registry
+
+        :return: BaseHTTPRequestHandler subclass
+        """
+
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = registry.exposition().encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes would otherwise print a line each
+                pass
+
+        return MetricsHandler
+
+    def export(self):
+        """
+        Update the rates and write the file once
+
+        :return: None
+        """
+
+        self.registry.update_rates()
+
+        if self.path is not None:
+            self.registry.write(self.path)
+
+    def export_loop(self):
+        """
+        Body of the exporter thread
+
+        :return: None
+        """
+
+        while not self.stopped.wait(self.interval):
+            self.export()
+
+    def close(self):
+        """
+        Stop exporting, writing the file one last time
+
+        :return: None
+        """
+
+        self.stopped.set()
+        self.thread.join()
+
+        self.export()
+
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
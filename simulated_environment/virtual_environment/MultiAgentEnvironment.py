@@ -0,0 +1,288 @@
+"""Headless Environment Holding Many Robots Within A Single Shared Physics Space"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+
+from ..physics_engine.EasyPhysics import *
+from ..physics_engine.KinematicDrive import KinematicDriveBackend
+from ..physics_engine.collision_handling.CollisionTypes import CollisionType
+from .EnvironmentObjectManager import EnvironmentGameObjects, SCREEN_WIDTH, SCREEN_HEIGHT
+from .AgentController import AgentController
+from .MetricsRegistry import MetricsRegistry, EpisodeMetrics
+
+
+class MultiAgentEnvironment:
+    """Runs N robots in one physics environment that all share the same static field"""
+
+    def __init__(self, robot_count=1, start_positions=None, robots_visible_to_rays=False,
+                 robot_collisions_end_episode=False, kinematic_drive=False, screen_width=SCREEN_WIDTH,
+                 screen_height=SCREEN_HEIGHT, simulation_accuracy=45, step_length=0.01, agent_options=None,
+                 raycast_cache_tolerance=None, lean=False, robots_collide=True, metrics: MetricsRegistry = None):
+        """
+        Create the shared physics environment, the static field and every robot
+
+        :param robot_count: How many robots to create in the space
+        :param start_positions: List of (x, y) starting positions, one per robot. By default a single robot starts in
+            the standard position and multiple robots are spread evenly along the standard starting row
+        :param robots_visible_to_rays: Whether or not the raycasts of each robot can see the other robots
+        :param robot_collisions_end_episode: Whether or not two robots colliding ends the episode for both of them
+        :param kinematic_drive: Whether or not to skip the rigid body solver while every robot is in the open field
+        :param screen_width: Width of the field
+        :param screen_height: Height of the field
+        :param simulation_accuracy: Solver iterations of the physics space
+        :param step_length: Simulated time of one step in seconds
+        :param agent_options: Extra keyword arguments for every AgentController (mass, friction, damping, impulse points)
+        :param raycast_cache_tolerance: Position tolerance (PX) of the pose keyed raycast cache, None disables it. The
+            cache is never used when the rays can see other robots, as they move independently of the robot casting
+        :param lean: Whether to keep the per environment memory small, for running thousands of environments in one
+            process. The static field shares the single static body of the space and ray queries are dropped as soon
+            as their distances are known, so the rays can no longer be drawn
+        :param robots_collide: Whether the robots physically collide with each other. Without collisions (and without
+            rays seeing other robots) every robot runs an independent episode, so one space can hold many environments
+            that share the field, the solver and its buffers instead of each paying for its own
+        :param metrics: MetricsRegistry to count steps, episodes, goals and collisions and record episode lengths and
+            returns in, None records nothing
+        """
+
+        self.robot_count = robot_count
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+
+        # Create a new physics environment to control physics from
+        self.physics_environment = PhysicsEnvironment(window_width=screen_width,
+                                                      window_height=screen_height,
+                                                      simulation_accuracy=simulation_accuracy,
+                                                      step_length=step_length,
+                                                      lean=lean)
+
+        # The static field is built once and shared by every robot
+        self.StaticObjectManager = EnvironmentGameObjects(physics_environment=self.physics_environment,
+                                                          screen_width=screen_width,
+                                                          screen_height=screen_height)
+
+        if start_positions is None:
+            start_positions = self.default_start_positions()
+
+        if len(start_positions) != robot_count:
+            raise ValueError("Expected " + str(robot_count) + " start positions but got " + str(len(start_positions)))
+
+        if agent_options is None:
+            agent_options = {}
+
+        self.agents = []
+        self.raycast_handlers = []
+
+        # Robots that do not collide leave their own category out of the categories they collide with
+        if robots_collide:
+            robot_mask = pymunk.ShapeFilter.ALL_MASKS
+        else:
+            robot_mask = pymunk.ShapeFilter.ALL_MASKS ^ DYNAMIC_OBJECT_CATEGORY
+
+        # Lookup from a robots bounding box to the agent that owns it, used to route collisions to the right robot
+        self.agents_by_shape = {}
+
+        for index, (x, y) in enumerate(start_positions):
+
+            # Each robot gets its own non zero group so its own rays never hit its own bounding box
+            robot_group = index + 1
+
+            agent = AgentController(physics_environment=self.physics_environment,
+                                    screen_width=screen_width,
+                                    screen_height=screen_height,
+                                    initialX=x,
+                                    initialY=y,
+                                    shape_filter=pymunk.ShapeFilter(group=robot_group,
+                                                                    categories=DYNAMIC_OBJECT_CATEGORY,
+                                                                    mask=robot_mask),
+                                    **agent_options)
+
+            # Either see the whole space (minus the robot itself) or only the static field
+            if robots_visible_to_rays:
+                ray_mask = pymunk.ShapeFilter.ALL_MASKS
+            else:
+                ray_mask = pymunk.ShapeFilter.ALL_MASKS ^ DYNAMIC_OBJECT_CATEGORY
+
+            raycast_handler = RaycastHandler(physics_environment=self.physics_environment,
+                                             player=agent,
+                                             shape_filter=pymunk.ShapeFilter(group=robot_group, mask=ray_mask),
+                                             cache_tolerance=None if robots_visible_to_rays else
+                                             raycast_cache_tolerance,
+                                             keep_casts=not lean)
+            agent.set_raycast_handler(raycast_handler)
+
+            self.agents.append(agent)
+            self.raycast_handlers.append(raycast_handler)
+            self.agents_by_shape[agent.get_shape()] = agent
+
+        # Route general static object collisions to the robot that was hit
+        self.physics_environment.createCollisionHandler(firstCollisionType=CollisionType.STATIC_OBJECT,
+                                                        secondCollisionType=CollisionType.DYNAMIC_OBJECT,
+                                                        callback=self.create_collision_dispatcher("on_static_collision"))
+
+        # Route goal collisions to the robot that reached the goal
+        self.physics_environment.createCollisionHandler(firstCollisionType=CollisionType.GOAL_OBJECT,
+                                                        secondCollisionType=CollisionType.DYNAMIC_OBJECT,
+                                                        callback=self.create_collision_dispatcher("on_goal_collision"))
+
+        # Robot on robot contact is treated like hitting a wall for both robots if requested
+        if robot_collisions_end_episode:
+            self.physics_environment.createCollisionHandler(firstCollisionType=CollisionType.DYNAMIC_OBJECT,
+                                                            secondCollisionType=CollisionType.DYNAMIC_OBJECT,
+                                                            callback=self.create_collision_dispatcher(
+                                                                "on_static_collision", notify_both=True))
+
+        # The backend caches the static field so it has to be created after everything has been added to the space
+        if kinematic_drive:
+            self.physics_environment.drive_backend = KinematicDriveBackend(physics_environment=self.physics_environment)
+
+            # Row of every robot in the state arrays of the backend, which drives and damps them all at once
+            backend_bodies = self.physics_environment.drive_backend.body_states.bodies
+            self.agent_rows = np.array([backend_bodies.index(agent.get_body()) for agent in self.agents],
+                                       dtype=np.int64)
+
+        self.episode_metrics = EpisodeMetrics(metrics, robot_count) if metrics is not None else None
+
+        self.reset()
+
+    def default_start_positions(self):
+        """
+        Get the default starting positions for the robots
+
+        :return: List of (x, y) tuples, one per robot
+        """
+
+        # A single robot keeps the standard starting position
+        if self.robot_count == 1:
+            return [(self.screen_width / 1.3, self.screen_height / 7)]
+
+        # Otherwise spread the robots evenly along the standard starting row
+        return [(self.screen_width * (index + 1) / (self.robot_count + 1), self.screen_height / 7)
+                for index in range(self.robot_count)]
+
+    def create_collision_dispatcher(self, callback_name, notify_both=False):
+        """
+        Create a collision callback that forwards the collision to the agent owning the colliding robot
+
+        :param callback_name: Name of the AgentController method to call
+        :param notify_both: Whether or not both shapes in the collision belong to robots and should be notified
+
+        :return: Callback to hand to the physics environment
+        """
+
+        def dispatch(collision_info, physics_space, data):
+            # The dynamic object is always the second shape for the handlers registered by this class
+            colliding_shapes = collision_info.shapes if notify_both else collision_info.shapes[1:]
+
+            for shape in colliding_shapes:
+                agent = self.agents_by_shape.get(shape)
+
+                if agent is not None:
+                    getattr(agent, callback_name)(collision_info, physics_space, data)
+
+        return dispatch
+
+    def step(self, actions):
+        """
+        Step every robot forward by one simulation step
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every robot
+
+        :return: Observations [N, 13], Step Rewards [N], Episode Completion Statuses [N]. Rays that hit nothing are NaN
+        """
+
+        if len(actions) != self.robot_count:
+            raise ValueError("Expected " + str(self.robot_count) + " actions but got " + str(len(actions)))
+
+        # Clear casts at at the beginning of update
+        for raycast_handler in self.raycast_handlers:
+            raycast_handler.clear_raycasts()
+
+        # One step of the shared space moves every robot at once
+        self.physics_environment.simulateStep()
+
+        drive_backend = self.physics_environment.drive_backend
+
+        # Impulses only change velocities, so applying every robot's before any observation is collected is the same as
+        # applying them one agent at a time
+        if drive_backend is not None:
+            self.apply_tank_impulses(drive_backend, actions)
+
+        observations = []
+        rewards = np.zeros(self.robot_count, dtype=np.float64)
+        dones = np.zeros(self.robot_count, dtype=bool)
+
+        for index, agent in enumerate(self.agents):
+            obs, reward, done = agent.step(action=actions[index], apply_control=drive_backend is None)
+
+            if drive_backend is None:
+                agent.apply_damping(dt=self.physics_environment.step_length)
+
+            observations.append(obs)
+            rewards[index] = reward
+            dones[index] = done
+
+        if drive_backend is not None:
+            dampings = np.ones(len(drive_backend.body_states), dtype=np.float64)
+            dampings[self.agent_rows] = [agent.damping for agent in self.agents]
+
+            drive_backend.apply_damping(dampings)
+
+        if self.episode_metrics is not None:
+            self.episode_metrics.record_step(rewards, dones, self.agents)
+
+        return np.array(observations, dtype=np.float64), rewards, dones
+
+    def apply_tank_impulses(self, drive_backend, actions):
+        """
+        Apply the drive impulses of every robot through the kinematic drive backend, the same impulses
+        AgentController.control applies one robot at a time
+
+        :param drive_backend: The KinematicDriveBackend of the physics environment
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every robot
+
+        :return: None
+        """
+
+        body_count = len(drive_backend.body_states)
+
+        left_impulses = np.zeros(body_count, dtype=np.float64)
+        right_impulses = np.zeros(body_count, dtype=np.float64)
+        left_offsets = np.zeros(body_count, dtype=np.float64)
+        right_offsets = np.zeros(body_count, dtype=np.float64)
+
+        for agent, row, (left_power, right_power) in zip(self.agents, self.agent_rows.tolist(),
+                                                         np.asarray(actions, dtype=np.float64).tolist()):
+            # Robots waiting for their reset get no input
+            if not agent.current_episode_done:
+                left_impulses[row] = left_power * agent.impulse_scale
+                right_impulses[row] = right_power * agent.impulse_scale
+
+            left_offsets[row] = agent.left_impulse_point[0]
+            right_offsets[row] = agent.right_impulse_point[0]
+
+        drive_backend.apply_tank_impulses(left_impulses, right_impulses, left_offsets, right_offsets)
+
+    def reset(self, robot_indices=None):
+        """
+        Reset some or all of the robots
+
+        :param robot_indices: Indices of the robots to reset, defaults to every robot
+
+        :return: Observations [len(robot_indices), 13] at reset
+        """
+
+        if robot_indices is None:
+            robot_indices = range(self.robot_count)
+
+        if self.episode_metrics is not None:
+            self.episode_metrics.reset(list(robot_indices))
+
+        observations = []
+
+        for index in robot_indices:
+            self.raycast_handlers[index].clear_raycasts()
+            observations.append(self.agents[index].reset())
+
+        return np.array(observations, dtype=np.float64)
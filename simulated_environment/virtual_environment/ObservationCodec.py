@@ -0,0 +1,164 @@
+"""Quantized 16 Bit Fixed Point Encoding Of Observations And Actions For Transport And Storage
+
+Every column is given a range [low, high] and mapped linearly onto the codes 0 to 65534, code 65535 stands for NaN
+(a ray that hit nothing). A value inside its range decodes to within half a step of itself:
+
+    error <= (high - low) / 65534 / 2
+
+Which for the default ranges is:
+
+    Column                  Range              Maximum error
+    0-7   Ray distances     0 - 150 px         0.0011 px
+    8     Robot X           0 - 450 px         0.0034 px
+    9     Robot Y           0 - 525 px         0.0040 px
+    10    Robot angle       0 - 360 degrees    0.0027 degrees
+    11    Goal X            0 - 450 px         0.0034 px
+    12    Goal Y            0 - 525 px         0.0040 px
+    Actions                 -100 - 100         0.0015
+
+Values outside their range are clipped to it (and counted in clipped_values), so their error is the distance to the
+range plus the bound above. An observation takes 26 bytes instead of 104 as float64 or 52 as float32.
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+
+from ..physics_engine.EasyPhysics import RaycastHandler
+from .EnvironmentObjectManager import SCREEN_WIDTH, SCREEN_HEIGHT
+
+# Largest code a value can take, the one above it marks NaN
+MAXIMUM_CODE = 65534
+NAN_CODE = 65535
+
+DEFAULT_OBSERVATION_LOW = np.zeros(13, dtype=np.float64)
+DEFAULT_OBSERVATION_HIGH = np.array([RaycastHandler.RAYCAST_LENGTH] * 8 +
+                                    [SCREEN_WIDTH, SCREEN_HEIGHT, 360, SCREEN_WIDTH, SCREEN_HEIGHT], dtype=np.float64)
+
+DEFAULT_ACTION_LOW = np.full(2, -100, dtype=np.float64)
+DEFAULT_ACTION_HIGH = np.full(2, 100, dtype=np.float64)
+
+
+class QuantizedColumns:
+    """Linear 16 bit quantization of a fixed number of columns, each with its own range"""
+
+    def __init__(self, low, high):
+        """
+        :param low: Smallest value of every column
+        :param high: Largest value of every column
+        """
+
+        self.low = np.array(low, dtype=np.float64)
+        self.high = np.array(high, dtype=np.float64)
+
+        if self.low.shape != self.high.shape or np.any(self.high <= self.low):
+            raise ValueError("Every column needs a range with high above low")
+
+        self.scale = MAXIMUM_CODE / (self.high - self.low)
+
+        # Values that were outside their range when encoded
+        self.clipped_values = 0
+
+    @property
+    def error_bound(self):
+        """Largest decoding error of every column for values inside its range"""
+        return 0.5 / self.scale
+
+    def encode(self, values):
+        """
+        Quantize values
+
+        :param values: Array shaped like [..., columns], None or NaN where there is no value
+
+        :return: uint16 codes of the same shape
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+
+        clipped = np.clip(values, self.low, self.high)
+        self.clipped_values += int(np.count_nonzero(~missing & (clipped != values)))
+
+        codes = np.rint((clipped - self.low) * self.scale)
+        codes[missing] = NAN_CODE
+
+        return codes.astype(np.uint16)
+
+    def decode(self, codes, dtype=np.float64):
+        """
+        Turn codes back into values
+
+        :param codes: uint16 array shaped like [..., columns]
+        :param dtype: Floating point type of the result
+
+        :return: Values of the same shape, NaN where there was no value
+        """
+
+        codes = np.asarray(codes, dtype=np.uint16)
+
+        values = self.low + codes / self.scale
+        values[codes == NAN_CODE] = np.nan
+
+        return values.astype(dtype, copy=False)
+
+
+class ObservationCodec:
+    """Encodes the 13 observations of AgentController.collect_obeservations and the (left, right) actions"""
+
+    def __init__(self, observation_low=DEFAULT_OBSERVATION_LOW, observation_high=DEFAULT_OBSERVATION_HIGH,
+                 action_low=DEFAULT_ACTION_LOW, action_high=DEFAULT_ACTION_HIGH):
+        """
+        :param observation_low: Smallest value of every observation
+        :param observation_high: Largest value of every observation
+        :param action_low: Smallest value of every action
+        :param action_high: Largest value of every action
+        """
+
+        self.observations = QuantizedColumns(observation_low, observation_high)
+        self.actions = QuantizedColumns(action_low, action_high)
+
+    def encode_observations(self, observations):
+        """
+        :param observations: Observations [..., 13], None or NaN for rays that hit nothing
+
+        :return: uint16 codes [..., 13]
+        """
+
+        return self.observations.encode(np.array(observations, dtype=np.float64))
+
+    def decode_observations(self, codes, dtype=np.float64):
+        """
+        :param codes: uint16 codes [..., 13]
+        :param dtype: Floating point type of the result
+
+        :return: Observations [..., 13], NaN for rays that hit nothing
+        """
+
+        return self.observations.decode(codes, dtype)
+
+    def encode_actions(self, actions):
+        """
+        :param actions: Actions [..., 2] holding (left_power, right_power)
+
+        :return: uint16 codes [..., 2]
+        """
+
+        return self.actions.encode(actions)
+
+    def decode_actions(self, codes, dtype=np.float64):
+        """
+        :param codes: uint16 codes [..., 2]
+        :param dtype: Floating point type of the result
+
+        :return: Actions [..., 2]
+        """
+
+        return self.actions.decode(codes, dtype)
+
+
+if __name__ == '__main__':
+    codec = ObservationCodec()
+
+    print("Observation error bounds: " + ", ".join("{:.4f}".format(bound) for bound in codec.observations.error_bound))
+    print("Action error bounds: " + ", ".join("{:.4f}".format(bound) for bound in codec.actions.error_bound))
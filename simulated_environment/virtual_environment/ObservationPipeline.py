@@ -0,0 +1,264 @@
+"""Frame Stacking And Running Observation Normalization Over Whole Batches Of Environments"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+
+
+class FrameStack:
+    """
+    Keeps the last K observations of every environment in one preallocated buffer and hands out stacked views of it.
+
+    Every frame is written twice, K slots apart, so the newest K frames are always one contiguous slice in order from
+    oldest to newest and never have to be copied or rolled.
+    """
+
+    def __init__(self, environment_count, frame_count, observation_size=13, dtype=np.float64):
+        """
+        Allocate the ring buffer
+
+        :param environment_count: Number of environments stepped together
+        :param frame_count: Number of frames in each stack (K)
+        :param observation_size: Size of a single observation
+        :param dtype: Type of the stored frames
+        """
+
+        self.environment_count = environment_count
+        self.frame_count = frame_count
+
+        self.buffer = np.zeros((environment_count, 2 * frame_count, observation_size), dtype=dtype)
+
+        # Slot the newest frame was written to, shared by every environment as they all step together
+        self.position = frame_count - 1
+
+    def view(self):
+        """
+        Stacked frames of every environment, valid until the next push or reset
+
+        :return: View shaped like [environments, K, observation_size], oldest frame first
+        """
+
+        return self.buffer[:, self.position + 1:self.position + 1 + self.frame_count]
+
+    def push(self, observations):
+        """
+        Add the newest observation of every environment
+
+        :param observations: Observations shaped like [environments, observation_size]
+
+        :return: Stacked view, see view()
+        """
+
+        self.position = (self.position + 1) % self.frame_count
+
+        self.buffer[:, self.position] = observations
+        self.buffer[:, self.position + self.frame_count] = observations
+
+        return self.view()
+
+    def reset(self, indices, observations):
+        """
+        Start the stacks of some environments over, filling every frame with their observation at reset
+
+        :param indices: Indices of the environments that were reset
+        :param observations: Observations at reset shaped like [len(indices), observation_size]
+
+        :return: Stacked view, see view()
+        """
+
+        self.buffer[indices] = np.asarray(observations)[:, None, :]
+
+        return self.view()
+
+
+class RunningNormalizer:
+    """
+    Running mean and variance of every observation entry, merged a whole batch at a time with the parallel form of
+    Welford's algorithm. NaN entries (rays that hit nothing) are left out of the statistics and stay NaN.
+    """
+
+    def __init__(self, observation_size=13, epsilon=1e-8, clip=10.0):
+        """
+        Start with empty statistics
+
+        :param observation_size: Size of a single observation
+        :param epsilon: Added to the variance before dividing so constant entries do not blow up
+        :param clip: Normalized values are clipped to +-clip, None to leave them unclipped
+        """
+
+        self.epsilon = epsilon
+        self.clip = clip
+
+        self.count = np.zeros(observation_size, dtype=np.float64)
+        self.mean = np.zeros(observation_size, dtype=np.float64)
+
+        # Sum of squared differences from the mean
+        self.m2 = np.zeros(observation_size, dtype=np.float64)
+
+    @property
+    def variance(self):
+        return np.divide(self.m2, self.count, out=np.ones_like(self.m2), where=self.count > 0)
+
+    def update(self, observations):
+        """
+        Merge a batch of observations into the statistics
+
+        :param observations: Observations shaped like [N, observation_size]
+
+        :return: None
+        """
+
+        observations = np.asarray(observations, dtype=np.float64)
+        present = ~np.isnan(observations)
+
+        batch_count = present.sum(axis=0).astype(np.float64)
+        valid = batch_count > 0
+
+        if not np.any(valid):
+            return
+
+        filled = np.where(present, observations, 0.0)
+        batch_mean = np.divide(filled.sum(axis=0), batch_count, out=np.zeros_like(batch_count), where=valid)
+        batch_m2 = np.where(present, observations - batch_mean, 0.0)
+        batch_m2 = (batch_m2 * batch_m2).sum(axis=0)
+
+        total_count = self.count + batch_count
+        delta = batch_mean - self.mean
+
+        # Entries that had no values in this batch are left untouched
+        safe_total = np.where(valid, total_count, 1.0)
+
+        self.mean = np.where(valid, self.mean + delta * (batch_count / safe_total), self.mean)
+        self.m2 = np.where(valid, self.m2 + batch_m2 + delta * delta * (self.count * batch_count / safe_total), self.m2)
+        self.count = total_count
+
+    def normalize(self, observations, out=None):
+        """
+        Normalize observations with the current statistics
+
+        :param observations: Observations shaped like [N, observation_size]
+        :param out: Optional array to write the result into
+
+        :return: Normalized observations
+        """
+
+        out = np.subtract(observations, self.mean, out=out)
+        out /= np.sqrt(self.variance + self.epsilon)
+
+        if self.clip is not None:
+            np.clip(out, -self.clip, self.clip, out=out)
+
+        return out
+
+    def save(self, path):
+        """
+        Save the statistics
+
+        :param path: .npz file to write
+
+        :return: None
+        """
+
+        np.savez(path, count=self.count, mean=self.mean, m2=self.m2)
+
+    def load(self, path):
+        """
+        Replace the statistics with saved ones
+
+        :param path: .npz file written by save
+
+        :return: None
+        """
+
+        with np.load(path) as statistics:
+            self.count = statistics["count"].astype(np.float64)
+            self.mean = statistics["mean"].astype(np.float64)
+            self.m2 = statistics["m2"].astype(np.float64)
+
+
+class ObservationPipeline:
+    """Wraps a batched environment so step and reset return normalized, frame stacked observations"""
+
+    def __init__(self, environment, frame_count=4, normalize=True, update_statistics=True, observation_size=13):
+        """
+        Wrap an environment
+
+        :param environment: VectorEnvironment, MultiAgentEnvironment or BatchedEnvironment
+        :param frame_count: Number of frames in each stack, 1 disables stacking
+        :param normalize: Whether or not to normalize observations before stacking them
+        :param update_statistics: Whether or not every observation seen updates the normalization statistics, turn off
+            for evaluation with loaded statistics
+        :param observation_size: Size of a single observation
+        """
+
+        self.environment = environment
+
+        # A MultiAgentEnvironment steps one robot per slot instead of one environment
+        if hasattr(environment, "environment_count"):
+            self.environment_count = environment.environment_count
+        else:
+            self.environment_count = environment.robot_count
+
+        self.normalize = normalize
+        self.update_statistics = update_statistics
+
+        self.normalizer = RunningNormalizer(observation_size=observation_size)
+        self.frame_stack = FrameStack(environment_count=self.environment_count,
+                                      frame_count=frame_count,
+                                      observation_size=observation_size)
+
+        # Scratch array the normalized observations are written into before being stacked
+        self.normalized = np.zeros((self.environment_count, observation_size), dtype=np.float64)
+
+    def process(self, observations, count):
+        """
+        Update the statistics with raw observations and normalize them into the scratch array
+
+        :param observations: Raw observations shaped like [count, observation_size]
+        :param count: Number of observations
+
+        :return: The normalized observations (a view of the scratch array) or the raw observations
+        """
+
+        if not self.normalize:
+            return observations
+
+        if self.update_statistics:
+            self.normalizer.update(observations)
+
+        return self.normalizer.normalize(observations, out=self.normalized[:count])
+
+    def reset(self, indices=None):
+        """
+        Reset some or all of the environments
+
+        :param indices: Indices (or for BatchedEnvironment a boolean mask) of the environments to reset, defaults to
+            every environment
+
+        :return: Stacked view of every environment [environments, K, observation_size], valid until the next call
+        """
+
+        if indices is None:
+            indices = np.arange(self.environment_count)
+
+        observations = np.asarray(self.environment.reset(indices), dtype=np.float64)
+
+        return self.frame_stack.reset(indices, self.process(observations, len(observations)))
+
+    def step(self, actions):
+        """
+        Step every environment
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every environment
+
+        :return: Stacked view [environments, K, observation_size] valid until the next call, Step Rewards, Episode
+            Completion Statuses
+        """
+
+        observations, rewards, dones = self.environment.step(actions)
+
+        stacked = self.frame_stack.push(self.process(np.asarray(observations, dtype=np.float64),
+                                                     self.environment_count))
+
+        return stacked, rewards, dones
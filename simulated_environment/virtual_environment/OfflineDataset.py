@@ -0,0 +1,216 @@
+"""Flat, Memory Mapped, Columnar Offline Dataset Built From TrajectoryRecorder Recordings
+
+Layout of a dataset directory (every column is a plain .npy file that is memory mapped when opened):
+    observations.npy  float32 [rows, 13]  Every recorded observation, the rows of an episode are contiguous and start
+                                          with the observation at reset
+    actions.npy       float32 [rows, 2]   Action that led to the observation in the same row (NaN on reset rows)
+    rewards.npy       float32 [rows]      Reward received for reaching the row
+    dones.npy         bool    [rows]      Episode completion status after reaching the row
+    transitions.npy   int64   [count]     Row of the observation of every transition, the transition is
+                                          (observations[i], actions[i + 1], rewards[i + 1], observations[i + 1],
+                                          dones[i + 1])
+    episodes.npy      int64   [episodes, 3] Episode id, first row and row count of every episode
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from .TrajectoryRecorder import CHUNK_FILE_NAME, INDEX_FILE_NAME, read_observations
+
+
+def read_episode_index(recording_directory, include_incomplete=False, include_unfinished=True):
+    """
+    Read the episode index of a recording
+
+    :param recording_directory: Directory written by TrajectoryRecorder
+    :param include_incomplete: Whether or not to keep episodes that lost rows while recording
+    :param include_unfinished: Whether or not to keep episodes that never reported done
+
+    :return: List of index entries
+    """
+
+    with open(os.path.join(recording_directory, INDEX_FILE_NAME)) as index_file:
+        entries = [json.loads(line) for line in index_file if line.strip()]
+
+    return [entry for entry in entries
+            if (include_incomplete or entry["complete"]) and (include_unfinished or entry["finished"])]
+
+
+def build_dataset(recording_directory, dataset_directory, include_incomplete=False, include_unfinished=True,
+                  cached_chunks=4):
+    """
+    Convert a recording into a dataset without ever holding more than a few chunks in memory
+
+    :param recording_directory: Directory written by TrajectoryRecorder
+    :param dataset_directory: Directory to write the dataset into
+    :param include_incomplete: Whether or not to keep episodes that lost rows while recording
+    :param include_unfinished: Whether or not to keep episodes that never reported done
+    :param cached_chunks: How many decompressed chunks to keep around, episodes are mostly in recording order so a few
+        are enough
+
+    :return: Number of transitions in the dataset
+    """
+
+    entries = read_episode_index(recording_directory, include_incomplete, include_unfinished)
+    row_count = sum(rows for entry in entries for _, _, rows in entry["segments"])
+
+    os.makedirs(dataset_directory, exist_ok=True)
+
+    # Find the observation and action size from the first chunk that is used
+    first_chunk = np.load(os.path.join(recording_directory, CHUNK_FILE_NAME.format(entries[0]["segments"][0][0]))) \
+        if entries else None
+
+    observation_size = read_observations(first_chunk).shape[1] if first_chunk is not None else 0
+    action_size = first_chunk["action"].shape[1] if first_chunk is not None else 0
+
+    def create_column(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(dataset_directory, name + ".npy"), mode="w+", dtype=dtype,
+                                         shape=shape)
+
+    observations = create_column("observations", np.float32, (row_count, observation_size))
+    actions = create_column("actions", np.float32, (row_count, action_size))
+    rewards = create_column("rewards", np.float32, (row_count,))
+    dones = create_column("dones", bool, (row_count,))
+
+    chunk_cache = OrderedDict()
+
+    def load_chunk(chunk):
+        if chunk not in chunk_cache:
+            with np.load(os.path.join(recording_directory, CHUNK_FILE_NAME.format(chunk))) as chunk_file:
+                chunk_cache[chunk] = {name: chunk_file[name] for name in ("action", "reward", "done")}
+                chunk_cache[chunk]["observation"] = read_observations(chunk_file)
+
+            if len(chunk_cache) > cached_chunks:
+                chunk_cache.popitem(last=False)
+
+        chunk_cache.move_to_end(chunk)
+        return chunk_cache[chunk]
+
+    episodes = np.zeros((len(entries), 3), dtype=np.int64)
+    transitions = []
+    row = 0
+
+    for episode_index, entry in enumerate(entries):
+        first_row = row
+
+        for chunk, chunk_row, rows in entry["segments"]:
+            chunk_columns = load_chunk(chunk)
+            source = slice(chunk_row, chunk_row + rows)
+            target = slice(row, row + rows)
+
+            observations[target] = chunk_columns["observation"][source]
+            actions[target] = chunk_columns["action"][source]
+            rewards[target] = chunk_columns["reward"][source]
+            dones[target] = chunk_columns["done"][source]
+
+            row += rows
+
+        episodes[episode_index] = (entry["episode"], first_row, row - first_row)
+
+        # Every row except the last one of an episode starts a transition
+        transitions.append(np.arange(first_row, row - 1, dtype=np.int64))
+
+    transitions = np.concatenate(transitions) if transitions else np.zeros(0, dtype=np.int64)
+
+    for column in (observations, actions, rewards, dones):
+        column.flush()
+
+    np.save(os.path.join(dataset_directory, "transitions.npy"), transitions)
+    np.save(os.path.join(dataset_directory, "episodes.npy"), episodes)
+
+    return len(transitions)
+
+
+class OfflineDataset:
+    """Random access to the transitions of a dataset without loading it into memory"""
+
+    def __init__(self, dataset_directory):
+        """
+        Memory map every column of a dataset
+
+        :param dataset_directory: Directory written by build_dataset
+        """
+
+        def open_column(name):
+            return np.load(os.path.join(dataset_directory, name + ".npy"), mmap_mode="r")
+
+        self.observations = open_column("observations")
+        self.actions = open_column("actions")
+        self.rewards = open_column("rewards")
+        self.dones = open_column("dones")
+        self.transitions = open_column("transitions")
+        self.episodes = open_column("episodes")
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def get_transitions(self, indices):
+        """
+        Gather a set of transitions
+
+        :param indices: Transition indices, only the requested rows are read from disk
+
+        :return: Observations, Actions, Rewards, Next Observations, Dones
+        """
+
+        rows = self.transitions[indices]
+        next_rows = rows + 1
+
+        return (self.observations[rows], self.actions[next_rows], self.rewards[next_rows], self.observations[next_rows],
+                self.dones[next_rows])
+
+    def sample(self, batch_size, random_generator: np.random.Generator = None):
+        """
+        Sample a random minibatch of transitions
+
+        :param batch_size: Number of transitions to sample
+        :param random_generator: Generator to sample with, a new unseeded one is used if not given
+
+        :return: Observations, Actions, Rewards, Next Observations, Dones
+        """
+
+        if random_generator is None:
+            random_generator = np.random.default_rng()
+
+        # Reading the rows in file order keeps the page cache access pattern sequential
+        indices = np.sort(random_generator.integers(0, len(self.transitions), size=batch_size))
+
+        return self.get_transitions(indices)
+
+    def get_episode(self, episode_index):
+        """
+        Zero copy views of every row of one episode
+
+        :param episode_index: Position of the episode within the dataset
+
+        :return: Observations, Actions, Rewards, Dones of the episode
+        """
+
+        _, first_row, rows = self.episodes[episode_index]
+        episode_rows = slice(first_row, first_row + rows)
+
+        return (self.observations[episode_rows], self.actions[episode_rows], self.rewards[episode_rows],
+                self.dones[episode_rows])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a memory mapped dataset from a TrajectoryRecorder recording")
+    parser.add_argument("recording", help="Directory written by TrajectoryRecorder")
+    parser.add_argument("dataset", help="Directory to write the dataset into")
+    parser.add_argument("--include-incomplete", action="store_true", help="Keep episodes that lost rows")
+    parser.add_argument("--finished-only", action="store_true", help="Drop episodes that never reported done")
+    arguments = parser.parse_args()
+
+    transition_count = build_dataset(recording_directory=arguments.recording,
+                                     dataset_directory=arguments.dataset,
+                                     include_incomplete=arguments.include_incomplete,
+                                     include_unfinished=not arguments.finished_only)
+
+    print("Wrote " + str(transition_count) + " transitions to " + arguments.dataset)
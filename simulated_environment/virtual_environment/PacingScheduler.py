@@ -0,0 +1,197 @@
+"""Drift Free Real Time Pacing Of The Simulation Loop With Jitter Statistics"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import bisect
+import math
+import time
+
+# What to do with deadlines that already passed by the time the loop asks for the next tick
+LATE_TICK_SKIP = "skip"
+LATE_TICK_CATCH_UP = "catch_up"
+
+# Upper edges (seconds) of the wake up latency histogram buckets, the last bucket holds everything above
+DEFAULT_HISTOGRAM_EDGES = (10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3)
+
+
+class PacingStatistics:
+    """Timing of every tick handed out by a PacingScheduler"""
+
+    def __init__(self, histogram_edges=DEFAULT_HISTOGRAM_EDGES):
+        """
+        :param histogram_edges: Increasing upper edges (seconds) of the latency histogram buckets
+        """
+
+        self.histogram_edges = tuple(histogram_edges)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every recorded tick
+
+        :return: None
+        """
+
+        self.ticks = 0
+
+        # Ticks whose deadline had already passed when the loop asked for them, meaning the work took too long
+        self.overruns = 0
+
+        # Deadlines dropped by the skip policy
+        self.skipped_ticks = 0
+
+        # Running sums of the wake up latency (how long after its deadline each tick was handed out)
+        self.latency_sum = 0.0
+        self.latency_square_sum = 0.0
+        self.maximum_latency = 0.0
+
+        self.histogram = [0] * (len(self.histogram_edges) + 1)
+
+    def record(self, latency, overrun, skipped_ticks):
+        """
+        Record one tick
+
+        :param latency: Seconds between the deadline of the tick and the moment it was handed out
+        :param overrun: Whether or not the deadline had already passed when the tick was requested
+        :param skipped_ticks: Number of deadlines dropped before this tick
+
+        :return: None
+        """
+
+        self.ticks += 1
+        self.overruns += overrun
+        self.skipped_ticks += skipped_ticks
+
+        self.latency_sum += latency
+        self.latency_square_sum += latency * latency
+        self.maximum_latency = max(self.maximum_latency, latency)
+
+        self.histogram[bisect.bisect_left(self.histogram_edges, latency)] += 1
+
+    @property
+    def mean_latency(self):
+        return self.latency_sum / self.ticks if self.ticks else 0.0
+
+    @property
+    def jitter(self):
+        """Standard deviation of the wake up latency in seconds"""
+
+        if self.ticks < 2:
+            return 0.0
+
+        variance = (self.latency_square_sum - (self.latency_sum * self.latency_sum) / self.ticks) / (self.ticks - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def __repr__(self):
+        lines = ["Ticks: {}  Overruns: {}  Skipped: {}".format(self.ticks, self.overruns, self.skipped_ticks),
+                 "Latency mean {:.1f} us  jitter {:.1f} us  max {:.1f} us".format(self.mean_latency * 1e6,
+                                                                                   self.jitter * 1e6,
+                                                                                   self.maximum_latency * 1e6)]
+
+        lower_edge = 0.0
+
+        for upper_edge, count in zip(self.histogram_edges + (math.inf,), self.histogram):
+            lines.append("  {:>8.0f} - {:<8.0f} us  {}".format(lower_edge * 1e6, upper_edge * 1e6, count))
+            lower_edge = upper_edge
+
+        return "\n".join(lines)
+
+
+class PacingScheduler:
+    """
+    Hands out ticks at a fixed rate measured against absolute deadlines, so time spent between ticks never adds up into
+    drift the way sleeping for the period after every step does.
+
+    Waiting sleeps until shortly before the deadline and then spins the rest of the way, which trades a little CPU for
+    wake ups that are not at the mercy of the OS sleep granularity.
+    """
+
+    def __init__(self, period, late_tick_policy=LATE_TICK_SKIP, spin_time=0.002,
+                 histogram_edges=DEFAULT_HISTOGRAM_EDGES, clock=time.perf_counter, sleep=time.sleep):
+        """
+        Create the scheduler, the first deadline is one period after start (or the first wait)
+
+        :param period: Seconds between ticks, 0.02 for a 50 Hz robot loop
+        :param late_tick_policy: LATE_TICK_SKIP drops deadlines that passed while the loop was busy and continues on
+            the original grid, LATE_TICK_CATCH_UP hands them out back to back until the loop is on time again
+        :param spin_time: Seconds before each deadline at which sleeping stops and spinning starts
+        :param histogram_edges: Increasing upper edges (seconds) of the latency histogram buckets
+        :param clock: Monotonic clock returning seconds
+        :param sleep: Function sleeping for the given number of seconds
+        """
+
+        if late_tick_policy not in (LATE_TICK_SKIP, LATE_TICK_CATCH_UP):
+            raise ValueError("Unknown late tick policy: " + str(late_tick_policy))
+
+        self.period = period
+        self.late_tick_policy = late_tick_policy
+        self.spin_time = spin_time
+
+        self.clock = clock
+        self.sleep = sleep
+
+        self.statistics = PacingStatistics(histogram_edges=histogram_edges)
+
+        # Deadlines are start_time + tick_index * period, computed fresh each time so rounding never accumulates
+        self.start_time = None
+        self.tick_index = 0
+
+    def start(self):
+        """
+        Start the deadline grid now
+
+        :return: None
+        """
+
+        self.start_time = self.clock()
+        self.tick_index = 1
+        self.statistics.reset()
+
+    @property
+    def next_deadline(self):
+        return self.start_time + (self.tick_index * self.period)
+
+    def wait(self):
+        """
+        Block until the next tick is due
+
+        :return: Seconds between the deadline of the tick and the moment it was handed out
+        """
+
+        if self.start_time is None:
+            self.start()
+
+        deadline = self.next_deadline
+        now = self.clock()
+
+        overrun = now > deadline
+        skipped_ticks = 0
+
+        # Move past every deadline that was missed while the loop was busy, keeping to the original grid
+        if overrun and self.late_tick_policy == LATE_TICK_SKIP:
+            # Rounding can put a deadline that was only just missed on the grid line before it, which skips nothing
+            skipped_ticks = max(0, int((now - self.start_time) / self.period) - self.tick_index)
+
+            self.tick_index += skipped_ticks
+
+            # The most recent deadline is the one being handed out
+            deadline = self.next_deadline
+
+        # Sleep through most of the wait, then spin for the precise wake up
+        remaining = deadline - now
+
+        if remaining > self.spin_time:
+            self.sleep(remaining - self.spin_time)
+
+        now = self.clock()
+
+        while now < deadline:
+            now = self.clock()
+
+        latency = now - deadline
+
+        self.statistics.record(latency=latency, overrun=overrun, skipped_ticks=skipped_ticks)
+        self.tick_index += 1
+
+        return latency
@@ -0,0 +1,325 @@
+"""Parallel Sweep Of Physics Parameters Against A Reference Trajectory With An On Disk Result Cache
+
+Every point of the grid replays the same scripted action trace in a fresh headless environment built with that point's
+parameters, and scores the simulated pose trajectory against a reference (for example one logged on the real robot).
+Results are cached as one JSON file per point, named by a hash of the parameters, the action trace and the reference, so
+repeating or extending a sweep only simulates the points that have not been run before.
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ..physics_engine.BodyStateArray import BodyStateArray
+from .MultiAgentEnvironment import MultiAgentEnvironment
+
+# Bump whenever the simulation or the scoring changes in a way that makes old cache entries wrong
+CACHE_VERSION = 1
+
+# Values used for every parameter the grid does not mention, the same ones the environment uses by default
+DEFAULT_PARAMETERS = {
+    "simulation_accuracy": 45,
+    "step_length": 0.01,
+    "mass": 1.0,
+    "friction": 0.9,
+    "damping": 0.92,
+    "wheel_offset": 6.0,
+}
+
+# Action trace and reference trajectory of the current worker process, set up once by the pool initializer
+worker_actions = None
+worker_reference = None
+
+
+def expand_grid(grid):
+    """
+    Expand a parameter grid into every combination of its values
+
+    :param grid: Dictionary of parameter name to list of values, see DEFAULT_PARAMETERS for the names
+
+    :return: List of complete parameter dictionaries
+    """
+
+    unknown = set(grid) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise KeyError("Unknown sweep parameters: " + ", ".join(sorted(unknown)))
+
+    names = sorted(grid)
+    points = []
+
+    for values in itertools.product(*(grid[name] for name in names)):
+        parameters = dict(DEFAULT_PARAMETERS)
+        parameters.update(zip(names, values))
+        points.append(parameters)
+
+    return points
+
+
+def parameter_key(parameters, actions, reference):
+    """
+    Cache key of one point of a sweep
+
+    :param parameters: Complete parameter dictionary
+    :param actions: Action trace [steps, 2]
+    :param reference: Reference trajectory [steps + 1, 3]
+
+    :return: Hex digest naming the cache entry
+    """
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"version": CACHE_VERSION, "parameters": parameters}, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(actions, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(reference, dtype=np.float64).tobytes())
+
+    return digest.hexdigest()
+
+
+def simulate_trace(parameters, actions, initial_pose):
+    """
+    Drive the robot through an action trace with a set of physics parameters
+
+    The trace is applied in full even after the robot touches the field, the same way the real robot keeps driving.
+
+    :param parameters: Complete parameter dictionary
+    :param actions: Action trace [steps, 2] of (left_power, right_power)
+    :param initial_pose: (X, Y, Angle in radians) to start from
+
+    :return: Pose trajectory [steps + 1, 3] of (X, Y, Angle in radians), the first entry being the initial pose
+    """
+
+    wheel_offset = parameters["wheel_offset"]
+
+    environment = MultiAgentEnvironment(robot_count=1,
+                                        simulation_accuracy=parameters["simulation_accuracy"],
+                                        step_length=parameters["step_length"],
+                                        agent_options={"mass": parameters["mass"],
+                                                       "friction": parameters["friction"],
+                                                       "damping": parameters["damping"],
+                                                       "left_impulse_point": (wheel_offset, 0),
+                                                       "right_impulse_point": (-wheel_offset, 0)})
+
+    physics_environment = environment.physics_environment
+    agent = environment.agents[0]
+    body = physics_environment.dynamic_bodies[0]
+    step_length = physics_environment.step_length
+
+    BodyStateArray([physics_environment]).reset_poses([initial_pose])
+
+    trajectory = np.zeros((len(actions) + 1, 3), dtype=np.float64)
+    trajectory[0] = initial_pose
+
+    for step, (left_power, right_power) in enumerate(np.asarray(actions, dtype=np.float64).tolist(), start=1):
+        # Same order of operations as VirtualEnvironment.step
+        physics_environment.simulateStep()
+        agent.control(left_input=left_power, right_input=right_power)
+        agent.apply_damping(dt=step_length)
+
+        trajectory[step] = (body.position.x, body.position.y, body.angle)
+
+    return trajectory
+
+
+def score_trajectory(trajectory, reference, angle_weight):
+    """
+    Compare a simulated trajectory with the reference
+
+    :param trajectory: Simulated trajectory [steps + 1, 3]
+    :param reference: Reference trajectory [steps + 1, 3]
+    :param angle_weight: Pixels of position error that one radian of heading error is worth
+
+    :return: Position RMS error (PX), heading RMS error (radians), combined score (lower is better)
+    """
+
+    position_error = float(np.sqrt(np.mean(np.sum((trajectory[:, :2] - reference[:, :2]) ** 2, axis=1))))
+
+    # Compare headings on the circle so a full turn is not counted as an error
+    angle_difference = np.angle(np.exp(1j * (trajectory[:, 2] - reference[:, 2])))
+    angle_error = float(np.sqrt(np.mean(angle_difference ** 2)))
+
+    return position_error, angle_error, position_error + angle_weight * angle_error
+
+
+def initialize_worker(actions, reference):
+    """Keep the action trace and reference of the sweep in the worker process"""
+
+    global worker_actions, worker_reference
+
+    worker_actions = actions
+    worker_reference = reference
+
+
+def run_point(parameters):
+    """
+    Simulate one point of the sweep in a worker process
+
+    :param parameters: Complete parameter dictionary
+
+    :return: Cache entry of the point (without a score, which depends on the angle weight of the sweep)
+    """
+
+    start_time = time.perf_counter()
+    trajectory = simulate_trace(parameters, worker_actions, worker_reference[0])
+    position_error, angle_error, _ = score_trajectory(trajectory, worker_reference, angle_weight=0.0)
+
+    return {"parameters": parameters,
+            "position_error": position_error,
+            "angle_error": angle_error,
+            "final_pose": trajectory[-1].tolist(),
+            "elapsed_time": time.perf_counter() - start_time}
+
+
+class ParameterSweep:
+    """Runs a grid of physics parameters against one action trace and reference trajectory"""
+
+    def __init__(self, actions, reference_trajectory, cache_directory, angle_weight=100.0):
+        """
+        Prepare the sweep
+
+        :param actions: Scripted action trace [steps, 2] of (left_power, right_power), one action per step
+        :param reference_trajectory: Poses [steps + 1, 3] of (X, Y, Angle in radians) observed before the first action
+            and after every action, in the same units and frame as the physics space
+        :param cache_directory: Directory holding one JSON result per simulated point
+        :param angle_weight: Pixels of position error that one radian of heading error is worth in the score
+        """
+
+        self.actions = np.asarray(actions, dtype=np.float64)
+        self.reference_trajectory = np.asarray(reference_trajectory, dtype=np.float64)
+
+        if len(self.reference_trajectory) != len(self.actions) + 1:
+            raise ValueError("The reference trajectory needs exactly one more pose than there are actions")
+
+        self.cache_directory = cache_directory
+        self.angle_weight = angle_weight
+
+        # How many points of the last run came from the cache and how many had to be simulated
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        os.makedirs(cache_directory, exist_ok=True)
+
+    def cache_path(self, key):
+        return os.path.join(self.cache_directory, key + ".json")
+
+    def load_result(self, key):
+        """
+        Read a cached point
+
+        :param key: Cache key of the point
+
+        :return: The cache entry, None if the point has not been simulated yet
+        """
+
+        try:
+            with open(self.cache_path(key)) as result_file:
+                return json.load(result_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store_result(self, key, result):
+        """
+        Write a point to the cache
+
+        :param key: Cache key of the point
+        :param result: Cache entry of the point
+
+        :return: None
+        """
+
+        path = self.cache_path(key)
+
+        # Write to a temporary name first so an interrupted sweep never leaves a broken entry behind
+        with open(path + ".partial", "w") as result_file:
+            json.dump(result, result_file)
+
+        os.replace(path + ".partial", path)
+
+    def run(self, grid, worker_count=1):
+        """
+        Run every point of a grid that is not cached yet
+
+        :param grid: Dictionary of parameter name to list of values, see DEFAULT_PARAMETERS for the names
+        :param worker_count: Number of worker processes, 0 simulates in this process
+
+        :return: List of results sorted from best to worst score, each the cache entry plus "key" and "score"
+        """
+
+        points = expand_grid(grid)
+        keys = [parameter_key(parameters, self.actions, self.reference_trajectory) for parameters in points]
+
+        results = {key: self.load_result(key) for key in keys}
+        missing = [(key, parameters) for key, parameters in zip(keys, points) if results[key] is None]
+
+        self.cache_hits = len(points) - len(missing)
+        self.cache_misses = len(missing)
+
+        if missing:
+            missing_keys, missing_points = zip(*missing)
+
+            if worker_count == 0:
+                initialize_worker(self.actions, self.reference_trajectory)
+                computed = map(run_point, missing_points)
+                pool = None
+            else:
+                pool = ProcessPoolExecutor(max_workers=worker_count, initializer=initialize_worker,
+                                           initargs=(self.actions, self.reference_trajectory))
+                computed = pool.map(run_point, missing_points)
+
+            try:
+                # Store every point as soon as it is done so an interrupted sweep keeps its progress
+                for key, result in zip(missing_keys, computed):
+                    self.store_result(key, result)
+                    results[key] = result
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+        ranked = []
+
+        for key in keys:
+            result = dict(results[key])
+            result["key"] = key
+            result["score"] = result["position_error"] + self.angle_weight * result["angle_error"]
+            ranked.append(result)
+
+        return sorted(ranked, key=lambda result: result["score"])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep physics parameters against a reference trajectory")
+    parser.add_argument("trace", help=".npz file holding 'actions' [steps, 2] and 'reference' [steps + 1, 3]")
+    parser.add_argument("grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("--cache", default="SweepCache", help="Directory of the result cache")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
+    parser.add_argument("--angle-weight", type=float, default=100.0, help="Pixels of error worth one radian")
+    parser.add_argument("--top", type=int, default=10, help="Number of best points to print")
+    arguments = parser.parse_args()
+
+    with np.load(arguments.trace) as trace_file:
+        trace_actions = trace_file["actions"]
+        trace_reference = trace_file["reference"]
+
+    with open(arguments.grid) as grid_file:
+        parameter_grid = json.load(grid_file)
+
+    sweep = ParameterSweep(actions=trace_actions,
+                           reference_trajectory=trace_reference,
+                           cache_directory=arguments.cache,
+                           angle_weight=arguments.angle_weight)
+
+    sweep_results = sweep.run(parameter_grid, worker_count=arguments.workers)
+
+    print("Simulated " + str(sweep.cache_misses) + " points, " + str(sweep.cache_hits) + " came from the cache")
+
+    for sweep_result in sweep_results[:arguments.top]:
+        print("{:10.3f}  position {:8.3f} px  heading {:6.4f} rad  {}".format(
+            sweep_result["score"], sweep_result["position_error"], sweep_result["angle_error"],
+            json.dumps(sweep_result["parameters"], sort_keys=True)))
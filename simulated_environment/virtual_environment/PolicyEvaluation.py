@@ -0,0 +1,279 @@
+"""Parallel Evaluation Of A Policy Over Many Headless Episodes"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import importlib
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ..physics_engine.BodyStateArray import BodyStateArray
+from .MultiAgentEnvironment import MultiAgentEnvironment
+
+# z value of a two sided 95% confidence interval
+CONFIDENCE_Z = 1.959963984540054
+
+# Headless environment and policy of the current worker process, set up once by the pool initializer
+worker_environment: MultiAgentEnvironment = None
+worker_policy = None
+
+
+class ConstantPolicy:
+    """Always takes the same action, the policy the VirtualEnvironment.py main loop runs"""
+
+    def __init__(self, action=(50, 50)):
+        self.action = action
+
+    def __call__(self, observation):
+        return self.action
+
+
+class EpisodeResult:
+    """Outcome of a single evaluation episode"""
+
+    def __init__(self, seed, total_reward, length, hit_goal, collided, truncated):
+        """
+        :param seed: Seed the episode was run with
+        :param total_reward: Sum of the rewards up to and including the step that ended the episode
+        :param length: Number of steps taken
+        :param hit_goal: Whether or not the goal was reached
+        :param collided: Whether or not the episode ended by hitting the field
+        :param truncated: Whether or not the episode was cut off by the step limit
+        """
+
+        self.seed = seed
+        self.total_reward = total_reward
+        self.length = length
+        self.hit_goal = hit_goal
+        self.collided = collided
+        self.truncated = truncated
+
+
+def mean_interval(values):
+    """
+    Mean and 95% confidence interval half width using the normal approximation
+
+    :param values: Sample values
+
+    :return: Mean, half width
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+
+    if len(values) < 2:
+        return float(values.mean()) if len(values) else float("nan"), float("nan")
+
+    return float(values.mean()), float(CONFIDENCE_Z * values.std(ddof=1) / math.sqrt(len(values)))
+
+
+def proportion_interval(successes, trials):
+    """
+    Proportion with a 95% Wilson score interval, which stays sensible for rates close to 0 or 1
+
+    :param successes: Number of successes
+    :param trials: Number of trials
+
+    :return: Proportion, lower bound, upper bound
+    """
+
+    if trials == 0:
+        return float("nan"), float("nan"), float("nan")
+
+    proportion = successes / trials
+    z_squared = CONFIDENCE_Z * CONFIDENCE_Z
+
+    center = (proportion + z_squared / (2 * trials)) / (1 + z_squared / trials)
+    half_width = (CONFIDENCE_Z / (1 + z_squared / trials)) * math.sqrt(
+        (proportion * (1 - proportion) / trials) + (z_squared / (4 * trials * trials)))
+
+    return proportion, max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+class EvaluationReport:
+    """Aggregated statistics of a set of evaluation episodes"""
+
+    def __init__(self, episodes):
+        """
+        Aggregate the episode results
+
+        :param episodes: List of EpisodeResult
+        """
+
+        self.episodes = episodes
+        self.episode_count = len(episodes)
+
+        self.success_rate, self.success_rate_lower, self.success_rate_upper = proportion_interval(
+            sum(episode.hit_goal for episode in episodes), self.episode_count)
+
+        self.collision_count = sum(episode.collided for episode in episodes)
+        self.collision_rate, self.collision_rate_lower, self.collision_rate_upper = proportion_interval(
+            self.collision_count, self.episode_count)
+
+        self.truncated_count = sum(episode.truncated for episode in episodes)
+
+        self.mean_return, self.mean_return_interval = mean_interval([episode.total_reward for episode in episodes])
+        self.mean_length, self.mean_length_interval = mean_interval([episode.length for episode in episodes])
+
+    def __repr__(self):
+        return ("Episodes: {}\n"
+                "Success rate: {:.3f} (95% CI {:.3f} - {:.3f})\n"
+                "Mean return: {:.2f} +/- {:.2f}\n"
+                "Mean episode length: {:.1f} +/- {:.1f}\n"
+                "Collisions: {} ({:.3f}, 95% CI {:.3f} - {:.3f})\n"
+                "Truncated: {}").format(self.episode_count,
+                                        self.success_rate, self.success_rate_lower, self.success_rate_upper,
+                                        self.mean_return, self.mean_return_interval,
+                                        self.mean_length, self.mean_length_interval,
+                                        self.collision_count, self.collision_rate, self.collision_rate_lower,
+                                        self.collision_rate_upper,
+                                        self.truncated_count)
+
+
+def start_episode(environment: MultiAgentEnvironment, seed, start_noise):
+    """
+    Reset a single robot environment, optionally to a random start pose drawn from the seed
+
+    :param environment: Single robot headless environment
+    :param seed: Seed of the episode, used for the start pose
+    :param start_noise: (X, Y, Angle in radians) half ranges of the uniform start pose noise, None to always start in
+        the standard pose
+
+    :return: Observation [1, 13] at the start of the episode
+    """
+
+    agent = environment.agents[0]
+    observation = environment.reset()
+
+    if start_noise is not None:
+        random_generator = np.random.default_rng(seed)
+        offset = random_generator.uniform(-1, 1, size=3) * np.asarray(start_noise, dtype=np.float64)
+
+        BodyStateArray([environment.physics_environment]).reset_poses([(agent.initialX + offset[0],
+                                                                        agent.initialY + offset[1],
+                                                                        offset[2])])
+
+        # Measure progress from where the robot actually starts and observe it there
+        agent.starting_distance = agent.get_distance_to_goal()
+        agent.last_distance = agent.starting_distance
+        agent.raycast_handler.clear_raycasts()
+        observation = np.array([agent.collect_obeservations()], dtype=np.float64)
+
+    return observation
+
+
+def run_episode(environment: MultiAgentEnvironment, policy, seed, step_limit, start_noise):
+    """
+    Run one evaluation episode
+
+    :param environment: Single robot headless environment
+    :param policy: Callable taking an observation and returning (left_power, right_power)
+    :param seed: Seed of the episode, used for the start pose
+    :param step_limit: Maximum number of steps before the episode is cut off
+    :param start_noise: (X, Y, Angle in radians) half ranges of the uniform start pose noise, None to always start in
+        the standard pose
+
+    :return: EpisodeResult
+    """
+
+    agent = environment.agents[0]
+    observation = start_episode(environment, seed, start_noise)
+
+    total_reward = 0.0
+    length = 0
+    done = False
+
+    while length < step_limit and not done:
+        observation, reward, dones = environment.step([policy(observation[0])])
+
+        total_reward += float(reward[0])
+        length += 1
+        done = bool(dones[0])
+
+    return EpisodeResult(seed=seed,
+                         total_reward=total_reward,
+                         length=length,
+                         hit_goal=agent.hit_goal,
+                         collided=done and not agent.hit_goal,
+                         truncated=not done)
+
+
+def initialize_worker(policy):
+    """Build the headless environment of a worker process and keep its copy of the policy"""
+
+    global worker_environment, worker_policy
+
+    worker_environment = MultiAgentEnvironment(robot_count=1)
+    worker_policy = policy
+
+
+def run_episode_in_worker(seed, step_limit, start_noise):
+    """Run an episode in the environment of the worker process"""
+
+    return run_episode(worker_environment, worker_policy, seed, step_limit, start_noise)
+
+
+def evaluate_policy(policy, episode_count, worker_count=1, step_limit=1000, seed=0, start_noise=None):
+    """
+    Evaluate a policy over many episodes spread over a pool of headless environments
+
+    :param policy: Callable taking an observation and returning (left_power, right_power), must be picklable when more
+        than one worker is used
+    :param episode_count: Number of episodes to run
+    :param worker_count: Number of worker processes, 0 runs every episode in this process
+    :param step_limit: Maximum number of steps per episode
+    :param seed: Base seed, episode i uses seed + i so any single episode can be rerun on its own
+    :param start_noise: (X, Y, Angle in radians) half ranges of the uniform start pose noise, None to always start in
+        the standard pose
+
+    :return: EvaluationReport
+    """
+
+    seeds = [seed + episode for episode in range(episode_count)]
+
+    if worker_count == 0:
+        environment = MultiAgentEnvironment(robot_count=1)
+        episodes = [run_episode(environment, policy, episode_seed, step_limit, start_noise) for episode_seed in seeds]
+
+        return EvaluationReport(episodes)
+
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=initialize_worker, initargs=(policy,)) as pool:
+        episodes = list(pool.map(run_episode_in_worker, seeds, [step_limit] * episode_count,
+                                 [start_noise] * episode_count,
+                                 chunksize=max(1, episode_count // (worker_count * 8))))
+
+    return EvaluationReport(episodes)
+
+
+def load_policy(path):
+    """
+    Import a policy given as "module:attribute"
+
+    :param path: Import path of the policy
+
+    :return: The policy
+    """
+
+    module_name, attribute = path.split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate a policy over many headless episodes")
+    parser.add_argument("--policy", help="Policy to evaluate as module:attribute, defaults to a constant (50, 50)")
+    parser.add_argument("--episodes", type=int, default=1000, help="Number of episodes")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
+    parser.add_argument("--step-limit", type=int, default=1000, help="Maximum number of steps per episode")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed of the episodes")
+    parser.add_argument("--start-noise", type=float, nargs=3, metavar=("X", "Y", "ANGLE"),
+                        help="Half ranges of the random start pose noise (PX, PX, radians)")
+    arguments = parser.parse_args()
+
+    print(evaluate_policy(policy=load_policy(arguments.policy) if arguments.policy else ConstantPolicy(),
+                          episode_count=arguments.episodes,
+                          worker_count=arguments.workers,
+                          step_limit=arguments.step_limit,
+                          seed=arguments.seed,
+                          start_noise=arguments.start_noise))
@@ -0,0 +1,327 @@
+"""Worker Processes Forked From One Environment Built In The Parent
+
+Building the field and every AgentController happens once in the parent, each worker is then a fork of it that shares
+the built structures copy-on-write, so adding a worker costs a fork instead of a fresh interpreter and a full build.
+A few forked spares are kept idle so crashed or recycled workers are replaced without waiting for anything.
+
+Requires the fork start method (Linux, macOS), and forking should happen before the parent starts any threads.
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import gc
+import multiprocessing
+import time
+from collections import deque
+
+import numpy as np
+
+from .MultiAgentEnvironment import MultiAgentEnvironment
+
+
+def worker_main(connection, environment):
+    """
+    Serve step and reset requests for one forked copy of the environment until told to stop
+
+    :param connection: Worker end of the pipe to the pool
+    :param environment: The single robot environment inherited from the parent
+
+    :return: None
+    """
+
+    while True:
+        try:
+            command, payload = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if command == "step":
+            obs, reward, done = environment.step([payload])
+            connection.send((obs[0], reward[0], done[0]))
+        elif command == "reset":
+            connection.send(environment.reset()[0])
+        elif command == "close":
+            break
+
+    connection.close()
+
+
+class ForkedWorker:
+    """A forked worker process and the pool end of its pipe"""
+
+    __slots__ = ("process", "connection")
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+
+    def stop(self, timeout=1.0):
+        """
+        Ask the worker to stop and kill it if it does not
+
+        :param timeout: Seconds to wait for the worker to exit by itself
+
+        :return: None
+        """
+
+        try:
+            self.connection.send(("close", None))
+        except (BrokenPipeError, EOFError, OSError):
+            pass
+
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.connection.close()
+
+
+class PreforkPool:
+    """
+    Steps one single robot environment per worker process, like VectorEnvironment but with every environment in its
+    own process. Workers that crash are replaced by a warm spare and report the end of their episode.
+    """
+
+    def __init__(self, worker_count, spare_count=2, **environment_options):
+        """
+        Build the environment once and fork the workers and spares from it
+
+        :param worker_count: Number of active workers
+        :param spare_count: Number of idle forked workers kept ready to replace active ones
+        :param environment_options: Extra keyword arguments handed to the MultiAgentEnvironment built in the parent
+        """
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("PreforkPool needs the fork start method, which this platform does not have")
+
+        self.context = multiprocessing.get_context("fork")
+        self.spare_count = spare_count
+
+        # The environment every worker starts from, it is never stepped in the parent
+        self.template = MultiAgentEnvironment(robot_count=1, **environment_options)
+
+        self.workers = []
+        self.spares = deque()
+
+        # How many workers died while stepping and had to be replaced
+        self.crashed_workers = 0
+
+        self.scale(worker_count)
+
+    def __len__(self):
+        return len(self.workers)
+
+    def fork_worker(self):
+        """
+        Fork a new worker from the template environment
+
+        :return: The started ForkedWorker
+        """
+
+        pool_connection, worker_connection = self.context.Pipe()
+
+        # The fork start method hands the template straight to the child, nothing is pickled
+        process = self.context.Process(target=worker_main, args=(worker_connection, self.template), daemon=True)
+
+        # Keep the collector of the child from touching (and so copying) every inherited object. Only the child keeps
+        # them frozen, the parent still has to collect its own garbage
+        gc.freeze()
+
+        try:
+            process.start()
+        finally:
+            gc.unfreeze()
+
+        worker_connection.close()
+
+        return ForkedWorker(process, pool_connection)
+
+    def fill_spares(self):
+        """
+        Fork spares until there are spare_count of them
+
+        :return: None
+        """
+
+        while len(self.spares) < self.spare_count:
+            self.spares.append(self.fork_worker())
+
+    def take_spare(self):
+        """
+        Take a warm spare, forking a new worker if there are none left
+
+        :return: The ForkedWorker
+        """
+
+        if self.spares:
+            return self.spares.popleft()
+
+        return self.fork_worker()
+
+    def scale(self, worker_count):
+        """
+        Grow or shrink the number of active workers, spares are used first when growing
+
+        :param worker_count: New number of active workers
+
+        :return: Seconds it took
+        """
+
+        start_time = time.perf_counter()
+
+        while len(self.workers) < worker_count:
+            self.workers.append(self.take_spare())
+
+        while len(self.workers) > worker_count:
+            self.workers.pop().stop()
+
+        self.fill_spares()
+
+        return time.perf_counter() - start_time
+
+    def replace(self, index):
+        """
+        Stop a worker and put a spare in its place, use it to recycle workers or after a crash
+
+        :param index: Index of the worker to replace
+
+        :return: None
+        """
+
+        self.workers[index].stop()
+        self.workers[index] = self.take_spare()
+        self.fill_spares()
+
+    def step(self, actions):
+        """
+        Step every worker forward by one simulation step
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every worker
+
+        :return: Observations [N, 13], Step Rewards [N], Episode Completion Statuses [N]. A worker that crashed
+            is replaced, its slot reports the end of the episode and the observation of the fresh environment
+        """
+
+        worker_count = len(self.workers)
+
+        observations = np.empty((worker_count, 13), dtype=np.float64)
+        rewards = np.zeros(worker_count, dtype=np.float64)
+        dones = np.ones(worker_count, dtype=bool)
+        crashed = []
+
+        # Every worker simulates at the same time, the results are only collected once every request is out
+        for index, worker in enumerate(self.workers):
+            try:
+                worker.connection.send(("step", actions[index]))
+            except (BrokenPipeError, EOFError, OSError):
+                crashed.append(index)
+
+        for index, worker in enumerate(self.workers):
+            if index in crashed:
+                continue
+
+            try:
+                observations[index], rewards[index], dones[index] = worker.connection.recv()
+            except (EOFError, OSError):
+                crashed.append(index)
+
+        for index in crashed:
+            observations[index] = self.replace_crashed([index])[0]
+
+        return observations, rewards, dones
+
+    def replace_crashed(self, indices):
+        """
+        Replace workers that crashed and reset their replacements
+
+        :param indices: Indices of the crashed workers
+
+        :return: Observations [len(indices), 13] of the fresh environments
+        """
+
+        for index in indices:
+            self.crashed_workers += 1
+            self.replace(index)
+
+        return self.reset(indices)
+
+    def reset(self, indices=None):
+        """
+        Reset some or all of the workers
+
+        :param indices: Indices of the workers to reset, defaults to every worker
+
+        :return: Observations [len(indices), 13] at reset
+        """
+
+        if indices is None:
+            indices = range(len(self.workers))
+
+        indices = list(indices)
+
+        observations = np.empty((len(indices), 13), dtype=np.float64)
+        crashed = []
+
+        for position, index in enumerate(indices):
+            try:
+                self.workers[index].connection.send(("reset", None))
+            except (BrokenPipeError, EOFError, OSError):
+                crashed.append(position)
+
+        for position, index in enumerate(indices):
+            if position in crashed:
+                continue
+
+            try:
+                observations[position] = self.workers[index].connection.recv()
+            except (EOFError, OSError):
+                crashed.append(position)
+
+        # A worker that died since it was last used is replaced like a worker that crashed while stepping
+        if crashed:
+            observations[crashed] = self.replace_crashed([indices[position] for position in crashed])
+
+        return observations
+
+    def close(self):
+        """
+        Stop every worker and spare
+
+        :return: None
+        """
+
+        for worker in self.workers + list(self.spares):
+            worker.stop()
+
+        self.workers.clear()
+        self.spares.clear()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure how quickly a prefork pool scales up")
+    parser.add_argument("--workers", type=int, default=8, help="Number of workers to start with")
+    parser.add_argument("--scale-to", type=int, default=64, help="Number of workers to scale up to")
+    parser.add_argument("--spares", type=int, default=2, help="Number of warm spares")
+    arguments = parser.parse_args()
+
+    pool_start = time.perf_counter()
+    pool = PreforkPool(arguments.workers, spare_count=arguments.spares)
+    print("Built the environment and {} workers in {:.1f} ms".format(arguments.workers,
+                                                                    (time.perf_counter() - pool_start) * 1e3))
+
+    try:
+        scale_time = pool.scale(arguments.scale_to)
+        added_workers = max(arguments.scale_to - arguments.workers, 1)
+        print("Scaled to {} workers in {:.1f} ms ({:.2f} ms per worker)".format(
+            arguments.scale_to, scale_time * 1e3, scale_time * 1e3 / added_workers))
+
+        pool.reset()
+        step_start = time.perf_counter()
+        pool.step(np.full((arguments.scale_to, 2), 50.0))
+        print("First step of every worker in {:.1f} ms".format((time.perf_counter() - step_start) * 1e3))
+    finally:
+        pool.close()
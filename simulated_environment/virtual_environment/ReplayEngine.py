@@ -0,0 +1,197 @@
+"""Deterministic Headless Replay Of Recorded Action Logs With Divergence Checking"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from ..physics_engine.BodyStateArray import BodyStateArray
+from .MultiAgentEnvironment import MultiAgentEnvironment
+from .OfflineDataset import read_episode_index
+from .TrajectoryRecorder import CHUNK_FILE_NAME
+
+
+class ReplayResult:
+    """Outcome of a replay"""
+
+    def __init__(self, steps, first_divergent_step, maximum_error, checked_steps, elapsed_time):
+        """
+        :param steps: Number of steps replayed
+        :param first_divergent_step: First checked step whose state differed from the recording, None if none did
+        :param maximum_error: Largest absolute state difference seen at any checked step
+        :param checked_steps: Number of steps compared against the recording
+        :param elapsed_time: Wall time of the replay in seconds
+        """
+
+        self.steps = steps
+        self.first_divergent_step = first_divergent_step
+        self.maximum_error = maximum_error
+        self.checked_steps = checked_steps
+        self.elapsed_time = elapsed_time
+
+    @property
+    def diverged(self):
+        return self.first_divergent_step is not None
+
+    def __repr__(self):
+        return ("ReplayResult(steps=" + str(self.steps) + ", first_divergent_step=" + str(self.first_divergent_step) +
+                ", maximum_error=" + str(self.maximum_error) + ", steps_per_second=" +
+                str(round(self.steps / max(self.elapsed_time, 1e-9))) + ")")
+
+
+def load_recorded_episode(recording_directory, episode):
+    """
+    Load the actions and physics states of one episode of a TrajectoryRecorder recording
+
+    :param recording_directory: Directory written by TrajectoryRecorder
+    :param episode: Id of the episode
+
+    :return: Actions [steps, 2] and physics states [steps + 1, bodies, 6], the first state being the one at reset
+    """
+
+    entry = next((entry for entry in read_episode_index(recording_directory, include_incomplete=True)
+                  if entry["episode"] == episode), None)
+
+    if entry is None:
+        raise KeyError("Episode " + str(episode) + " is not in the recording")
+
+    if not entry["complete"]:
+        raise ValueError("Episode " + str(episode) + " lost rows while recording and can not be replayed")
+
+    actions = []
+    physics_states = []
+
+    for chunk, first_row, rows in entry["segments"]:
+        with np.load(os.path.join(recording_directory, CHUNK_FILE_NAME.format(chunk))) as chunk_file:
+            actions.append(chunk_file["action"][first_row:first_row + rows])
+            physics_states.append(chunk_file["physics_state"][first_row:first_row + rows])
+
+    # The reset row has no action
+    return np.concatenate(actions)[1:].astype(np.float64), np.concatenate(physics_states)
+
+
+class ReplayEngine:
+    """Re-executes action logs through the same physics path the environment uses, as fast as possible"""
+
+    def __init__(self, environment: MultiAgentEnvironment = None):
+        """
+        Create the replay engine
+
+        :param environment: Single robot headless environment to replay in, a fresh one is created if not given
+        """
+
+        if environment is None:
+            environment = MultiAgentEnvironment(robot_count=1)
+
+        self.environment = environment
+        self.physics_environment = environment.physics_environment
+        self.agent = environment.agents[0]
+
+        self.body_states = BodyStateArray([self.physics_environment])
+        self.states = self.body_states.allocate()
+
+    def replay(self, actions, initial_state, recorded_states=None, checkpoint_interval=1, tolerance=0.0):
+        """
+        Replay a sequence of actions from a starting state
+
+        The step is identical to VirtualEnvironment.step except that no observations or rewards are calculated, as
+        neither of them feeds back into the physics.
+
+        NOTE: pymunk caches contact information between steps, a recording made in the middle of a long run can differ
+        slightly from a replay in a fresh space on steps where the robot touches the field
+
+        :param actions: Actions shaped like [steps, 2]
+        :param initial_state: Body states shaped like [bodies, 6] to start from
+        :param recorded_states: Recorded body states shaped like [steps + 1, bodies, 6] to compare against, the first
+            entry being the initial state. Without them the replay only runs
+        :param checkpoint_interval: Compare against the recording every this many steps
+        :param tolerance: Largest absolute difference in any state value that is still considered identical
+
+        :return: ReplayResult
+        """
+
+        # Start the episode over from the given state
+        self.agent.reset()
+        self.body_states.write(np.asarray(initial_state, dtype=np.float64))
+
+        physics_environment = self.physics_environment
+        agent = self.agent
+        step_length = physics_environment.step_length
+
+        first_divergent_step = None
+        maximum_error = 0.0
+        checked_steps = 0
+
+        start_time = time.perf_counter()
+
+        for step, (left_power, right_power) in enumerate(np.asarray(actions, dtype=np.float64).tolist(), start=1):
+            physics_environment.simulateStep()
+
+            # Once the episode is done the agent receives no more input, same as AgentController.step
+            if agent.current_episode_done:
+                agent.control(left_input=0, right_input=0)
+            else:
+                agent.control(left_input=left_power, right_input=right_power)
+
+            agent.apply_damping(dt=step_length)
+
+            if recorded_states is not None and step % checkpoint_interval == 0:
+                error = float(np.max(np.abs(self.body_states.read(out=self.states) - recorded_states[step])))
+
+                checked_steps += 1
+                maximum_error = max(maximum_error, error)
+
+                if first_divergent_step is None and error > tolerance:
+                    first_divergent_step = step
+
+        return ReplayResult(steps=len(actions),
+                            first_divergent_step=first_divergent_step,
+                            maximum_error=maximum_error,
+                            checked_steps=checked_steps,
+                            elapsed_time=time.perf_counter() - start_time)
+
+    def replay_recorded_episode(self, recording_directory, episode, checkpoint_interval=1, tolerance=0.0):
+        """
+        Replay one episode of a TrajectoryRecorder recording and check it against the recorded states
+
+        :param recording_directory: Directory written by TrajectoryRecorder
+        :param episode: Id of the episode
+        :param checkpoint_interval: Compare against the recording every this many steps
+        :param tolerance: Largest absolute difference in any state value that is still considered identical
+
+        :return: ReplayResult
+        """
+
+        actions, physics_states = load_recorded_episode(recording_directory, episode)
+
+        return self.replay(actions=actions,
+                           initial_state=physics_states[0],
+                           recorded_states=physics_states,
+                           checkpoint_interval=checkpoint_interval,
+                           tolerance=tolerance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay recorded episodes and report where they diverge")
+    parser.add_argument("recording", help="Directory written by TrajectoryRecorder")
+    parser.add_argument("--episode", type=int, action="append", help="Episode id to replay, defaults to every episode")
+    parser.add_argument("--checkpoint-interval", type=int, default=1, help="Compare every this many steps")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Largest difference considered identical")
+    arguments = parser.parse_args()
+
+    episodes = arguments.episode
+    if episodes is None:
+        episodes = [entry["episode"] for entry in read_episode_index(arguments.recording)]
+
+    engine = ReplayEngine()
+
+    for episode_id in episodes:
+        print("Episode " + str(episode_id) + ": " + repr(engine.replay_recorded_episode(
+            recording_directory=arguments.recording,
+            episode=episode_id,
+            checkpoint_interval=arguments.checkpoint_interval,
+            tolerance=arguments.tolerance)))
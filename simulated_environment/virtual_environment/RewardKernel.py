@@ -0,0 +1,278 @@
+"""Vectorized Reward Made Of Registrable Terms, Evaluated For A Whole Batch Of Environments At Once
+
+The default terms reproduce AgentController's reward exactly: the quadratic progress reward with its last_reward
+bookkeeping, +100 for reaching the goal and -100 for an episode ending any other way.
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RewardContext:
+    """Everything a reward term may look at for one step of every environment"""
+
+    def __init__(self, distance, last_distance, starting_distance, done, hit_goal, positions, headings, goal_position):
+        """
+        :param distance: Distance of every robot to the goal after the step [N]
+        :param last_distance: Distance of every robot to the goal before the step [N]
+        :param starting_distance: Distance of every robot to the goal at the start of the episode [N]
+        :param done: Whether or not the episode of every robot has ended [N]
+        :param hit_goal: Whether or not every robot reached the goal [N]
+        :param positions: Position of every robot [N, 2]
+        :param headings: Direction every robot faces, radians counterclockwise from the X axis [N]
+        :param goal_position: Position of the goal [2]
+        """
+
+        self.distance = distance
+        self.last_distance = last_distance
+        self.starting_distance = starting_distance
+        self.done = done
+        self.hit_goal = hit_goal
+        self.positions = positions
+        self.headings = headings
+        self.goal_position = goal_position
+
+
+class RewardTerm:
+    """
+    A single part of the reward, terms that remember something between steps keep it per environment and forget it
+    when the environment is reset
+    """
+
+    def allocate(self, environment_count):
+        """
+        Create the per environment state of the term
+
+        :param environment_count: Number of environments
+
+        :return: None
+        """
+
+    def reset(self, indices):
+        """
+        Forget the state of some environments
+
+        :param indices: Indices or boolean mask of the environments being reset
+
+        :return: None
+        """
+
+    def __call__(self, context: RewardContext):
+        """
+        Calculate the contribution of the term
+
+        :param context: The step being rewarded
+
+        :return: Contribution of every environment [N]
+        """
+
+        raise NotImplementedError
+
+
+class ProgressReward(RewardTerm):
+    """
+    AgentController.calculate_agent_reward: moving closer to the goal earns the quadratic progress reward less whatever
+    was earned the step before, moving away is penalized quadratically plus what was earned the step before
+    """
+
+    def __init__(self, positive_scale=0.25, negative_scale=0.1, relative_tolerance=0.0001):
+        """
+        :param positive_scale: Scale of the positive reward, divided by the starting distance
+        :param negative_scale: Scale of the negative reward
+        :param relative_tolerance: Relative change in distance below which the robot counts as not having moved
+        """
+
+        self.positive_scale = positive_scale
+        self.negative_scale = negative_scale
+        self.relative_tolerance = relative_tolerance
+
+        self.last_reward = None
+
+    def allocate(self, environment_count):
+        self.last_reward = np.zeros(environment_count, dtype=np.float64)
+
+    def reset(self, indices):
+        self.last_reward[indices] = 0
+
+    def __call__(self, context: RewardContext):
+        distance = context.distance
+        last_distance = context.last_distance
+        starting_distance = context.starting_distance
+
+        # Same test as math.isclose(distance, last_distance, rel_tol=relative_tolerance)
+        unchanged = np.abs(distance - last_distance) <= self.relative_tolerance * np.maximum(np.abs(distance),
+                                                                                             np.abs(last_distance))
+        closer = ~unchanged & (distance < last_distance)
+        further = ~unchanged & (distance > last_distance)
+
+        # float_power goes through the same libm pow as math.pow, squaring by multiplication differs in the last bit
+        positive = (self.positive_scale / starting_distance) * np.float_power(distance - starting_distance, 2) - \
+            self.last_reward
+        negative = (-self.negative_scale * np.float_power(distance - last_distance, 2)) + self.last_reward
+
+        reward = np.where(closer, positive, np.where(further, negative, 0.0))
+        self.last_reward = np.where(closer | further, reward, self.last_reward)
+
+        return reward
+
+
+class GoalReward(RewardTerm):
+    """Bonus on the step the goal is reached"""
+
+    def __init__(self, bonus=100.0):
+        """
+        :param bonus: Reward added on the step the goal is reached
+        """
+
+        self.bonus = bonus
+
+    def __call__(self, context: RewardContext):
+        return np.where(context.done & context.hit_goal, self.bonus, 0.0)
+
+
+class CollisionPenalty(RewardTerm):
+    """Penalty for every step an episode is over without the goal reached, which only happens by hitting the field"""
+
+    def __init__(self, penalty=-100.0):
+        """
+        :param penalty: Reward added on every step the episode is over without the goal
+        """
+
+        self.penalty = penalty
+
+    def __call__(self, context: RewardContext):
+        return np.where(context.done & ~context.hit_goal, self.penalty, 0.0)
+
+
+class HeadingAlignmentReward(RewardTerm):
+    """Rewards facing the goal, the cosine of the angle between the heading and the goal direction times a scale"""
+
+    def __init__(self, scale=0.01):
+        """
+        :param scale: Reward for facing straight at the goal
+        """
+
+        self.scale = scale
+
+    def __call__(self, context: RewardContext):
+        offset = context.goal_position - context.positions
+        goal_direction = np.arctan2(offset[:, 1], offset[:, 0])
+
+        return np.where(context.done, 0.0, self.scale * np.cos(goal_direction - context.headings))
+
+
+class TimePenalty(RewardTerm):
+    """Constant penalty for every step an episode keeps running"""
+
+    def __init__(self, penalty=-0.01):
+        """
+        :param penalty: Reward added on every step the episode keeps running
+        """
+
+        self.penalty = penalty
+
+    def __call__(self, context: RewardContext):
+        return np.where(context.done, 0.0, self.penalty)
+
+
+def default_terms():
+    """
+    The terms making up the reward of AgentController
+
+    :return: Ordered dictionary of name to term
+    """
+
+    return OrderedDict([("progress", ProgressReward()),
+                        ("goal", GoalReward()),
+                        ("collision", CollisionPenalty())])
+
+
+class RewardKernel:
+    """Sums the registered reward terms for every environment and keeps each term's share of the last step"""
+
+    def __init__(self, environment_count, terms=None):
+        """
+        Create the kernel
+
+        :param environment_count: Number of environments rewarded at once
+        :param terms: Ordered dictionary of name to RewardTerm, defaults to the reward of AgentController
+        """
+
+        self.environment_count = environment_count
+        self.terms = OrderedDict()
+
+        # Contribution of every term to the last step [N], by name
+        self.contributions = OrderedDict()
+
+        for name, term in (default_terms() if terms is None else terms).items():
+            self.register(name, term)
+
+    def register(self, name, term: RewardTerm):
+        """
+        Add a term to the reward, terms are summed in the order they were registered
+
+        :param name: Name the contribution is reported under
+        :param term: The term
+
+        :return: None
+        """
+
+        if name in self.terms:
+            raise ValueError("A reward term named " + name + " is already registered")
+
+        term.allocate(self.environment_count)
+        self.terms[name] = term
+
+    def unregister(self, name):
+        """
+        Remove a term from the reward
+
+        :param name: Name the term was registered under
+
+        :return: The removed term
+        """
+
+        self.contributions.pop(name, None)
+        return self.terms.pop(name)
+
+    def reset(self, indices=None):
+        """
+        Forget the state every term keeps for some environments
+
+        :param indices: Indices or boolean mask of the environments being reset, defaults to every environment
+
+        :return: None
+        """
+
+        if indices is None:
+            indices = slice(None)
+
+        for term in self.terms.values():
+            term.reset(indices)
+
+    def __call__(self, context: RewardContext):
+        """
+        Calculate the reward of a step
+
+        :param context: The step being rewarded
+
+        :return: Reward of every environment [N]
+        """
+
+        reward = None
+
+        for name, term in self.terms.items():
+            contribution = term(context)
+            self.contributions[name] = contribution
+
+            # Summed in registration order starting from the first term, the same order AgentController adds them in
+            reward = contribution.astype(np.float64, copy=True) if reward is None else reward + contribution
+
+        if reward is None:
+            reward = np.zeros(self.environment_count, dtype=np.float64)
+
+        return reward
@@ -0,0 +1,502 @@
+"""Dynamically Scheduled Rollout Collection Over A Pool Of Worker Processes
+
+Episodes end after very different numbers of steps (an instant wall hit, a quick goal or a long wander), so instead of
+fixing which environments each worker steps, every episode is a task. The tasks live in one central queue held by the
+parent process, split into a deque per worker, and a worker is only sent its next episode once it is idle. A worker
+whose deque is empty takes from the back of the fullest deque. Nothing is ever stolen from a worker process itself,
+an episode that has been sent runs where it was sent. The transitions of finished episodes are cut into fixed size
+batches as they arrive.
+
+A worker process that dies is dropped and the episodes it had been given are queued again for the workers still alive.
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from .MultiAgentEnvironment import MultiAgentEnvironment
+from .PolicyEvaluation import ConstantPolicy, start_episode, load_policy
+
+
+class TransitionBatch:
+    """Fixed number of transitions, each one a single step of an episode"""
+
+    # Order of the arrays of a batch, matching the constructor
+    FIELDS = ("observations", "actions", "rewards", "next_observations", "dones", "truncated", "seeds")
+
+    def __init__(self, observations, actions, rewards, next_observations, dones, truncated, seeds):
+        """
+        :param observations: Observations [B, 13] the actions were taken in
+        :param actions: Actions [B, 2] taken
+        :param rewards: Step rewards [B]
+        :param next_observations: Observations [B, 13] after the step
+        :param dones: Whether or not the step ended the episode [B]
+        :param truncated: Whether or not the episode was cut off by the step limit after the step [B]
+        :param seeds: Seed of the episode every transition belongs to [B]
+        """
+
+        self.observations = observations
+        self.actions = actions
+        self.rewards = rewards
+        self.next_observations = next_observations
+        self.dones = dones
+        self.truncated = truncated
+        self.seeds = seeds
+
+    def __len__(self):
+        return len(self.rewards)
+
+    @staticmethod
+    def concatenate(batches):
+        """
+        Join several batches into one
+
+        :param batches: List of TransitionBatch
+
+        :return: TransitionBatch
+        """
+
+        return TransitionBatch(*(np.concatenate([getattr(batch, field) for batch in batches])
+                                 for field in TransitionBatch.FIELDS))
+
+    def slice(self, start, stop):
+        """
+        Get a range of the transitions
+
+        :param start: First transition
+        :param stop: Transition after the last one
+
+        :return: TransitionBatch viewing the range
+        """
+
+        return TransitionBatch(*(getattr(self, field)[start:stop] for field in TransitionBatch.FIELDS))
+
+
+class WorkerStatistics:
+    """How much work one worker did and how much of the time it was busy"""
+
+    def __init__(self):
+        self.episodes = 0
+        self.steps = 0
+        self.steals = 0
+
+        # Seconds spent simulating, measured in the worker
+        self.busy_time = 0.0
+
+        # Seconds of the collections the worker took part in
+        self.elapsed_time = 0.0
+
+    @property
+    def utilization(self):
+        """Fraction of the collection time the worker was simulating"""
+        return self.busy_time / self.elapsed_time if self.elapsed_time > 0 else 0.0
+
+    def __repr__(self):
+        return "Episodes: {}, Steps: {}, Steals: {}, Utilization: {:.3f}".format(self.episodes, self.steps,
+                                                                                self.steals, self.utilization)
+
+
+def collect_episode(environment: MultiAgentEnvironment, policy, seed, step_limit, start_noise):
+    """
+    Run one episode and keep every transition
+
+    :param environment: Single robot headless environment
+    :param policy: Callable taking an observation and returning (left_power, right_power)
+    :param seed: Seed of the episode, used for the start pose
+    :param step_limit: Maximum number of steps before the episode is cut off
+    :param start_noise: (X, Y, Angle in radians) half ranges of the uniform start pose noise, None to always start in
+        the standard pose
+
+    :return: TransitionBatch holding the whole episode
+    """
+
+    observation = start_episode(environment, seed, start_noise)
+
+    observations = []
+    actions = []
+    rewards = []
+    dones = []
+
+    done = False
+
+    while len(rewards) < step_limit and not done:
+        action = policy(observation[0])
+
+        observations.append(observation[0])
+        actions.append(action)
+
+        observation, reward, episode_dones = environment.step([action])
+
+        done = bool(episode_dones[0])
+        rewards.append(reward[0])
+        dones.append(done)
+
+    length = len(rewards)
+
+    # The next observation of each step is the observation of the following step, plus the last one
+    observations.append(observation[0])
+    observations = np.array(observations, dtype=np.float64).reshape(-1, 13)
+
+    truncated = np.zeros(length, dtype=bool)
+
+    if length > 0 and not done:
+        truncated[-1] = True
+
+    return TransitionBatch(observations=observations[:-1],
+                           actions=np.array(actions, dtype=np.float64).reshape(-1, 2),
+                           rewards=np.array(rewards, dtype=np.float64),
+                           next_observations=observations[1:],
+                           dones=np.array(dones, dtype=bool),
+                           truncated=truncated,
+                           seeds=np.full(length, seed, dtype=np.int64))
+
+
+def worker_main(connection, policy, environment_options):
+    """
+    Run episodes for the scheduler until told to stop
+
+    :param connection: Worker end of the pipe to the scheduler
+    :param policy: The policy to act with
+    :param environment_options: Extra keyword arguments for the MultiAgentEnvironment of the worker
+
+    :return: None
+    """
+
+    environment = MultiAgentEnvironment(robot_count=1, **environment_options)
+
+    while True:
+        try:
+            command = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if command is None:
+            break
+
+        seed, step_limit, start_noise = command
+
+        start_time = time.perf_counter()
+        episode = collect_episode(environment, policy, seed, step_limit, start_noise)
+
+        connection.send((episode, time.perf_counter() - start_time))
+
+    connection.close()
+
+
+class RolloutScheduler:
+    """Hands episodes out to idle worker processes from a central queue and returns their transitions in fixed size
+    batches"""
+
+    def __init__(self, policy=None, worker_count=4, batch_size=1024, step_limit=1000, start_noise=None,
+                 work_stealing=True, prefetch=1, environment_options=None):
+        """
+        Start the worker processes
+
+        :param policy: Callable taking an observation and returning (left_power, right_power), must be picklable.
+            Defaults to a constant (50, 50)
+        :param worker_count: Number of worker processes, 0 runs every episode in this process
+        :param batch_size: Number of transitions in every batch
+        :param step_limit: Maximum number of steps per episode
+        :param start_noise: (X, Y, Angle in radians) half ranges of the uniform start pose noise, None to always start in
+            the standard pose
+        :param work_stealing: Whether idle workers take episodes queued for other workers, without it every worker only
+            runs the episodes it was assigned up front
+        :param prefetch: Number of episodes a worker is sent at a time. Above 1 a worker never waits for its next
+            episode, but a short episode sent behind a long one waits for it even while other workers are idle
+        :param environment_options: Extra keyword arguments for the MultiAgentEnvironment of every worker
+        """
+
+        if policy is None:
+            policy = ConstantPolicy()
+
+        if environment_options is None:
+            environment_options = {}
+
+        self.policy = policy
+        self.worker_count = worker_count
+        self.batch_size = batch_size
+        self.step_limit = step_limit
+        self.start_noise = start_noise
+        self.work_stealing = work_stealing
+        self.prefetch = prefetch
+
+        self.connections = []
+        self.processes = []
+
+        for _ in range(worker_count):
+            scheduler_connection, worker_connection = multiprocessing.Pipe()
+
+            process = multiprocessing.Process(target=worker_main, args=(worker_connection, policy, environment_options),
+                                              daemon=True)
+            process.start()
+            worker_connection.close()
+
+            self.connections.append(scheduler_connection)
+            self.processes.append(process)
+
+        # Whether or not each worker process is still running, a worker that died is never sent anything again
+        self.alive = [True] * worker_count
+
+        # Without workers the episodes run in this process
+        self.environment = MultiAgentEnvironment(robot_count=1, **environment_options) if worker_count == 0 else None
+
+        self.statistics = [WorkerStatistics() for _ in range(max(worker_count, 1))]
+
+    def live_workers(self):
+        """
+        Get the workers whose process is still running
+
+        :return: List of worker indices
+        """
+
+        live_workers = [worker for worker in range(self.worker_count) if self.alive[worker]]
+
+        if not live_workers:
+            raise RuntimeError("Every rollout worker process died")
+
+        return live_workers
+
+    def drop_worker(self, worker, task_queues, in_flight):
+        """
+        Stop using a worker whose process died and queue its episodes again on the workers still alive
+
+        :param worker: Index of the worker
+        :param task_queues: Deque of episode seeds of every worker
+        :param in_flight: Deque of the seeds sent to every worker that have not come back yet
+
+        :return: None
+        """
+
+        self.alive[worker] = False
+
+        orphaned_seeds = list(in_flight[worker]) + list(task_queues[worker])
+        in_flight[worker].clear()
+        task_queues[worker].clear()
+
+        # Only raises once the last worker is gone
+        live_workers = self.live_workers()
+
+        for index, seed in enumerate(orphaned_seeds):
+            task_queues[live_workers[index % len(live_workers)]].append(seed)
+
+    def next_task(self, worker, task_queues):
+        """
+        Take the next episode for a worker, from its own deque or stolen from the back of the fullest one
+
+        :param worker: Index of the worker
+        :param task_queues: Deque of episode seeds of every worker
+
+        :return: Seed of the episode, None if there is nothing left for the worker
+        """
+
+        if task_queues[worker]:
+            return task_queues[worker].popleft()
+
+        if not self.work_stealing:
+            return None
+
+        victim = max(range(len(task_queues)), key=lambda index: len(task_queues[index]))
+
+        if not task_queues[victim]:
+            return None
+
+        self.statistics[worker].steals += 1
+
+        return task_queues[victim].pop()
+
+    def run_episodes(self, seeds):
+        """
+        Run episodes and yield each one as soon as it finishes
+
+        :param seeds: Seeds of the episodes to run
+
+        :return: Generator of TransitionBatch, one per episode, in the order they finish
+        """
+
+        if self.worker_count == 0:
+            statistics = self.statistics[0]
+
+            for seed in seeds:
+                start_time = time.perf_counter()
+                episode = collect_episode(self.environment, self.policy, seed, self.step_limit, self.start_noise)
+                episode_time = time.perf_counter() - start_time
+
+                statistics.episodes += 1
+                statistics.steps += len(episode)
+                statistics.busy_time += episode_time
+                statistics.elapsed_time += episode_time
+
+                yield episode
+
+            return
+
+        live_workers = self.live_workers()
+
+        # Episodes are dealt out round robin up front, stealing evens out whatever that gets wrong
+        task_queues = [deque() for _ in range(self.worker_count)]
+
+        for index, seed in enumerate(seeds):
+            task_queues[live_workers[index % len(live_workers)]].append(seed)
+
+        start_time = time.perf_counter()
+
+        # Seeds of the episodes sent to each worker that have not come back yet, in the order they were sent
+        in_flight = [deque() for _ in range(self.worker_count)]
+        workers_by_connection = {connection: worker for worker, connection in enumerate(self.connections)}
+
+        def dispatch(worker):
+            while self.alive[worker] and len(in_flight[worker]) < self.prefetch:
+                seed = self.next_task(worker, task_queues)
+
+                if seed is None:
+                    break
+
+                in_flight[worker].append(seed)
+
+                try:
+                    self.connections[worker].send((seed, self.step_limit, self.start_noise))
+                except OSError:
+                    self.drop_worker(worker, task_queues, in_flight)
+
+        def dispatch_all():
+            for worker in range(self.worker_count):
+                dispatch(worker)
+
+        try:
+            dispatch_all()
+
+            while any(in_flight):
+                busy_connections = [self.connections[worker] for worker in range(self.worker_count)
+                                    if in_flight[worker]]
+
+                for connection in wait(busy_connections):
+                    worker = workers_by_connection[connection]
+
+                    try:
+                        episode, busy_time = connection.recv()
+                    except (EOFError, OSError):
+                        # The worker died, every worker still alive may have to pick up its episodes
+                        self.drop_worker(worker, task_queues, in_flight)
+                        dispatch_all()
+                        continue
+
+                    in_flight[worker].popleft()
+
+                    statistics = self.statistics[worker]
+                    statistics.episodes += 1
+                    statistics.steps += len(episode)
+                    statistics.busy_time += busy_time
+
+                    # Hand out the next episode before the caller gets to work on this one
+                    dispatch(worker)
+
+                    yield episode
+        finally:
+            # Results of episodes still running when the caller stopped early are thrown away, so the next collection
+            # never receives them
+            for worker, connection in enumerate(self.connections):
+                try:
+                    for _ in range(len(in_flight[worker])):
+                        connection.recv()
+                except (EOFError, OSError):
+                    self.alive[worker] = False
+
+                in_flight[worker].clear()
+
+            elapsed_time = time.perf_counter() - start_time
+
+            for statistics in self.statistics:
+                statistics.elapsed_time += elapsed_time
+
+    def collect(self, episode_count, seed=0, drop_last=False):
+        """
+        Run episodes and return their transitions in fixed size batches
+
+        :param episode_count: Number of episodes to run
+        :param seed: Base seed, episode i uses seed + i
+        :param drop_last: Whether or not the final batch is dropped when there are not enough transitions to fill it
+
+        :return: Generator of TransitionBatch holding batch_size transitions each, the last one may be smaller
+        """
+
+        pending = []
+        pending_count = 0
+
+        for episode in self.run_episodes([seed + episode for episode in range(episode_count)]):
+            pending.append(episode)
+            pending_count += len(episode)
+
+            if pending_count < self.batch_size:
+                continue
+
+            transitions = TransitionBatch.concatenate(pending)
+            full_batches = pending_count // self.batch_size
+
+            for batch in range(full_batches):
+                yield transitions.slice(batch * self.batch_size, (batch + 1) * self.batch_size)
+
+            # Whatever did not fill a batch waits for the next episodes
+            pending = [transitions.slice(full_batches * self.batch_size, pending_count)]
+            pending_count -= full_batches * self.batch_size
+
+        if pending_count > 0 and not drop_last:
+            yield TransitionBatch.concatenate(pending)
+
+    def close(self):
+        """
+        Stop the worker processes
+
+        :return: None
+        """
+
+        for connection, process in zip(self.connections, self.processes):
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+
+            process.join()
+            connection.close()
+
+        self.connections.clear()
+        self.processes.clear()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect rollouts with a dynamically scheduled worker pool")
+    parser.add_argument("--policy", help="Policy to act with as module:attribute, defaults to a constant (50, 50)")
+    parser.add_argument("--episodes", type=int, default=200, help="Number of episodes")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Number of transitions per batch")
+    parser.add_argument("--step-limit", type=int, default=1000, help="Maximum number of steps per episode")
+    parser.add_argument("--start-noise", type=float, nargs=3, metavar=("X", "Y", "ANGLE"), default=(40, 40, 3.14),
+                        help="Half ranges of the random start pose noise (PX, PX, radians)")
+    parser.add_argument("--no-stealing", action="store_true", help="Only run the episodes assigned to each worker")
+    arguments = parser.parse_args()
+
+    scheduler = RolloutScheduler(policy=load_policy(arguments.policy) if arguments.policy else None,
+                                 worker_count=arguments.workers,
+                                 batch_size=arguments.batch_size,
+                                 step_limit=arguments.step_limit,
+                                 start_noise=arguments.start_noise,
+                                 work_stealing=not arguments.no_stealing)
+
+    try:
+        collection_start = time.perf_counter()
+        transition_count = sum(len(batch) for batch in scheduler.collect(arguments.episodes))
+        collection_time = time.perf_counter() - collection_start
+
+        print("{} transitions in {:.2f} s ({:.0f} steps/s)".format(transition_count, collection_time,
+                                                                  transition_count / collection_time))
+
+        for worker_index, worker_statistics in enumerate(scheduler.statistics):
+            print("Worker {}: {}".format(worker_index, worker_statistics))
+    finally:
+        scheduler.close()
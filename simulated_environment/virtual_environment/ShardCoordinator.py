@@ -0,0 +1,794 @@
+"""Rollout Collection Spread Over Many Worker Hosts
+
+The environments are split into shards, each shard being a VectorEnvironment that lives on one worker host and is
+stepped there by the worker's own copy of the policy. The coordinator hands the shards out, collects the transitions of
+every shard in rounds and moves shards away from workers that are slow or stop answering.
+
+Uses the framing of EnvironmentServer.py (16 byte "FRCS" header, then the payload) with these messages:
+
+    Requests:
+        ASSIGN   - uint32 shard id | uint32 environment count, builds the shard on the worker
+        RELEASE  - uint32 shard id, throws the shard away
+        COLLECT  - uint32 steps, steps every shard of the worker that many times
+        CLOSE    - no payload, ends the connection
+
+    Replies (same message type as the request, the environment count of the header is the transition count):
+        ASSIGN   - no payload
+        RELEASE  - no payload
+        COLLECT  - float64 busy seconds | float32 observations [T, 13] | float32 actions [T, 2] | float32 rewards [T] |
+                   float32 next observations [T, 13] | uint8 dones [T] | uint8 truncated [T] | uint32 shard ids [T]
+        ERROR    - utf-8 error message
+
+Everything can run on one machine with local worker processes on loopback:
+
+    python -m simulated_environment.virtual_environment.ShardCoordinator local --workers 3 --rounds 20
+
+Or with a worker on every host and the coordinator pointed at them:
+
+    python -m simulated_environment.virtual_environment.ShardCoordinator worker --host 0.0.0.0 --port 5800
+    python -m simulated_environment.virtual_environment.ShardCoordinator coordinator --workers hostA:5800 hostB:5800
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import multiprocessing
+import socket
+import struct
+import time
+import traceback
+
+import numpy as np
+
+from .EnvironmentServer import create_socket, send_message, receive_header, receive_exactly, ProtocolError, \
+    MESSAGE_CLOSE, MESSAGE_ERROR, MAXIMUM_DISCARDED_PAYLOAD, OBSERVATION_SIZE, ACTION_SIZE, HEADER
+from .PolicyEvaluation import ConstantPolicy, load_policy
+from .RolloutScheduler import TransitionBatch
+from .VectorEnvironment import VectorEnvironment
+
+MESSAGE_ASSIGN = 16
+MESSAGE_RELEASE = 17
+MESSAGE_COLLECT = 18
+
+ASSIGN_PAYLOAD = struct.Struct("<II")
+SHARD_PAYLOAD = struct.Struct("<I")
+BUSY_TIME = struct.Struct("<d")
+
+
+def receive_reply(connection, header_buffer, expected_type):
+    """
+    Receive a reply and raise if the peer reported an error
+
+    :param connection: Socket to read from
+    :param header_buffer: Reusable buffer of HEADER.size bytes
+    :param expected_type: Message type the reply should have
+
+    :return: Count given in the header and the payload
+    """
+
+    message_type, count, payload_size = receive_header(connection, header_buffer)
+
+    payload = bytearray(payload_size)
+    receive_exactly(connection, memoryview(payload))
+
+    if message_type == MESSAGE_ERROR:
+        raise ProtocolError(payload.decode("utf-8"))
+
+    if message_type != expected_type:
+        raise ProtocolError("Expected reply type " + str(expected_type) + " but got " + str(message_type))
+
+    return count, payload
+
+
+def encode_transitions(busy_time, batch: TransitionBatch):
+    """
+    Lay a batch out as the payload of a COLLECT reply
+
+    :param busy_time: Seconds the worker spent collecting it
+    :param batch: The transitions, seeds holding the shard id of every transition
+
+    :return: List of payload pieces
+    """
+
+    return [BUSY_TIME.pack(busy_time),
+            np.ascontiguousarray(batch.observations, dtype=np.float32),
+            np.ascontiguousarray(batch.actions, dtype=np.float32),
+            np.ascontiguousarray(batch.rewards, dtype=np.float32),
+            np.ascontiguousarray(batch.next_observations, dtype=np.float32),
+            np.ascontiguousarray(batch.dones, dtype=np.uint8),
+            np.ascontiguousarray(batch.truncated, dtype=np.uint8),
+            np.ascontiguousarray(batch.seeds, dtype=np.uint32)]
+
+
+def decode_transitions(count, payload):
+    """
+    Read the payload of a COLLECT reply
+
+    :param count: Number of transitions given in the header
+    :param payload: The payload
+
+    :return: Busy seconds of the worker and a TransitionBatch whose seeds hold the shard id of every transition
+    """
+
+    expected_size = BUSY_TIME.size + count * (4 * (2 * OBSERVATION_SIZE + ACTION_SIZE + 1) + 2 + 4)
+
+    if len(payload) != expected_size:
+        raise ProtocolError("Expected a payload of " + str(expected_size) + " bytes but got " + str(len(payload)))
+
+    busy_time, = BUSY_TIME.unpack_from(payload)
+    offset = BUSY_TIME.size
+
+    arrays = []
+
+    for dtype, width in ((np.float32, OBSERVATION_SIZE), (np.float32, ACTION_SIZE), (np.float32, 1),
+                         (np.float32, OBSERVATION_SIZE), (np.uint8, 1), (np.uint8, 1), (np.uint32, 1)):
+        array = np.frombuffer(payload, dtype=dtype, count=count * width, offset=offset)
+        offset += array.nbytes
+        arrays.append(array.reshape(count, width) if width > 1 else array)
+
+    observations, actions, rewards, next_observations, dones, truncated, shard_ids = arrays
+
+    return busy_time, TransitionBatch(observations=observations.astype(np.float64),
+                                      actions=actions.astype(np.float64),
+                                      rewards=rewards.astype(np.float64),
+                                      next_observations=next_observations.astype(np.float64),
+                                      dones=dones.astype(bool),
+                                      truncated=truncated.astype(bool),
+                                      seeds=shard_ids.astype(np.int64))
+
+
+class Shard:
+    """Environments of one shard and where each of their episodes stands"""
+
+    def __init__(self, shard_id, environment_count, environment_options):
+        """
+        Build and reset the environments
+
+        :param shard_id: Id the coordinator gave the shard
+        :param environment_count: Number of environments in the shard
+        :param environment_options: Extra keyword arguments for every MultiAgentEnvironment
+        """
+
+        self.shard_id = shard_id
+        self.environment = VectorEnvironment(environment_count, **environment_options)
+        self.observations = self.environment.reset()
+        self.episode_steps = np.zeros(environment_count, dtype=np.int64)
+
+    def collect(self, policy, steps, step_limit, step_delay=0.0):
+        """
+        Step every environment of the shard with the policy, starting new episodes as old ones end
+
+        :param policy: Callable taking an observation and returning (left_power, right_power)
+        :param steps: Number of steps
+        :param step_limit: Maximum number of steps per episode
+        :param step_delay: Seconds to sleep after every step, only used to simulate a slow host
+
+        :return: TransitionBatch of steps * environment count transitions
+        """
+
+        environment_count = len(self.environment)
+        transitions = []
+
+        for _ in range(steps):
+            actions = np.array([policy(observation) for observation in self.observations],
+                               dtype=np.float64).reshape(environment_count, ACTION_SIZE)
+
+            next_observations, rewards, dones = self.environment.step(actions)
+
+            self.episode_steps += 1
+            truncated = ~dones & (self.episode_steps >= step_limit)
+
+            transitions.append(TransitionBatch(observations=self.observations,
+                                               actions=actions,
+                                               rewards=rewards,
+                                               next_observations=next_observations,
+                                               dones=dones,
+                                               truncated=truncated,
+                                               seeds=np.full(environment_count, self.shard_id, dtype=np.int64)))
+
+            self.observations = next_observations.copy()
+
+            finished = np.flatnonzero(dones | truncated)
+
+            if len(finished) > 0:
+                self.observations[finished] = self.environment.reset(finished)
+                self.episode_steps[finished] = 0
+
+            if step_delay > 0:
+                time.sleep(step_delay)
+
+        return TransitionBatch.concatenate(transitions)
+
+
+class ShardWorker:
+    """Holds the shards the coordinator assigned to this host and collects transitions from them on request"""
+
+    def __init__(self, address, policy=None, step_limit=1000, step_delay=0.0, environment_options=None):
+        """
+        Create the worker and bind it
+
+        :param address: (host, port) tuple to listen on, port 0 picks a free port (see bound_address)
+        :param policy: Callable taking an observation and returning (left_power, right_power), defaults to a constant
+            (50, 50)
+        :param step_limit: Maximum number of steps per episode
+        :param step_delay: Seconds to sleep after every step, only used to simulate a slow host
+        :param environment_options: Extra keyword arguments for every MultiAgentEnvironment
+        """
+
+        self.policy = policy if policy is not None else ConstantPolicy()
+        self.step_limit = step_limit
+        self.step_delay = step_delay
+        self.environment_options = environment_options if environment_options is not None else {}
+
+        self.shards = {}
+        self.header_buffer = bytearray(HEADER.size)
+
+        self.listener = create_socket(address)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(address)
+        self.listener.listen(1)
+
+        self.bound_address = self.listener.getsockname()[:2]
+        self.running = False
+
+    def serve_forever(self):
+        """
+        Accept coordinator connections one after another until close is called
+
+        :return: None
+        """
+
+        self.running = True
+
+        while self.running:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                break
+
+            # Whatever goes wrong with one coordinator only ends its connection, the worker keeps accepting
+            with connection:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+                try:
+                    self.handle_connection(connection)
+                except (ConnectionError, ProtocolError):
+                    pass
+                except Exception:
+                    traceback.print_exc()
+
+            # Shards belong to the coordinator that assigned them
+            self.shards.clear()
+
+    def handle_connection(self, connection):
+        """
+        Answer requests from one coordinator until it disconnects or sends CLOSE
+
+        :param connection: The connected socket
+
+        :return: None
+        """
+
+        while True:
+            try:
+                message_type, _, payload_size = receive_header(connection, self.header_buffer)
+
+                if message_type == MESSAGE_CLOSE:
+                    return
+
+                if message_type == MESSAGE_ASSIGN:
+                    shard_id, environment_count = ASSIGN_PAYLOAD.unpack(self.receive_payload(connection, payload_size,
+                                                                                             ASSIGN_PAYLOAD.size))
+                    self.shards[shard_id] = Shard(shard_id, environment_count, self.environment_options)
+                    send_message(connection, MESSAGE_ASSIGN, 0)
+
+                elif message_type == MESSAGE_RELEASE:
+                    shard_id, = SHARD_PAYLOAD.unpack(self.receive_payload(connection, payload_size, SHARD_PAYLOAD.size))
+                    self.shards.pop(shard_id, None)
+                    send_message(connection, MESSAGE_RELEASE, 0)
+
+                elif message_type == MESSAGE_COLLECT:
+                    steps, = SHARD_PAYLOAD.unpack(self.receive_payload(connection, payload_size, SHARD_PAYLOAD.size))
+
+                    start_time = time.perf_counter()
+                    batches = [shard.collect(self.policy, steps, self.step_limit, self.step_delay)
+                               for shard in self.shards.values()]
+                    busy_time = time.perf_counter() - start_time
+
+                    if batches:
+                        batch = TransitionBatch.concatenate(batches)
+                    else:
+                        batch = TransitionBatch(np.zeros((0, OBSERVATION_SIZE)), np.zeros((0, ACTION_SIZE)),
+                                                np.zeros(0), np.zeros((0, OBSERVATION_SIZE)), np.zeros(0, dtype=bool),
+                                                np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64))
+
+                    send_message(connection, MESSAGE_COLLECT, len(batch), *encode_transitions(busy_time, batch))
+
+                else:
+                    raise ProtocolError("Unknown message type " + str(message_type))
+
+            except ProtocolError as error:
+                send_message(connection, MESSAGE_ERROR, 0, str(error).encode("utf-8"))
+                return
+
+            except (ConnectionError, socket.timeout):
+                raise
+
+            except Exception as error:
+                # Building or stepping a shard failed after the request was read, tell the coordinator and drop it
+                traceback.print_exc()
+                send_message(connection, MESSAGE_ERROR, 0, ("Shard failed: " + repr(error)).encode("utf-8"))
+                return
+
+    @staticmethod
+    def receive_payload(connection, payload_size, expected_size):
+        """
+        Receive the payload of a request that must have a certain size
+
+        :param connection: Socket to read from
+        :param payload_size: Size given in the header
+        :param expected_size: Size the message type requires
+
+        :return: The payload
+        """
+
+        if payload_size != expected_size:
+            # Read the payload so the coordinator can finish sending and receive the error
+            if payload_size <= MAXIMUM_DISCARDED_PAYLOAD:
+                receive_exactly(connection, memoryview(bytearray(payload_size)))
+
+            raise ProtocolError("Expected a payload of " + str(expected_size) + " bytes but got " + str(payload_size))
+
+        payload = bytearray(payload_size)
+        receive_exactly(connection, memoryview(payload))
+
+        return payload
+
+    def close(self):
+        """
+        Stop serving and release the socket
+
+        :return: None
+        """
+
+        self.running = False
+
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.listener.close()
+
+
+def run_local_worker(connection, policy, step_limit, step_delay, environment_options):
+    """
+    Run a ShardWorker on a free loopback port and report the port back
+
+    :param connection: Pipe to send the bound address through
+    :param policy: Callable taking an observation and returning (left_power, right_power)
+    :param step_limit: Maximum number of steps per episode
+    :param step_delay: Seconds to sleep after every step, only used to simulate a slow host
+    :param environment_options: Extra keyword arguments for every MultiAgentEnvironment
+
+    :return: None
+    """
+
+    worker = ShardWorker(("127.0.0.1", 0), policy, step_limit, step_delay, environment_options)
+
+    connection.send(worker.bound_address)
+    connection.close()
+
+    try:
+        worker.serve_forever()
+    finally:
+        worker.close()
+
+
+def start_local_workers(worker_count, policy=None, step_limit=1000, step_delays=None, environment_options=None):
+    """
+    Start worker processes listening on loopback, for running everything on one machine
+
+    :param worker_count: Number of workers
+    :param policy: Callable taking an observation and returning (left_power, right_power), must be picklable
+    :param step_limit: Maximum number of steps per episode
+    :param step_delays: Seconds every worker sleeps after each step, to simulate slow hosts, defaults to no delay
+    :param environment_options: Extra keyword arguments for every MultiAgentEnvironment
+
+    :return: List of worker processes and list of their (host, port) addresses
+    """
+
+    if step_delays is None:
+        step_delays = [0.0] * worker_count
+
+    processes = []
+    addresses = []
+
+    for step_delay in step_delays:
+        parent_connection, child_connection = multiprocessing.Pipe()
+
+        process = multiprocessing.Process(target=run_local_worker, args=(child_connection, policy, step_limit,
+                                                                         step_delay, environment_options),
+                                          daemon=True)
+        process.start()
+        child_connection.close()
+
+        addresses.append(tuple(parent_connection.recv()))
+        parent_connection.close()
+        processes.append(process)
+
+    return processes, addresses
+
+
+class WorkerHost:
+    """The coordinator's view of one worker host"""
+
+    def __init__(self, address):
+        self.address = address
+        self.connection = None
+        self.header_buffer = bytearray(HEADER.size)
+
+        # Ids of the shards the worker holds
+        self.shards = []
+        self.alive = False
+
+        # Totals over every round
+        self.rounds = 0
+        self.transitions = 0
+        self.busy_time = 0.0
+
+        # Seconds the worker spent on the last round, None if it did not take part
+        self.round_time = None
+
+    @property
+    def steps_per_second(self):
+        """Steps the worker simulated per second it was busy"""
+        return self.transitions / self.busy_time if self.busy_time > 0 else 0.0
+
+    def request(self, message_type, *payloads):
+        """
+        Send a request and wait for its reply
+
+        :param message_type: One of the MESSAGE_ constants
+        :param payloads: Payload pieces
+
+        :return: Count given in the reply header and the payload
+        """
+
+        send_message(self.connection, message_type, 0, *payloads)
+        return receive_reply(self.connection, self.header_buffer, message_type)
+
+    def __repr__(self):
+        return "{}:{} Shards: {}, Alive: {}, Steps: {}, Steps/s: {:.0f}".format(
+            self.address[0], self.address[1], len(self.shards), self.alive, self.transitions, self.steps_per_second)
+
+
+class ShardCoordinator:
+    """Spreads shards of environments over worker hosts and gathers their transitions"""
+
+    def __init__(self, worker_addresses, shard_count, shard_size=8, steps_per_round=64, timeout=30.0,
+                 rebalance_tolerance=0.25):
+        """
+        Connect to every worker and hand the shards out round robin
+
+        :param worker_addresses: (host, port) of every worker
+        :param shard_count: Number of shards
+        :param shard_size: Number of environments in every shard
+        :param steps_per_round: Steps every environment takes per round
+        :param timeout: Seconds to wait for a worker before treating it as dead
+        :param rebalance_tolerance: How much longer (as a fraction) the slowest worker may take on a round than the
+            fastest before a shard is moved between them. A moved shard is rebuilt, so its running episodes restart
+        """
+
+        self.shard_size = shard_size
+        self.steps_per_round = steps_per_round
+        self.timeout = timeout
+        self.rebalance_tolerance = rebalance_tolerance
+
+        self.workers = [WorkerHost(tuple(address)) for address in worker_addresses]
+
+        for worker in self.workers:
+            try:
+                worker.connection = create_socket(worker.address)
+                worker.connection.settimeout(timeout)
+                worker.connection.connect(worker.address)
+                worker.alive = True
+            except OSError:
+                self.mark_dead(worker)
+
+        # Shards waiting for a worker, every shard starts out here
+        self.unassigned_shards = list(range(shard_count))
+
+        self.moved_shards = 0
+        self.total_transitions = 0
+        self.elapsed_time = 0.0
+
+        self.assign_unassigned()
+
+    @property
+    def live_workers(self):
+        """Workers still answering"""
+        return [worker for worker in self.workers if worker.alive]
+
+    @property
+    def steps_per_second(self):
+        """Steps collected per second over every round, across every worker"""
+        return self.total_transitions / self.elapsed_time if self.elapsed_time > 0 else 0.0
+
+    def mark_dead(self, worker: WorkerHost):
+        """
+        Stop using a worker and queue its shards for the others
+
+        :param worker: The worker
+
+        :return: None
+        """
+
+        worker.alive = False
+        worker.round_time = None
+
+        if worker.connection is not None:
+            worker.connection.close()
+            worker.connection = None
+
+        self.unassigned_shards.extend(worker.shards)
+        worker.shards = []
+
+    def assign(self, worker: WorkerHost, shard_id):
+        """
+        Build a shard on a worker
+
+        :param worker: The worker
+        :param shard_id: Id of the shard
+
+        :return: Whether or not the worker took the shard
+        """
+
+        try:
+            worker.request(MESSAGE_ASSIGN, ASSIGN_PAYLOAD.pack(shard_id, self.shard_size))
+        except (OSError, ProtocolError):
+            self.mark_dead(worker)
+            return False
+
+        worker.shards.append(shard_id)
+        return True
+
+    def assign_unassigned(self):
+        """
+        Give every queued shard to the live worker holding the fewest shards
+
+        :return: None
+        """
+
+        while self.unassigned_shards:
+            live_workers = self.live_workers
+
+            if not live_workers:
+                raise RuntimeError("Every worker is dead, " + str(len(self.unassigned_shards)) + " shards have no host")
+
+            shard_id = self.unassigned_shards.pop(0)
+            worker = min(live_workers, key=lambda host: len(host.shards))
+
+            if not self.assign(worker, shard_id):
+                self.unassigned_shards.insert(0, shard_id)
+
+    def collect_round(self):
+        """
+        Step every shard steps_per_round times and gather the transitions, then replace dead workers and rebalance
+
+        :return: TransitionBatch, seeds holding the shard id of every transition. Shards of a worker that died during
+            the round are missing from it
+        """
+
+        start_time = time.perf_counter()
+
+        # Every worker starts simulating before any reply is read
+        requested = []
+
+        for worker in self.live_workers:
+            worker.round_time = None
+
+            try:
+                send_message(worker.connection, MESSAGE_COLLECT, 0, SHARD_PAYLOAD.pack(self.steps_per_round))
+                requested.append(worker)
+            except OSError:
+                self.mark_dead(worker)
+
+        batches = []
+
+        for worker in requested:
+            try:
+                count, payload = receive_reply(worker.connection, worker.header_buffer, MESSAGE_COLLECT)
+                busy_time, batch = decode_transitions(count, payload)
+            except (OSError, ProtocolError):
+                self.mark_dead(worker)
+                continue
+
+            worker.rounds += 1
+            worker.transitions += len(batch)
+            worker.busy_time += busy_time
+            worker.round_time = busy_time
+
+            batches.append(batch)
+
+        self.assign_unassigned()
+        self.rebalance()
+
+        batch = TransitionBatch.concatenate(batches) if batches else None
+
+        self.total_transitions += len(batch) if batch is not None else 0
+        self.elapsed_time += time.perf_counter() - start_time
+
+        return batch
+
+    def rebalance(self):
+        """
+        Move one shard from the slowest worker of the last round to the fastest, if that shortens the next round
+
+        :return: Whether or not a shard was moved
+        """
+
+        measured = [worker for worker in self.live_workers if worker.round_time is not None]
+
+        if len(measured) < 2:
+            return False
+
+        slowest = max(measured, key=lambda worker: worker.round_time)
+        fastest = min(measured, key=lambda worker: worker.round_time)
+
+        if len(slowest.shards) < 2 or slowest.round_time <= (1 + self.rebalance_tolerance) * fastest.round_time:
+            return False
+
+        # Time one more shard is expected to add to the fastest worker, a worker without shards is assumed to be as
+        # quick per shard as the slowest one
+        if fastest.shards:
+            shard_time = fastest.round_time / len(fastest.shards)
+        else:
+            shard_time = slowest.round_time / len(slowest.shards)
+
+        if fastest.round_time + shard_time >= slowest.round_time:
+            return False
+
+        shard_id = slowest.shards[-1]
+
+        try:
+            slowest.request(MESSAGE_RELEASE, SHARD_PAYLOAD.pack(shard_id))
+        except (OSError, ProtocolError):
+            self.mark_dead(slowest)
+            self.assign_unassigned()
+            return False
+
+        slowest.shards.remove(shard_id)
+
+        if not self.assign(fastest, shard_id):
+            self.unassigned_shards.append(shard_id)
+            self.assign_unassigned()
+
+        self.moved_shards += 1
+        return True
+
+    def collect(self, round_count):
+        """
+        Run several rounds
+
+        :param round_count: Number of rounds
+
+        :return: Generator of the TransitionBatch of every round
+        """
+
+        for _ in range(round_count):
+            batch = self.collect_round()
+
+            if batch is not None:
+                yield batch
+
+    def close(self):
+        """
+        Tell every live worker the coordinator is done and disconnect
+
+        :return: None
+        """
+
+        for worker in self.live_workers:
+            try:
+                send_message(worker.connection, MESSAGE_CLOSE, 0)
+            except OSError:
+                pass
+
+            worker.connection.close()
+            worker.connection = None
+            worker.alive = False
+
+
+def parse_address(address):
+    """
+    Turn "host:port" into a (host, port) tuple
+
+    :param address: The address
+
+    :return: (host, port)
+    """
+
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def report(coordinator: ShardCoordinator):
+    """Print the aggregate and per worker throughput of a coordinator"""
+
+    print("{} steps in {:.2f} s, {:.0f} steps/s across {} live workers, {} shards moved".format(
+        coordinator.total_transitions, coordinator.elapsed_time, coordinator.steps_per_second,
+        len(coordinator.live_workers), coordinator.moved_shards))
+
+    for worker in coordinator.workers:
+        print("    " + repr(worker))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect rollouts from shards of environments on many hosts")
+    parser.add_argument("--policy", help="Policy to act with as module:attribute, defaults to a constant (50, 50)")
+    parser.add_argument("--step-limit", type=int, default=1000, help="Maximum number of steps per episode")
+    modes = parser.add_subparsers(dest="mode")
+
+    worker_parser = modes.add_parser("worker", help="Serve shards on this host")
+    worker_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    worker_parser.add_argument("--port", type=int, default=5800, help="Port to listen on")
+
+    coordinator_parser = modes.add_parser("coordinator", help="Collect from running workers")
+    coordinator_parser.add_argument("--workers", nargs="+", required=True, help="host:port of every worker")
+
+    local_parser = modes.add_parser("local", help="Start workers on loopback and collect from them")
+    local_parser.add_argument("--workers", type=int, default=3, help="Number of local workers")
+    local_parser.add_argument("--slow-worker-delay", type=float, default=0.0,
+                              help="Seconds the first worker sleeps after each step, to see shards rebalanced")
+    local_parser.add_argument("--kill-after", type=int,
+                              help="Round after which the last worker is killed, to see its shards reassigned")
+
+    for mode_parser in (coordinator_parser, local_parser):
+        mode_parser.add_argument("--shards", type=int, default=8, help="Number of shards")
+        mode_parser.add_argument("--shard-size", type=int, default=8, help="Environments per shard")
+        mode_parser.add_argument("--steps-per-round", type=int, default=64, help="Steps per environment per round")
+        mode_parser.add_argument("--rounds", type=int, default=20, help="Number of rounds")
+
+    arguments = parser.parse_args()
+    policy = load_policy(arguments.policy) if arguments.policy else ConstantPolicy()
+
+    if arguments.mode == "worker":
+        shard_worker = ShardWorker((arguments.host, arguments.port), policy, arguments.step_limit)
+        print("Serving shards on {}:{}".format(*shard_worker.bound_address))
+
+        try:
+            shard_worker.serve_forever()
+        finally:
+            shard_worker.close()
+
+    elif arguments.mode in ("coordinator", "local"):
+        local_processes = []
+
+        if arguments.mode == "local":
+            local_processes, worker_addresses = start_local_workers(
+                arguments.workers, policy, arguments.step_limit,
+                [arguments.slow_worker_delay] + [0.0] * (arguments.workers - 1))
+        else:
+            worker_addresses = [parse_address(address) for address in arguments.workers]
+
+        shard_coordinator = ShardCoordinator(worker_addresses, arguments.shards, arguments.shard_size,
+                                             arguments.steps_per_round)
+
+        try:
+            for round_index, _ in enumerate(shard_coordinator.collect(arguments.rounds)):
+                if arguments.mode == "local" and arguments.kill_after == round_index + 1:
+                    local_processes[-1].kill()
+
+            report(shard_coordinator)
+        finally:
+            shard_coordinator.close()
+
+            for local_process in local_processes:
+                local_process.join(timeout=5)
+
+                if local_process.is_alive():
+                    local_process.kill()
+    else:
+        parser.print_help()
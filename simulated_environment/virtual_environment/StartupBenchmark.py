@@ -0,0 +1,126 @@
+"""Measures Import To First Step Time Of The Headless Environments In Fresh Interpreters
+
+Worker processes pay the whole import and construction cost every time they are spawned, so this is tracked as a metric:
+
+    python -m simulated_environment.virtual_environment.StartupBenchmark --repeats 5 --output startup.jsonl
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Directory that has to be on the path for the simulated_environment package to be importable
+PACKAGE_PARENT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Code run in every fresh interpreter, each target fills in what to import, build and step
+MEASUREMENT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+environment = {construction}
+constructed = time.perf_counter()
+environment.step({action})
+stepped = time.perf_counter()
+print(json.dumps({{"import_time": imported - start,
+                   "construction_time": constructed - imported,
+                   "first_step_time": stepped - constructed,
+                   "arcade_loaded": "arcade" in sys.modules}}))
+"""
+
+# What each target imports, how it builds the environment and the action of its first step
+TARGETS = {
+    "multi_agent": {
+        "imports": "from simulated_environment.virtual_environment.MultiAgentEnvironment import MultiAgentEnvironment",
+        "construction": "MultiAgentEnvironment(robot_count=1)",
+        "action": "[(50, 50)]",
+    },
+    "batched": {
+        "imports": "import numpy as np\n"
+                   "from simulated_environment.virtual_environment.BatchedEnvironment import BatchedEnvironment",
+        "construction": "BatchedEnvironment(environment_count=1)",
+        "action": "np.full((1, 2), 50.0)",
+    },
+}
+
+
+def measure_startup(target="multi_agent"):
+    """
+    Start a fresh interpreter, import the environment, build it and take one step
+
+    :param target: Name of the entry in TARGETS to measure
+
+    :return: Dictionary of import_time, construction_time, first_step_time and process_time (the whole process
+        including interpreter startup) in seconds, plus whether arcade ended up being imported
+    """
+
+    script = MEASUREMENT_SCRIPT.format(**TARGETS[target])
+
+    environment_variables = dict(os.environ)
+    environment_variables["PYTHONPATH"] = os.pathsep.join(
+        [PACKAGE_PARENT] + ([environment_variables["PYTHONPATH"]] if environment_variables.get("PYTHONPATH") else []))
+
+    start_time = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", script], env=environment_variables, stdout=subprocess.PIPE,
+                               check=True, universal_newlines=True)
+    process_time = time.perf_counter() - start_time
+
+    # The result is the last line, anything printed while building the environment comes before it
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_time"] = process_time
+
+    return result
+
+
+def benchmark_startup(target="multi_agent", repeats=5):
+    """
+    Measure startup several times and summarize it
+
+    :param target: Name of the entry in TARGETS to measure
+    :param repeats: Number of fresh interpreters to start
+
+    :return: Dictionary with the median of every timing, the fastest import to first step time and whether arcade was
+        imported in any of the runs
+    """
+
+    runs = [measure_startup(target) for _ in range(repeats)]
+    timings = ("import_time", "construction_time", "first_step_time", "process_time")
+
+    summary = {"target": target, "repeats": repeats, "timestamp": time.time()}
+    summary.update({name: statistics.median(run[name] for run in runs) for name in timings})
+
+    summary["import_to_first_step_time"] = summary["import_time"] + summary["construction_time"] + \
+        summary["first_step_time"]
+    summary["fastest_import_to_first_step_time"] = min(run["import_time"] + run["construction_time"] +
+                                                       run["first_step_time"] for run in runs)
+    summary["arcade_loaded"] = any(run["arcade_loaded"] for run in runs)
+
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure import to first step time of the headless environments")
+    parser.add_argument("--target", choices=sorted(TARGETS), action="append", help="Environment to measure, "
+                                                                                     "defaults to every one")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of fresh interpreters per target")
+    parser.add_argument("--output", help="JSON lines file to append the results to, for tracking over time")
+    arguments = parser.parse_args()
+
+    for benchmark_target in arguments.target or sorted(TARGETS):
+        startup = benchmark_startup(benchmark_target, arguments.repeats)
+
+        print("{:<12} import {:7.1f} ms  construct {:6.1f} ms  first step {:6.2f} ms  process {:7.1f} ms  "
+              "arcade loaded: {}".format(benchmark_target, startup["import_time"] * 1e3,
+                                         startup["construction_time"] * 1e3, startup["first_step_time"] * 1e3,
+                                         startup["process_time"] * 1e3, startup["arcade_loaded"]))
+
+        if arguments.output:
+            with open(arguments.output, "a") as output_file:
+                output_file.write(json.dumps(startup) + "\n")
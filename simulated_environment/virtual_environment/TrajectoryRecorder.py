@@ -0,0 +1,410 @@
+"""Streams Every Step Of Every Episode Into Chunked, Compressed, Append Only Files
+
+Layout of a recording directory:
+    chunk_000000.npz, chunk_000001.npz, ...  Compressed columns, every chunk holds whole episode segments:
+        episode          int64   [rows]           Id of the episode the row belongs to
+        step             int64   [rows]           0 for the row written at reset, then 1, 2, ...
+        observation      float32 [rows, 13]       Observation after the step (or at reset)
+        action           float64 [rows, 2]        Action taken (full precision so it can be replayed), NaN for the reset row
+        reward           float32 [rows]           Step reward, 0 for the reset row
+        done             bool    [rows]           Episode completion status after the step
+        physics_state    float64 [rows, bodies, 6] Body states as produced by BodyStateArray.read
+    A recorder given an ObservationCodec stores the observation column as its 16 bit codes instead, together with the
+    ranges needed to decode them (read_observations decodes either layout):
+        observation_code uint16  [rows, 13]       Quantized observation, see ObservationCodec.py for the error bounds
+        observation_low  float64 [13]             Range the codes were quantized with
+        observation_high float64 [13]
+    episodes.jsonl  One JSON line per episode, appended once every row of the episode is on disk:
+        {"episode", "stream", "length", "return", "finished", "complete", "segments": [[chunk, first_row, rows], ...]}
+"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from ..physics_engine.BodyStateArray import BodyStateArray
+from .ObservationCodec import ObservationCodec, QuantizedColumns
+
+CHUNK_FILE_NAME = "chunk_{:06d}.npz"
+INDEX_FILE_NAME = "episodes.jsonl"
+
+# Every action is (left_power, right_power)
+ACTION_SHAPE = (2,)
+
+
+def read_observations(chunk_file):
+    """
+    Read the observation column of a chunk, decoding it if it was quantized
+
+    :param chunk_file: The loaded chunk
+
+    :return: float32 observations [rows, 13]
+    """
+
+    if "observation_code" in chunk_file:
+        columns = QuantizedColumns(chunk_file["observation_low"], chunk_file["observation_high"])
+        return columns.decode(chunk_file["observation_code"], dtype=np.float32)
+
+    return chunk_file["observation"]
+
+
+class EpisodeBuffer:
+    """Rows of one episode that have not been placed into a chunk yet"""
+
+    def __init__(self, episode, stream):
+        self.episode = episode
+        self.stream = stream
+        self.rows = []
+        self.length = 0
+        self.total_reward = 0.0
+        self.segments = []
+
+
+class TrajectoryRecorder:
+    """Collects steps on the simulation thread and writes them on a background thread"""
+
+    def __init__(self, directory, chunk_size=4096, queue_size=1024, codec: ObservationCodec = None):
+        """
+        Create the recording directory and start the writer thread
+
+        :param directory: Directory to write the chunks and the episode index into, appending to any existing recording
+        :param chunk_size: Number of rows after which a chunk is written to disk
+        :param queue_size: Maximum number of steps waiting to be written. When the writer falls this far behind new steps
+            are dropped (and their episode marked incomplete) instead of stalling the simulation
+        :param codec: ObservationCodec to store the observations quantized with, None stores them as float32. Actions
+            always keep full precision so episodes can be replayed
+        """
+
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.codec = codec
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Continue numbering after whatever is already in the directory so nothing is ever overwritten
+        self.next_chunk = self.count_existing_chunks()
+        self.next_episode = self.count_existing_episodes()
+
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        # Steps that were dropped because the writer could not keep up
+        self.dropped_steps = 0
+
+        # Episode currently open on each stream, only touched by the simulation thread
+        self.stream_episodes = {}
+
+        # Episodes that lost at least one row, filled by the simulation thread and read by the writer
+        self.incomplete_episodes = set()
+
+        # Exception that stopped the writer thread, raised again on the simulation thread by put and close
+        self.writer_error = None
+
+        self.writer = threading.Thread(target=self.write_loop, name="TrajectoryRecorder", daemon=True)
+        self.writer.start()
+
+    def count_existing_chunks(self):
+        """Number of chunk files already in the directory"""
+
+        chunk = 0
+
+        while os.path.exists(os.path.join(self.directory, CHUNK_FILE_NAME.format(chunk))):
+            chunk += 1
+
+        return chunk
+
+    def count_existing_episodes(self):
+        """Next free episode id of the recording already in the directory"""
+
+        index_path = os.path.join(self.directory, INDEX_FILE_NAME)
+
+        if not os.path.exists(index_path):
+            return 0
+
+        with open(index_path) as index_file:
+            return max((json.loads(line)["episode"] + 1 for line in index_file if line.strip()), default=0)
+
+    def begin_episode(self, observation, physics_state, stream=0):
+        """
+        Start a new episode, ending any episode still open on the same stream
+
+        :param observation: Observation at reset
+        :param physics_state: Body states at reset
+        :param stream: Id of the environment the episode runs in, lets one recorder follow many environments
+
+        :return: Id of the new episode
+        """
+
+        episode = self.next_episode
+        self.next_episode += 1
+
+        self.stream_episodes[stream] = episode
+
+        self.put(("begin", episode, stream, 0, observation, None, 0.0, False, physics_state))
+
+        return episode
+
+    def record_step(self, step, observation, action, reward, done, physics_state, stream=0):
+        """
+        Record one step of the episode open on a stream, steps taken after the episode is done are ignored
+
+        :param step: Step number within the episode, starting at 1
+        :param observation: Observation after the step
+        :param action: Action taken
+        :param reward: Step reward
+        :param done: Episode completion status
+        :param physics_state: Body states after the step
+        :param stream: Id of the environment the step was taken in
+
+        :return: None
+        """
+
+        episode = self.stream_episodes.get(stream)
+
+        if episode is None:
+            return
+
+        # The environment keeps stepping while it waits to be reset, those steps are not part of the episode
+        if done:
+            del self.stream_episodes[stream]
+
+        self.put(("step", episode, stream, step, observation, action, reward, done, physics_state))
+
+    def put(self, record):
+        """
+        Queue a record without ever blocking the simulation
+
+        :param record: The record
+
+        :return: None
+        """
+
+        self.raise_writer_error()
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_steps += 1
+            self.incomplete_episodes.add(record[1])
+
+    def close(self):
+        """
+        Write everything still queued, including unfinished episodes, and stop the writer thread. Raises a RuntimeError
+        caused by the exception that stopped the writer thread if it failed
+
+        :return: None
+        """
+
+        # A writer that died never empties the queue again, so never wait on it for long
+        while self.writer.is_alive():
+            try:
+                self.queue.put(("close",), timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+        self.writer.join()
+        self.raise_writer_error()
+
+    def raise_writer_error(self):
+        """
+        Raise the exception that stopped the writer thread, if it stopped on one
+
+        :return: None
+        """
+
+        if self.writer_error is not None:
+            raise RuntimeError("Writing the trajectory failed, nothing after the last written chunk was recorded") \
+                from self.writer_error
+
+    def write_loop(self):
+        """
+        Body of the writer thread, keeps the exception that stops it for the simulation thread
+
+        :return: None
+        """
+
+        try:
+            self.write_records()
+        except Exception as error:
+            self.writer_error = error
+
+    def write_records(self):
+        """
+        Write queued records until the recorder is closed
+
+        :return: None
+        """
+
+        open_episodes = {}
+        chunk_rows = []
+        finished_episodes = []
+
+        while True:
+            record = self.queue.get()
+            kind = record[0]
+
+            if kind == "close":
+                for episode_buffer in open_episodes.values():
+                    self.place_rows(episode_buffer, chunk_rows, finished_episodes, finished=False)
+
+                self.write_chunk(chunk_rows, finished_episodes)
+                return
+
+            _, episode, stream, step, observation, action, reward, done, physics_state = record
+
+            if kind == "begin" or stream not in open_episodes or open_episodes[stream].episode != episode:
+                # A new episode on a stream ends the previous one even if it never reported done
+                if stream in open_episodes:
+                    self.place_rows(open_episodes.pop(stream), chunk_rows, finished_episodes, finished=False)
+
+                open_episodes[stream] = EpisodeBuffer(episode=episode, stream=stream)
+
+
+            episode_buffer = open_episodes[stream]
+            episode_buffer.rows.append((episode, step, observation, action, reward, done, physics_state))
+            episode_buffer.length += 1 if kind == "step" else 0
+            episode_buffer.total_reward += reward
+
+            if done:
+                self.place_rows(open_episodes.pop(stream), chunk_rows, finished_episodes, finished=True)
+
+            # Very long episodes are split over several chunks
+            elif len(episode_buffer.rows) >= self.chunk_size:
+                self.place_rows(episode_buffer, chunk_rows, finished_episodes, finished=None)
+
+            if len(chunk_rows) >= self.chunk_size:
+                self.write_chunk(chunk_rows, finished_episodes)
+
+    def place_rows(self, episode_buffer, chunk_rows, finished_episodes, finished):
+        """
+        Move the buffered rows of an episode into the current chunk
+
+        :param episode_buffer: The episode
+        :param chunk_rows: Rows of the chunk currently being filled
+        :param finished_episodes: Episodes whose index entry is written with the current chunk
+        :param finished: Whether the episode ended with done, None if the episode is still running
+
+        :return: None
+        """
+
+        if episode_buffer.rows:
+            episode_buffer.segments.append([self.next_chunk, len(chunk_rows), len(episode_buffer.rows)])
+            chunk_rows.extend(episode_buffer.rows)
+            episode_buffer.rows = []
+
+        if finished is not None:
+            finished_episodes.append({"episode": episode_buffer.episode,
+                                      "stream": episode_buffer.stream,
+                                      "length": episode_buffer.length,
+                                      "return": episode_buffer.total_reward,
+                                      "finished": finished,
+                                      "complete": episode_buffer.episode not in self.incomplete_episodes,
+                                      "segments": episode_buffer.segments})
+
+    def write_chunk(self, chunk_rows, finished_episodes):
+        """
+        Compress the current chunk to disk and then append the index entries of the episodes it completes
+
+        :param chunk_rows: Rows of the chunk, cleared afterwards
+        :param finished_episodes: Index entries to append, cleared afterwards
+
+        :return: None
+        """
+
+        if chunk_rows:
+            episodes, steps, observations, actions, rewards, dones, physics_states = zip(*chunk_rows)
+
+            # A chunk may hold nothing but reset rows, so their placeholder can not be shaped after the other actions
+            actions = [np.full(ACTION_SHAPE, np.nan) if action is None else action for action in actions]
+
+            chunk_path = os.path.join(self.directory, CHUNK_FILE_NAME.format(self.next_chunk))
+
+            if self.codec is None:
+                observation_columns = {"observation": np.array(observations, dtype=np.float32)}
+            else:
+                observation_columns = {"observation_code": self.codec.encode_observations(observations),
+                                       "observation_low": self.codec.observations.low,
+                                       "observation_high": self.codec.observations.high}
+
+            # Write to a temporary name first so a crash never leaves a half written chunk behind
+            with open(chunk_path + ".partial", "wb") as chunk_file:
+                np.savez_compressed(chunk_file,
+                                    episode=np.array(episodes, dtype=np.int64),
+                                    step=np.array(steps, dtype=np.int64),
+                                    action=np.array(actions, dtype=np.float64),
+                                    reward=np.array(rewards, dtype=np.float32),
+                                    done=np.array(dones, dtype=bool),
+                                    physics_state=np.array(physics_states, dtype=np.float64),
+                                    **observation_columns)
+
+            os.replace(chunk_path + ".partial", chunk_path)
+
+            self.next_chunk += 1
+            chunk_rows.clear()
+
+        if finished_episodes:
+            with open(os.path.join(self.directory, INDEX_FILE_NAME), "a") as index_file:
+                for entry in finished_episodes:
+                    index_file.write(json.dumps(entry) + "\n")
+
+            finished_episodes.clear()
+
+
+class RecordingEnvironment:
+    """Wraps VirtualEnvironment.step and reset and records every step"""
+
+    def __init__(self, environment, recorder: TrajectoryRecorder):
+        """
+        Wrap an environment
+
+        :param environment: Single robot environment such as VirtualEnvironment
+        :param recorder: Recorder to stream the steps into
+        """
+
+        self.environment = environment
+        self.recorder = recorder
+
+        self.body_states = BodyStateArray([environment.physics_environment])
+        self.current_step = 0
+
+    def reset(self):
+        """
+        Reset the environment and start a new episode in the recording
+
+        :return: Observation at reset
+        """
+
+        observation = self.environment.reset()
+
+        self.current_step = 0
+        self.recorder.begin_episode(observation=np.array(observation, dtype=np.float64),
+                                    physics_state=self.body_states.read())
+
+        return observation
+
+    def step(self, action):
+        """
+        Step the environment and record the step
+
+        :param action: The action in the form of tuple shaped like (left_power, right_power)
+
+        :return: Observation, Step Reward, Episode Completion Status
+        """
+
+        observation, reward, done = self.environment.step(action)
+
+        self.current_step += 1
+        self.recorder.record_step(step=self.current_step,
+                                  observation=np.array(observation, dtype=np.float64),
+                                  action=np.array(action, dtype=np.float64),
+                                  reward=reward,
+                                  done=done,
+                                  physics_state=self.body_states.read())
+
+        return observation, reward, done
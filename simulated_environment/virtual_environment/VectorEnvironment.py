@@ -0,0 +1,73 @@
+"""Many Independent Headless Environments Stepped Together As One Batch"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import numpy as np
+
+from .MultiAgentEnvironment import MultiAgentEnvironment
+
+
+class VectorEnvironment:
+    """Holds one single robot environment per slot, each with its own physics space"""
+
+    def __init__(self, environment_count, **environment_options):
+        """
+        Create every environment
+
+        :param environment_count: How many independent environments to create
+        :param environment_options: Extra keyword arguments handed to every MultiAgentEnvironment
+        """
+
+        self.environment_count = environment_count
+        self.environments = [MultiAgentEnvironment(robot_count=1, **environment_options)
+                             for _ in range(environment_count)]
+
+    def __len__(self):
+        return self.environment_count
+
+    @property
+    def physics_environments(self):
+        """Physics environment of every slot, in order"""
+        return [environment.physics_environment for environment in self.environments]
+
+    @property
+    def agents(self):
+        """Agent of every slot, in order"""
+        return [environment.agents[0] for environment in self.environments]
+
+    def step(self, actions):
+        """
+        Step every environment forward by one simulation step
+
+        :param actions: Array shaped like [N, 2] holding (left_power, right_power) for every environment
+
+        :return: Observations [N, 13], Step Rewards [N], Episode Completion Statuses [N]
+        """
+
+        observations = np.empty((self.environment_count, 13), dtype=np.float64)
+        rewards = np.empty(self.environment_count, dtype=np.float64)
+        dones = np.empty(self.environment_count, dtype=bool)
+
+        for index, environment in enumerate(self.environments):
+            obs, reward, done = environment.step([actions[index]])
+
+            observations[index] = obs[0]
+            rewards[index] = reward[0]
+            dones[index] = done[0]
+
+        return observations, rewards, dones
+
+    def reset(self, indices=None):
+        """
+        Reset some or all of the environments
+
+        :param indices: Indices of the environments to reset, defaults to every environment
+
+        :return: Observations [len(indices), 13] at reset
+        """
+
+        if indices is None:
+            indices = range(self.environment_count)
+
+        return np.array([self.environments[index].reset()[0] for index in indices], dtype=np.float64).reshape(-1, 13)
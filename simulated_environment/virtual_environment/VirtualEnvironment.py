@@ -0,0 +1,70 @@
+"""Highest Level Interface For Interaction Between The Arcade Environment And The Neural Net."""
+
+import os
+import threading
+from time import sleep
+
+from .ArcadeManager import VirtualEnvironment
+from .TrajectoryRecorder import TrajectoryRecorder, RecordingEnvironment
+from .PacingScheduler import PacingScheduler, LATE_TICK_SKIP
+
+# Every episode run from this script is recorded here for debugging and offline training
+RECORDING_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Recordings")
+
+env: VirtualEnvironment = None
+
+ENVIRONMENT_RUNNING = False
+
+def createEnv():
+    """
+    Create a new arcade environment and set the global variable env to that value
+
+    :param env: Created environment
+
+    :return: None
+    """
+    global env
+    env = VirtualEnvironment()
+
+    global ENVIRONMENT_RUNNING
+    ENVIRONMENT_RUNNING = True
+
+    env.startEnvironment()
+
+if __name__ == '__main__':
+
+    # Create a thread to run the arcade environment in
+    env_thread = threading.Thread(target=createEnv)
+    env_thread.start()
+
+    print("Booting Environment Please Wait...")
+
+    # Wait for environment to start before doing anything
+    while not ENVIRONMENT_RUNNING:
+        sleep(0.01)
+
+    # Record every step instead of printing it
+    recorder = TrajectoryRecorder(directory=RECORDING_DIRECTORY)
+    recorded_env = RecordingEnvironment(environment=env, recorder=recorder)
+
+    # Reset player
+    obs = recorded_env.reset()
+
+    print("Environment Booted!")
+
+    # Step on a fixed real time grid, a late step drops the ticks it missed instead of rushing to make them up
+    scheduler = PacingScheduler(period=env.physics_environment.step_length, late_tick_policy=LATE_TICK_SKIP)
+
+    # All Neural Network prediction done after this point
+
+    try:
+        while True:
+            scheduler.wait()
+            obs, reward, done = recorded_env.step(action=(50,50))
+
+            if done:
+                recorded_env.reset()
+    finally:
+        recorder.close()
+        print(scheduler.statistics)
+
@@ -0,0 +1,4 @@
+"""Environments, Agents And Tooling Built On The Physics Engine, arcade Is Only Loaded When Rendering"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
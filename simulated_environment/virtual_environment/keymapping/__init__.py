@@ -0,0 +1,4 @@
+"""Keyboard Codes Used By The Rendered Environment"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
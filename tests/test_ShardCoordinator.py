@@ -0,0 +1,87 @@
+"""Loopback Test Of The Sharded Rollout Coordinator With Local Worker Processes"""
+
+__author__ = "Will Richards"
+__copyright__ = "Copyright 2020, AEMBOT"
+
+import unittest
+from collections import Counter
+
+from simulated_environment.virtual_environment.ShardCoordinator import ShardCoordinator, start_local_workers
+
+SHARD_COUNT = 6
+STEPS_PER_ROUND = 5
+
+# Seconds the slow worker sleeps after every step, far longer than a step takes on the fast workers
+SLOW_STEP_DELAY = 0.02
+
+
+class ShardCoordinatorTest(unittest.TestCase):
+
+    def setUp(self):
+        # The first worker is slow, the last one is killed during the test
+        self.processes, addresses = start_local_workers(3, step_delays=[SLOW_STEP_DELAY, 0.0, 0.0])
+        self.coordinator = ShardCoordinator(addresses, shard_count=SHARD_COUNT, shard_size=1,
+                                            steps_per_round=STEPS_PER_ROUND, timeout=30.0, rebalance_tolerance=0.25)
+
+    def tearDown(self):
+        self.coordinator.close()
+
+        for process in self.processes:
+            process.kill()
+            process.join()
+
+    def assert_every_shard_assigned_once(self):
+        assigned = [shard for worker in self.coordinator.live_workers for shard in worker.shards]
+        self.assertEqual(sorted(assigned), list(range(SHARD_COUNT)))
+        self.assertEqual(self.coordinator.unassigned_shards, [])
+
+    def assert_complete_round(self, batch):
+        # Every shard took every step exactly once
+        self.assertEqual(len(batch), SHARD_COUNT * STEPS_PER_ROUND)
+        self.assertEqual(Counter(batch.seeds.tolist()), {shard: STEPS_PER_ROUND for shard in range(SHARD_COUNT)})
+
+    def test_rebalances_reassigns_and_counts(self):
+        slow_worker, _, doomed_worker = self.coordinator.workers
+        collected = 0
+
+        # Shards start out spread evenly
+        self.assertEqual([len(worker.shards) for worker in self.coordinator.workers], [2, 2, 2])
+        self.assert_every_shard_assigned_once()
+
+        # The slow worker sheds shards until it holds a single one
+        for _ in range(3):
+            batch = self.coordinator.collect_round()
+            self.assert_complete_round(batch)
+            collected += len(batch)
+
+        self.assertGreaterEqual(self.coordinator.moved_shards, 1)
+        self.assertEqual(len(slow_worker.shards), 1)
+        self.assert_every_shard_assigned_once()
+
+        # A killed worker loses its part of the round, then its shards go to the workers still alive
+        lost_shards = list(doomed_worker.shards)
+        self.processes[2].kill()
+        self.processes[2].join()
+
+        batch = self.coordinator.collect_round()
+        collected += len(batch)
+
+        self.assertFalse(doomed_worker.alive)
+        self.assertEqual(doomed_worker.shards, [])
+        self.assertEqual(len(batch), (SHARD_COUNT - len(lost_shards)) * STEPS_PER_ROUND)
+        self.assertFalse(set(batch.seeds.tolist()) & set(lost_shards))
+        self.assert_every_shard_assigned_once()
+
+        # Every shard is collected again from the next round on
+        batch = self.coordinator.collect_round()
+        self.assert_complete_round(batch)
+        collected += len(batch)
+
+        # Totals agree with the batches handed out and with what the workers report
+        self.assertEqual(self.coordinator.total_transitions, collected)
+        self.assertEqual(sum(worker.transitions for worker in self.coordinator.workers), collected)
+        self.assertGreater(self.coordinator.steps_per_second, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()